@@ -0,0 +1,315 @@
+# DNN_TorchFM_TTower\models\catalog.py
+"""
+进程级电影目录快照 (catalog snapshot)
+
+把 movies 表中召回 / 精排需要的列一次性读进 NumPy 数组：
+    movie_id · language code · vote_average · vote_count · popularity · first genre · release year
+并附带 language / genre / year 倒排索引 (models/movie_index.py)。
+请求路径只读快照，不再整表扫描 movies。
+
+刷新策略：
+  • 后台线程每 CATALOG_CHECK_INTERVAL 秒检查一次 MAX(id) / COUNT(*)
+  • 仅有新插入 → 增量追加；其它变化或快照超过 CATALOG_TTL 秒 → 全量重载
+  • 新快照构建完成后整体替换引用 (原子 swap)，读者永远看到完整的一版
+
+用法：
+    from DNN_TorchFM_TTower.models.catalog import get_catalog
+    cat = get_catalog()
+    ids = cat.ids_for_languages({"en", "fr"})
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from DNN_TorchFM_TTower.models.config import CATALOG_TTL, CATALOG_CHECK_INTERVAL
+from DNN_TorchFM_TTower.models.db import get_pool, fetchone_dict
+from DNN_TorchFM_TTower.models.movie_index import MovieIndex
+
+
+# --------------------------------------------------------------------------- #
+#                               快照本体                                       #
+# --------------------------------------------------------------------------- #
+class CatalogSnapshot:
+    """
+    只读快照；所有数组按 movie_id 升序对齐，第 i 行即第 i 部电影
+    """
+
+    def __init__(self,
+                 movie_ids: np.ndarray,
+                 lang_codes: np.ndarray,
+                 languages: list[str],
+                 vote_average: np.ndarray,
+                 vote_count: np.ndarray,
+                 popularity: np.ndarray,
+                 genre_id: np.ndarray,
+                 release_year: np.ndarray,
+                 index: MovieIndex,
+                 version: int = 0):
+        self.movie_ids = movie_ids          # int64
+        self.lang_codes = lang_codes        # int16, -1 = 无 original_language
+        self.languages = languages          # code -> 语言字符串
+        self.vote_average = vote_average    # float32
+        self.vote_count = vote_count        # int32
+        self.popularity = popularity        # float32
+        self.genre_id = genre_id            # int32, 0 = 无 genre
+        self.release_year = release_year    # int32, 0 = 无 release_date
+        self.index = index                  # language / genre / year 倒排索引
+
+        self.version = version
+        self.loaded_at = time.time()
+        self.row_count = len(movie_ids)
+        self.max_id = int(movie_ids[-1]) if len(movie_ids) else 0
+
+        self._lang_index = {lang: i for i, lang in enumerate(languages)}
+        # movie_id -> 行号 (-1 表示不存在)，id 为稠密自增主键，直接开数组
+        self._row = np.full(self.max_id + 1, -1, dtype=np.int32)
+        self._row[movie_ids] = np.arange(len(movie_ids), dtype=np.int32)
+
+    def __len__(self):
+        return self.row_count
+
+    # ------------------------------------------------------------------ #
+    #                            构建 / 增量                               #
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def from_columns(cls, cols: dict, version: int = 0) -> "CatalogSnapshot":
+        languages: list[str] = []
+        lang_codes = _encode_languages(cols["language"], languages, {})
+        return cls(
+            movie_ids=cols["movie_id"],
+            lang_codes=lang_codes,
+            languages=languages,
+            vote_average=cols["vote_average"],
+            vote_count=cols["vote_count"],
+            popularity=cols["popularity"],
+            genre_id=cols["genre_id"],
+            release_year=cols["release_year"],
+            index=MovieIndex.build(cols["movie_id"], cols["language"],
+                                   cols["genre_pairs"], cols["release_year"]),
+            version=version,
+        )
+
+    def extend(self, cols: dict, version: int) -> "CatalogSnapshot":
+        """
+        追加 id > max_id 的新电影，返回新快照；倒排索引只合并受影响的分区
+        """
+        languages = list(self.languages)
+        lang_codes = _encode_languages(cols["language"], languages, dict(self._lang_index))
+        cat = np.concatenate
+        return CatalogSnapshot(
+            movie_ids=cat((self.movie_ids, cols["movie_id"])),
+            lang_codes=cat((self.lang_codes, lang_codes)),
+            languages=languages,
+            vote_average=cat((self.vote_average, cols["vote_average"])),
+            vote_count=cat((self.vote_count, cols["vote_count"])),
+            popularity=cat((self.popularity, cols["popularity"])),
+            genre_id=cat((self.genre_id, cols["genre_id"])),
+            release_year=cat((self.release_year, cols["release_year"])),
+            index=self.index.extend(cols["movie_id"], cols["language"],
+                                    cols["genre_pairs"], cols["release_year"]),
+            version=version,
+        )
+
+    # ------------------------------------------------------------------ #
+    #                               查询                                  #
+    # ------------------------------------------------------------------ #
+    def rows(self, movie_ids) -> np.ndarray:
+        """ movie_id -> 行号；不在快照中的 id 返回 -1 """
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        out = np.full(len(ids), -1, dtype=np.int32)
+        ok = (ids >= 0) & (ids <= self.max_id)
+        out[ok] = self._row[ids[ok]]
+        return out
+
+    def lang_code(self, lang: str) -> int:
+        return self._lang_index.get(lang, -1)
+
+    def ids_for_languages(self, languages: Iterable[str] | None = None) -> np.ndarray:
+        """
+        返回 original_language ∈ languages 的电影 id（升序）；
+        languages 为空时返回所有带 original_language 的电影
+        """
+        return self.index.ids("language", languages or None)
+
+    def genre_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """ (movie_ids, genre_ids)，与 movie_genre 表等价，取自倒排索引的 genre 分区 """
+        parts = [(g, self.index.ids("genre", [g])) for g in self.index.keys("genre")]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return (np.concatenate([ids for _, ids in parts]),
+                np.concatenate([np.full(len(ids), g, dtype=np.int64) for g, ids in parts]))
+
+    def movie_features(self, movie_ids) -> pd.DataFrame:
+        """
+        movie_id | genre_id | vote_average | popularity
+        列与精排特征仓库 (ranking/feature_store.py) 一致；缺失电影填 0
+        """
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        rows = self.rows(ids)
+        hit = rows >= 0
+        r = rows[hit]
+
+        genre = np.zeros(len(ids), dtype=np.int32)
+        vote = np.zeros(len(ids), dtype=np.float32)
+        pop = np.zeros(len(ids), dtype=np.float32)
+        genre[hit] = self.genre_id[r]
+        vote[hit] = self.vote_average[r]
+        pop[hit] = self.popularity[r]
+
+        return pd.DataFrame({
+            "movie_id":     ids,
+            "genre_id":     genre,
+            "vote_average": vote,
+            "popularity":   pop,
+        })
+
+
+def _encode_languages(raw: np.ndarray, languages: list[str], lang_index: dict) -> np.ndarray:
+    """ 语言字符串 -> int16 编码；新语言追加到 languages 末尾 """
+    codes = np.empty(len(raw), dtype=np.int16)
+    for i, lang in enumerate(raw):
+        if lang:
+            code = lang_index.get(lang)
+            if code is None:
+                code = lang_index[lang] = len(languages)
+                languages.append(lang)
+            codes[i] = code
+        else:
+            codes[i] = -1
+    return codes
+
+
+def _fetch_columns(min_id: int = 0) -> dict:
+    """
+    读取 id > min_id 的电影（普通 tuple cursor，不为每行建 dict）
+    first genre 取最小 genre_id（精排特征仓库与此一致）
+    """
+    query = """
+        SELECT m.id,
+               m.original_language,
+               COALESCE(m.vote_average, 0),
+               COALESCE(m.vote_count, 0),
+               COALESCE(m.popularity, 0),
+               COALESCE(g.genre_id, 0),
+               COALESCE(EXTRACT(YEAR FROM m.release_date)::int, 0)
+        FROM movies m
+        LEFT JOIN (
+            SELECT movie_id, MIN(genre_id) AS genre_id
+            FROM movie_genre
+            GROUP BY movie_id
+        ) g ON g.movie_id = m.id
+        WHERE m.id > %s
+        ORDER BY m.id
+    """
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (min_id,))
+            rows = cur.fetchall()
+            cur.execute("SELECT movie_id, genre_id FROM movie_genre WHERE movie_id > %s",
+                        (min_id,))
+            pairs = cur.fetchall()
+
+    n, k = len(rows), len(pairs)
+    return {
+        "movie_id":     np.fromiter((r[0] for r in rows), dtype=np.int64, count=n),
+        "language":     np.array([r[1] for r in rows], dtype=object),
+        "vote_average": np.fromiter((r[2] for r in rows), dtype=np.float32, count=n),
+        "vote_count":   np.fromiter((r[3] for r in rows), dtype=np.int32, count=n),
+        "popularity":   np.fromiter((r[4] for r in rows), dtype=np.float32, count=n),
+        "genre_id":     np.fromiter((r[5] for r in rows), dtype=np.int32, count=n),
+        "release_year": np.fromiter((r[6] for r in rows), dtype=np.int32, count=n),
+        "genre_pairs":  (np.fromiter((p[0] for p in pairs), dtype=np.int64, count=k),
+                         np.fromiter((p[1] for p in pairs), dtype=np.int64, count=k)),
+    }
+
+
+def load_snapshot(version: int = 0) -> CatalogSnapshot:
+    return CatalogSnapshot.from_columns(_fetch_columns(), version=version)
+
+
+# --------------------------------------------------------------------------- #
+#                         进程级缓存 + 后台刷新                                #
+# --------------------------------------------------------------------------- #
+class CatalogStore:
+    def __init__(self, ttl: float = CATALOG_TTL, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshot: CatalogSnapshot | None = None
+        self._load_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def get(self) -> CatalogSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._snapshot = load_snapshot(version=1)
+                    self.start()
+                snap = self._snapshot
+        return snap
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        必要时重新加载并原子替换快照；返回是否发生了替换
+          • 只有新插入 (id > max_id) → 增量追加，倒排索引只合并新分区
+          • 其它变化 / TTL 到期 / force → 全量重载
+        """
+        with self._load_lock:
+            old = self._snapshot
+            if old is None:
+                self._snapshot = load_snapshot(version=1)
+                return True
+
+            version = old.version + 1
+            if force or time.time() - old.loaded_at > self.ttl:
+                new, mode = load_snapshot(version=version), "full"
+            else:
+                row = fetchone_dict("SELECT MAX(id) AS m, COUNT(*) AS n FROM movies")
+                max_id, count = row["m"] or 0, row["n"]
+                if max_id == old.max_id and count == old.row_count:
+                    return False
+                new, mode = None, "full"
+                if max_id > old.max_id:
+                    delta = _fetch_columns(min_id=old.max_id)
+                    if old.row_count + len(delta["movie_id"]) == count:
+                        new, mode = old.extend(delta, version=version), "incremental"
+                if new is None:
+                    new = load_snapshot(version=version)
+
+            self._snapshot = new
+        print(f"[catalog] snapshot v{version} loaded ({mode}, {new.row_count} movies)")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:          # 刷新失败时继续沿用旧快照
+                print(f"[catalog] refresh failed: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_STORE = CatalogStore()
+
+
+def get_catalog() -> CatalogSnapshot:
+    return _STORE.get()
+
+
+def refresh_catalog(force: bool = False) -> bool:
+    return _STORE.refresh(force=force)
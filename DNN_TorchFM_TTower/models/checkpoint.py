@@ -0,0 +1,42 @@
+# DNN_TorchFM_TTower\models\checkpoint.py
+"""
+模型 checkpoint 读写
+
+新格式：{"state_dict": ..., "meta": {...}}，meta 记录重建网络所需的信息
+        (arch / 词表大小 / 维度 ...)，推断时不必再查数据库推算结构。
+旧格式：直接 torch.save(model.state_dict())，读取时 meta 为空 dict。
+
+写入先落到同目录临时文件再 os.replace，读者永远不会读到写了一半的文件。
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+
+import torch
+
+
+def save_checkpoint(path, state_dict: dict, **meta) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save({"state_dict": state_dict, "meta": meta}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_checkpoint(path) -> tuple[dict, dict]:
+    """
+    返回 (state_dict, meta)；兼容旧的纯 state_dict 文件
+    """
+    obj = torch.load(path, map_location="cpu")
+    if isinstance(obj, dict) and "state_dict" in obj and "meta" in obj:
+        return obj["state_dict"], dict(obj["meta"])
+    return obj, {}
@@ -1,8 +1,59 @@
 # models/config.py
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]      # …/DNN_TorchFM_TTower
+SAVE_DIR = ROOT_DIR / "saved_model"
+
 DB_NAME = "yannr_00"
 DB_USER = "yannr_01"
 DB_PASSWORD = "Projet1234"
 DB_HOST = "postgresql-yannr.alwaysdata.net"
 DB_PORT = 5432
 
+# ---- 连接池 (models/db_pool.py) ----
+DB_POOL_MIN = 1                  # 启动时预热的连接数
+DB_POOL_MAX = 10                 # 单进程最大连接数
+DB_POOL_TIMEOUT = 30.0           # 池满时等待可用连接的秒数
+DB_POOL_MAX_LIFETIME = 1800.0    # 连接存活超过该秒数后回收重建
+DB_POOL_HEALTH_CHECK = 30.0      # 空闲超过该秒数的连接借出前先 SELECT 1
+
+# ---- 电影目录快照 (models/catalog.py) ----
+CATALOG_TTL = 3600.0             # 快照最长存活秒数，到期强制重载
+CATALOG_CHECK_INTERVAL = 60.0    # 后台检查 MAX(id) / COUNT(*) 的间隔
+
+# ---- 冷启动候选池 (models/recall/cold_start.py) ----
+COLD_POOL_REFRESH = 3600.0       # 候选池最长存活秒数；catalog 版本变化时也会提前重建
+
+# ---- 精排特征仓库 (models/ranking/feature_store.py) ----
+FEATURE_STORE_TTL = 3600.0               # 用户列最长存活秒数，到期全量重载
+FEATURE_STORE_CHECK_INTERVAL = 60.0      # 后台检查 users MAX(id) / COUNT(*) 的间隔
+FEATURE_STORE_USER_REFRESH_INTERVAL = 5.0   # 请求里遇到未知 user_id 时，两次同步补载之间的最短间隔
+RANKING_BAG_FIELDS = ("genres",)         # DeepFM 多值字段 (EmbeddingBag)：genres / keywords / cast
+
+# ---- Two-Tower 召回检索 (models/recall/ann_index.py) ----
+RECALL_SEARCH = "exact"          # "exact" = 全量打分；"ivf" = IVF 近似最近邻（仅 arch=dot）
+ANN_NLIST = None                 # IVF 簇数，None = 4·sqrt(N)
+ANN_NPROBE = 8                   # 每次查询扫描的簇数
+ANN_INDEX_DIR = SAVE_DIR / "ann_index"   # ann_index build 的输出；与当前模型 / catalog 匹配时服务端 mmap 加载
+
+# ---- 推断图导出 (models/export.py) ----
+EXPORT_PREFER = True             # 加载 checkpoint 时优先用旁边 sha1 匹配的 .ts 推断图（TorchScript）
+EXPORT_ON_SAVE = True            # 训练脚本保存 checkpoint 后顺带导出推断图
+EXPORT_RTOL = 1e-4               # 推断图与 eager 输出的容差 (torch.allclose)
+EXPORT_ATOL = 1e-5
+
+# ---- 离线训练快照 (models/snapshot.py) ----
+SNAPSHOT_DIR = ROOT_DIR / "snapshots"   # 每次导出一个子目录，LATEST 文件记录最新一份
+
+# ---- 后台增量重训 (service/retrainer.py) ----
+RETRAIN_EVERY_N = 50             # 累计多少条新观看事件触发一次重训
+RETRAIN_CPU_BUDGET = 0.5         # 训练子进程可用的 CPU 比例（线程数与空闲占空比）
+RETRAIN_MIN_INTERVAL = 60.0      # 两次重训之间的最短间隔（秒）
+RETRAIN_NICE = 10                # 训练子进程的 nice 增量，让出 CPU 给服务线程
+RETRAIN_OVERLAP = 600.0          # 增量训练重读水位前多少秒的事件，接住晚提交的事务（按 (user, movie) 去重）
 
+# ---- 推荐结果缓存 (service/result_cache.py) ----
+RESULT_CACHE_BACKEND = "memory"  # "memory" = 进程内 LRU；"sqlite" = 本机多进程共享
+RESULT_CACHE_SIZE = 10000        # 最多缓存的 (user, top, 模型版本) 条目数
+RESULT_CACHE_TTL = 300.0         # 条目存活秒数
+RESULT_CACHE_PATH = SAVE_DIR / "result_cache.sqlite"
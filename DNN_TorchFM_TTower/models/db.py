@@ -1,10 +1,25 @@
 # DNN_TorchFM_TTower\models\db.py
+import threading
+
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from collections import Counter
-from DNN_TorchFM_TTower.models.config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from DNN_TorchFM_TTower.models.config import (
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME, DB_POOL_HEALTH_CHECK,
+)
+from DNN_TorchFM_TTower.models.db_pool import ConnectionPool
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
 
 def get_connection():
+    """
+    独立的物理连接（不经过连接池），调用方负责 close()。
+    常规查询请使用下面的 fetchall_dict / fetchone_dict / execute_sql。
+    """
     return psycopg2.connect(
         dbname=DB_NAME,
         user=DB_USER,
@@ -13,14 +28,51 @@ def get_connection():
         port=DB_PORT
     )
 
+
+def get_pool() -> ConnectionPool:
+    """
+    进程级共享连接池，首次调用时才建立
+    """
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    health_check_interval=DB_POOL_HEALTH_CHECK,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                )
+    return _POOL
+
+
+def set_pool(pool: ConnectionPool) -> None:
+    """
+    由宿主进程 (如 FlaskAPI) 注入自己的连接池，使模型层与 Web 层共用同一套连接
+    """
+    global _POOL
+    with _POOL_LOCK:
+        _POOL = pool
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
 def fetchall_dict(query, params=None):
-    with get_connection() as conn:
+    with get_pool().connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, params)
             return cur.fetchall()
 
 def fetchone_dict(query, params=None):
-    with get_connection() as conn:
+    with get_pool().connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, params)
             return cur.fetchone()
@@ -71,6 +123,28 @@ def get_user_view_count(user_id):
     row = fetchone_dict(query, (user_id,))
     return row["cnt"] if row else 0
 
+def get_users_view_stats(user_ids):
+    """
+    批量版 get_user_view_count + get_user_view_languages，一条 SQL 取所有用户：
+    返回 {user_id: (观影数量, 最常见的前 2 种语言)}；没有历史的用户为 (0, set())
+    """
+    query = """
+        SELECT v.user_id, m.original_language, COUNT(*) AS cnt
+        FROM view_history v
+        LEFT JOIN movies m ON v.movie_id = m.id
+        WHERE v.user_id = ANY(%s)
+        GROUP BY v.user_id, m.original_language
+    """
+    rows = fetchall_dict(query, (list(user_ids),))
+    counts, langs = Counter(), {}
+    for r in rows:
+        counts[r["user_id"]] += r["cnt"]
+        if r["original_language"]:
+            langs.setdefault(r["user_id"], Counter())[r["original_language"]] += r["cnt"]
+    return {uid: (counts.get(uid, 0),
+                  {lang for lang, _ in langs[uid].most_common(2)} if uid in langs else set())
+            for uid in user_ids}
+
 def get_top_rated_movies(limit=10):
     """
     根据 movies 表里的 vote_average 字段，获取评分最高的电影 ID 列表。
@@ -87,7 +161,10 @@ def get_top_rated_movies(limit=10):
     return [r["id"] for r in rows]
 
 def execute_sql(query, params=None):
-    with get_connection() as conn:
+    """
+    单独执行时立即提交；在已绑定 g.db 的请求线程里执行时并入请求的事务（SAVEPOINT），
+    不会顺带提交路由尚未完成的写入
+    """
+    with get_pool().transaction() as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
-            conn.commit()
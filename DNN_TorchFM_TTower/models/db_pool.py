@@ -0,0 +1,291 @@
+# DNN_TorchFM_TTower\models\db_pool.py
+"""
+线程安全的 PostgreSQL 连接池
+
+• min_size / max_size   : 预热连接数 / 最大连接数
+• health check          : 空闲超过 health_check_interval 秒的连接，借出前先 SELECT 1
+• recycle               : 存活超过 max_lifetime 秒的连接，归还时关闭并重建
+• stats()               : checkout 次数 / 等待耗时 / 池饱和次数 等计数器
+
+用法：
+    pool = ConnectionPool(min_size=1, max_size=10, dbname=..., user=...)
+    with pool.connection() as conn:      # 读
+        ...
+    with pool.transaction() as conn:     # 写：自己借的连接 commit；借用宿主的连接时走 SAVEPOINT
+        ...
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+_SAVEPOINT = "pool_txn"
+
+
+class PoolTimeout(PoolError):
+    """ 等待 timeout 秒后仍没有可用连接 """
+
+
+class _Slot:
+    """ 池内一条物理连接 + 其时间戳 """
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    def __init__(self,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30.0,
+                 max_lifetime: float = 1800.0,
+                 health_check_interval: float = 30.0,
+                 **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"invalid pool size: min={min_size} max={max_size}")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle: deque[_Slot] = deque()
+        self._in_use: dict[int, _Slot] = {}       # id(conn) -> slot
+        self._opening = 0                          # 正在建立中的连接
+        self._closed = False
+        self._local = threading.local()
+
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_wait_total_s": 0.0,
+            "checkout_wait_max_s": 0.0,
+            "saturated_checkouts": 0,              # 借出时池已满，需要排队
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "recycled": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(_Slot(self._open()))
+
+    # ------------------------------------------------------------------ #
+    #                          物理连接                                   #
+    # ------------------------------------------------------------------ #
+    def _open(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["connections_closed"] += 1
+
+    def _healthy(self, slot: _Slot) -> bool:
+        conn = slot.conn
+        if conn.closed:
+            return False
+        if time.monotonic() - slot.last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    # ------------------------------------------------------------------ #
+    #                         借出 / 归还                                 #
+    # ------------------------------------------------------------------ #
+    def getconn(self, timeout: float | None = None):
+        """
+        借出一条连接；池满时最多等待 timeout 秒，超时抛 PoolTimeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        tic = time.monotonic()
+        deadline = tic + timeout
+        waited = False
+
+        while True:
+            slot = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        slot = self._idle.pop()    # LIFO：优先复用最热的连接
+                        break
+                    if len(self._in_use) + self._opening < self.max_size:
+                        self._opening += 1
+                        break
+                    waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no connection available within {timeout:.1f}s "
+                            f"(max_size={self.max_size})")
+                    self._cond.wait(remaining)
+
+            if slot is None:
+                try:
+                    slot = _Slot(self._open())
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+            elif not self._healthy(slot):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self._discard(slot.conn)
+                with self._cond:
+                    self._cond.notify()
+                continue
+
+            wait = time.monotonic() - tic
+            with self._cond:
+                self._in_use[id(slot.conn)] = slot
+                self._stats["checkouts"] += 1
+                self._stats["checkout_wait_total_s"] += wait
+                self._stats["checkout_wait_max_s"] = max(self._stats["checkout_wait_max_s"], wait)
+                if waited:
+                    self._stats["saturated_checkouts"] += 1
+            return slot.conn
+
+    def putconn(self, conn, close: bool = False):
+        """
+        归还连接：未结束的事务会被回滚；损坏 / 过期的连接直接关闭
+        """
+        with self._cond:
+            slot = self._in_use.pop(id(conn), None)
+        if slot is None:
+            raise PoolError("connection does not belong to this pool")
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        now = time.monotonic()
+        if not close and now - slot.created_at > self.max_lifetime:
+            close = True
+            with self._cond:
+                self._stats["recycled"] += 1
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+        else:
+            slot.last_used = now
+            with self._cond:
+                self._idle.append(slot)
+
+        with self._cond:
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float | None = None):
+        """
+        with pool.connection() as conn: ...
+        同一线程已持有 (attach) 的连接会被直接复用，避免一次请求占用两条连接
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None and not held.closed:
+            yield held
+            return
+
+        conn = self.getconn(timeout)
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self.putconn(conn)
+
+    @contextmanager
+    def transaction(self, timeout: float | None = None):
+        """
+        with pool.transaction() as conn: ...   （写操作用）
+        自己借出的连接：正常结束 commit，异常 rollback。
+        复用线程已绑定 (attach) 的连接时不替宿主提交或回滚：语句包在 SAVEPOINT 里，
+        异常只回滚到 savepoint，宿主事务里之前的写入保留，提交与否由宿主（路由 / teardown）决定
+        """
+        held = getattr(self._local, "conn", None)
+        if held is None or held.closed:
+            with self.connection(timeout) as conn:
+                try:
+                    yield conn
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            return
+
+        if held.autocommit:             # 宿主没有事务块，每条语句自行提交
+            yield held
+            return
+        with held.cursor() as cur:
+            cur.execute(f"SAVEPOINT {_SAVEPOINT}")
+        try:
+            yield held
+        except BaseException:
+            with held.cursor() as cur:
+                cur.execute(f"ROLLBACK TO SAVEPOINT {_SAVEPOINT}")
+                cur.execute(f"RELEASE SAVEPOINT {_SAVEPOINT}")
+            raise
+        with held.cursor() as cur:
+            cur.execute(f"RELEASE SAVEPOINT {_SAVEPOINT}")
+
+    def attach(self, conn):
+        """ 把一条已借出的连接绑定到当前线程，之后 connection() 会复用它 """
+        self._local.conn = conn
+
+    def detach(self):
+        self._local.conn = None
+
+    # ------------------------------------------------------------------ #
+    #                         维护 / 指标                                 #
+    # ------------------------------------------------------------------ #
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for slot in idle:
+            self._discard(slot.conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            s.update(
+                min_size=self.min_size,
+                max_size=self.max_size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                saturation=len(self._in_use) / self.max_size,
+                checkout_wait_avg_s=(s["checkout_wait_total_s"] / s["checkouts"]
+                                     if s["checkouts"] else 0.0),
+            )
+        return s
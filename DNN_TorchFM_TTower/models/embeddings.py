@@ -0,0 +1,110 @@
+# DNN_TorchFM_TTower\models\embeddings.py
+"""
+可扩容的 embedding 表：新用户 / 新电影出现时不必整表重训
+
+    grow_embedding(emb, n, init)          → 新 nn.Embedding，旧行原样拷贝，新行按 init 初始化
+    grow_two_tower(model, n_users, n_movies)
+    grow_deepfm(model, field_dims)
+    load_state_dict_grown(model, state)   → checkpoint 比模型小时按行拷贝，其余参数严格加载
+
+新行初始化方式 (init)：
+  • "mean"   : 旧表的行均值 —— 新 id 从“平均用户 / 平均电影”出发
+  • "hash"   : 按 id 哈希借用一行旧向量 —— 确定性，且新行之间彼此不同
+  • "normal" : N(0, 旧表整体 std)，与旧表同量级的随机初始化
+"""
+
+from __future__ import annotations
+
+import torch
+import torch.nn as nn
+
+GROW_INITS = ("mean", "hash", "normal")
+
+_HASH_MULT = 2654435761     # Knuth 乘法哈希
+
+
+def _new_rows(old: torch.Tensor, new_ids: torch.Tensor, init: str) -> torch.Tensor:
+    if init == "mean":
+        return old.mean(dim=0, keepdim=True).expand(len(new_ids), -1).clone()
+    if init == "hash":
+        src = (new_ids * _HASH_MULT) % old.size(0)
+        return old[src].clone()
+    if init == "normal":
+        gen = torch.Generator().manual_seed(int(new_ids[0]))
+        return torch.randn(len(new_ids), old.size(1), generator=gen, dtype=old.dtype) * old.std()
+    raise ValueError(f"init must be one of {GROW_INITS}, got {init!r}")
+
+
+def grow_weight(old: torch.Tensor, num_embeddings: int, init: str = "mean") -> torch.Tensor:
+    """ (N, D) → (num_embeddings, D)；num_embeddings <= N 时原样返回 """
+    n = old.size(0)
+    if num_embeddings <= n:
+        return old
+    new_ids = torch.arange(n, num_embeddings)
+    return torch.cat([old, _new_rows(old.detach(), new_ids, init).to(old.device)], dim=0)
+
+
+def grow_embedding(emb: nn.Embedding, num_embeddings: int, init: str = "mean") -> nn.Embedding:
+    if num_embeddings <= emb.num_embeddings:
+        return emb
+    out = nn.Embedding(num_embeddings, emb.embedding_dim, padding_idx=emb.padding_idx,
+                       device=emb.weight.device, dtype=emb.weight.dtype)
+    with torch.no_grad():
+        out.weight.copy_(grow_weight(emb.weight.detach(), num_embeddings, init))
+    return out
+
+
+def grow_embeddings(model: nn.Module, sizes: dict[str, int], init: str = "mean") -> bool:
+    """
+    sizes: {子模块路径: 目标行数}，如 {"user_embedding": 1001}；原地替换子模块。
+    返回是否有表被扩容。注意：扩容后需重新创建 optimizer。
+    """
+    grown = False
+    for path, n in sizes.items():
+        emb = model.get_submodule(path)
+        if n <= emb.num_embeddings:
+            continue
+        parent_path, _, attr = path.rpartition(".")
+        parent = model.get_submodule(parent_path) if parent_path else model
+        setattr(parent, attr, grow_embedding(emb, n, init))
+        print(f"[embeddings] {path}: {emb.num_embeddings} → {n} rows (init={init})")
+        grown = True
+    return grown
+
+
+# --------------------------------------------------------------------------- #
+#                            具体模型的扩容                                    #
+# --------------------------------------------------------------------------- #
+def grow_two_tower(model, num_users: int, num_movies: int, init: str = "mean") -> bool:
+    """ 两种双塔的表大小都是 MAX(id) + 1 """
+    return grow_embeddings(model, {"user_embedding": num_users + 1,
+                                   "movie_embedding": num_movies + 1}, init)
+
+
+def grow_deepfm(model, field_dims, init: str = "mean") -> bool:
+    """
+    DeepFM 的一阶 / 二阶表共用 sum(field_dims) 行，ids 直接作为行号，
+    所以扩容就是在表尾追加行；已有 id 的向量位置不变
+    """
+    total = int(sum(field_dims))
+    return grow_embeddings(model, {"linear_sparse.fc": total,
+                                   "embedding.embedding": total}, init)
+
+
+def load_state_dict_grown(model: nn.Module, state: dict, init: str = "mean") -> list[str]:
+    """
+    把较小词表的 checkpoint 载入已按新词表构建的模型：
+    第 0 维更小、其余维一致的权重先按行扩容再加载；其它形状不一致仍然报错。
+    返回被扩容的参数名列表
+    """
+    target = model.state_dict()
+    grown = []
+    state = dict(state)
+    for key, w in state.items():
+        t = target.get(key)
+        if (t is not None and w.dim() == 2 and t.dim() == 2
+                and w.size(1) == t.size(1) and w.size(0) < t.size(0)):
+            state[key] = grow_weight(w, t.size(0), init)
+            grown.append(key)
+    model.load_state_dict(state)
+    return grown
@@ -0,0 +1,159 @@
+# models/export.py
+"""
+推断图导出：把 checkpoint 里的网络 trace 成 TorchScript，freeze + optimize_for_inference 后
+写在 state dict 旁边（dnn_recommender.pt → dnn_recommender.ts，deepfm_ranker.pt → deepfm_ranker.ts）
+
+    python -m DNN_TorchFM_TTower.models.export                 # 双塔 + 精排
+    python -m DNN_TorchFM_TTower.models.export --model ranker
+
+• 只 trace 推断用到的方法（forward；dot 双塔另加 user_vectors / item_vectors / score_vectors），
+  eval 下的 dropout 被剪掉，freeze 把权重折成常量，optimize_for_inference 再做算子融合
+• 写入前用与 trace 不同的 batch 大小逐方法对比 eager 输出，超出 EXPORT_RTOL / EXPORT_ATOL 拒绝写入
+• 推断图的 extra file 记下源 checkpoint 的 sha1；checkpoint 更新后旧推断图自动失效
+• 加载侧 (load_exported) 仍由调用方先建好 eager 模型，再抽一个 batch 复核，通过后只把热路径
+  方法换成推断图的同名方法：isinstance / 词表大小 / preprocess 等属性不变，调用方无需区分。
+  推断图只用于推断，训练仍从 state dict 重建 eager 模型
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import os
+import tempfile
+import warnings
+from pathlib import Path
+from typing import Callable
+
+import torch
+
+from DNN_TorchFM_TTower.models.config import EXPORT_ATOL, EXPORT_ON_SAVE, EXPORT_PREFER, EXPORT_RTOL
+from DNN_TorchFM_TTower.models.registry import _file_sha1
+
+EXPORT_SUFFIX = ".ts"
+TRACE_BATCH = 8
+CHECK_BATCHES = (1, 37, 256)     # 与 TRACE_BATCH 不同，确认 batch 维没有被 trace 成常量
+_SOURCE_KEY = "source_sha1"
+
+# 各模型的导出入口：模块需提供 export_model(path=MODEL_PATH) -> Path
+EXPORTERS = {
+    "two_tower": "DNN_TorchFM_TTower.models.recall.two_tower",
+    "ranker":    "DNN_TorchFM_TTower.models.ranking.infer_ranking",
+}
+
+
+class ExportMismatch(RuntimeError):
+    """ 推断图与 eager 输出的差异超出容差 """
+
+
+def artifact_path(checkpoint) -> Path:
+    return Path(checkpoint).with_suffix(EXPORT_SUFFIX)
+
+
+def compare(eager, exported, inputs: dict, rtol: float = EXPORT_RTOL,
+            atol: float = EXPORT_ATOL) -> dict[str, float]:
+    """ inputs: {方法名: 参数元组}；返回各方法的最大绝对误差，超出容差抛 ExportMismatch """
+    errors = {}
+    with torch.no_grad():
+        for name, args in inputs.items():
+            ref = getattr(eager, name)(*args)
+            out = getattr(exported, name)(*args)
+            if out.shape != ref.shape:
+                raise ExportMismatch(f"{name}: shape {tuple(out.shape)} != eager {tuple(ref.shape)}")
+            errors[name] = float((out - ref).abs().max()) if ref.numel() else 0.0
+            if not torch.allclose(out, ref, rtol=rtol, atol=atol):
+                raise ExportMismatch(f"{name}: max abs err {errors[name]:.3g} "
+                                     f"exceeds rtol={rtol:g}, atol={atol:g}")
+    return errors
+
+
+def _trace(model, inputs: dict):
+    methods = [name for name in inputs if name != "forward"]
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")          # TracerWarning：分支已按 eval / 当前结构固定
+        traced = torch.jit.trace_module(model, inputs)
+        frozen = torch.jit.freeze(traced.eval(), preserved_attrs=methods)
+        return torch.jit.optimize_for_inference(frozen, other_methods=methods)
+
+
+def export_checkpoint(checkpoint, build: Callable, make_inputs: Callable,
+                      rtol: float = EXPORT_RTOL, atol: float = EXPORT_ATOL) -> Path:
+    """
+    build(checkpoint) -> eval 模式的 eager 模型；make_inputs(model, batch) -> {方法名: 参数元组}，
+    必须含 forward。按 TRACE_BATCH trace，CHECK_BATCHES 逐一对比 eager，全部通过才原子写入
+    """
+    checkpoint = Path(checkpoint)
+    sha1 = _file_sha1(checkpoint)        # 先取 sha1：构建期间文件若被替换，推断图只会被判为过期
+    model = build(checkpoint).eval()
+    exported = _trace(model, make_inputs(model, TRACE_BATCH))
+
+    errors: dict[str, float] = {}
+    for batch in CHECK_BATCHES:
+        for name, err in compare(model, exported, make_inputs(model, batch), rtol, atol).items():
+            errors[name] = max(errors.get(name, 0.0), err)
+
+    path = artifact_path(checkpoint)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)     # torch.jit.* 的弃用提示
+            torch.jit.save(exported, f, _extra_files={_SOURCE_KEY: sha1})
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    worst = ", ".join(f"{k}={v:.2g}" for k, v in errors.items())
+    print(f"[export] {path.name} ← {checkpoint.name} (sha1={sha1[:10]}, max abs err: {worst})")
+    return path
+
+
+def load_exported(checkpoint, model, inputs: dict, rtol: float = EXPORT_RTOL,
+                  atol: float = EXPORT_ATOL):
+    """
+    checkpoint 旁与其内容匹配、且在 inputs 上与 eager model 一致的推断图；
+    EXPORT_PREFER 关闭 / 没有 / 过期 / 不一致时返回 None（调用方继续用 eager）
+    """
+    path = artifact_path(checkpoint)
+    if not EXPORT_PREFER or not path.exists():
+        return None
+    extra = {_SOURCE_KEY: ""}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            exported = torch.jit.load(str(path), map_location="cpu", _extra_files=extra)
+        if extra[_SOURCE_KEY].decode() != _file_sha1(checkpoint):
+            print(f"[export] {path.name} is stale (checkpoint changed), using eager")
+            return None
+        compare(model, exported, inputs, rtol, atol)
+    except Exception as e:              # 损坏 / torch 版本不兼容 / 输出不一致
+        print(f"[export] {path.name} ignored, using eager: {type(e).__name__}: {e}")
+        return None
+    return exported
+
+
+def export(name: str, path=None) -> Path:
+    module = importlib.import_module(EXPORTERS[name])
+    return module.export_model() if path is None else module.export_model(path)
+
+
+def export_after_save(name: str, path) -> Path | None:
+    """ 训练脚本保存 checkpoint 后调用；导出失败只告警（服务继续用 eager），不影响训练结果 """
+    if not EXPORT_ON_SAVE:
+        return None
+    try:
+        return export(name, path)
+    except Exception as e:
+        print(f"[export] ⚠️ {name} export failed, serving stays eager: {type(e).__name__}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", choices=[*EXPORTERS, "all"], default="all")
+    ap.add_argument("--checkpoint", default=None, help="export another checkpoint instead of the served one")
+    args = ap.parse_args()
+    if args.checkpoint and args.model == "all":
+        ap.error("--checkpoint needs a single --model")
+    for name in (EXPORTERS if args.model == "all" else [args.model]):
+        export(name, args.checkpoint)
@@ -0,0 +1,128 @@
+# DNN_TorchFM_TTower\models\movie_index.py
+"""
+电影倒排索引：字段值 -> 升序 movie_id 数组 (np.int64)
+
+  • language : original_language -> ids   (每部电影只属于一个分区)
+  • genre    : genre_id          -> ids   (多值，一部电影可出现在多个分区)
+  • year     : release year      -> ids
+
+候选集 = 同一字段内各分区求并，不同字段之间求交，全部是有序数组运算，
+不再对整张电影表做 Python 线性扫描。
+
+索引本身不可变；extend() 只合并受影响的分区并返回新索引，
+供 catalog 在新电影插入时做增量更新。
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Mapping
+
+import numpy as np
+
+# 字段 -> 分区之间是否互斥（互斥时求并只需拼接 + 排序，无需去重）
+FIELDS = {"language": True, "genre": False, "year": True}
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _partition(keys: np.ndarray, ids: np.ndarray) -> dict:
+    """ 把 (key, id) 对按 key 分组，每组 id 升序 """
+    if not len(ids):
+        return {}
+    order = np.lexsort((ids, keys))
+    keys, ids = keys[order], ids[order]
+    bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(keys)]))
+    return {keys[s].item(): ids[s:e].copy() for s, e in zip(starts, ends)}
+
+
+class MovieIndex:
+    def __init__(self, partitions: Mapping[str, Mapping[object, np.ndarray]]):
+        self._parts = {f: dict(partitions.get(f, {})) for f in FIELDS}
+
+    # ------------------------------------------------------------------ #
+    #                               构建                                  #
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def build(cls,
+              movie_ids: np.ndarray,
+              languages: np.ndarray,
+              genre_pairs: tuple[np.ndarray, np.ndarray],
+              years: np.ndarray) -> "MovieIndex":
+        """
+        movie_ids   : (N,) int64
+        languages   : (N,) object，None / '' 表示缺失
+        genre_pairs : (movie_ids, genre_ids) 两个等长数组，来自 movie_genre
+        years       : (N,) int32，0 表示缺失
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        languages = np.asarray(languages, dtype=object)
+
+        has_lang = np.array([bool(l) for l in languages], dtype=bool)
+        has_year = np.asarray(years) > 0
+        g_mid, g_gid = (np.asarray(a, dtype=np.int64) for a in genre_pairs)
+
+        return cls({
+            "language": _partition(languages[has_lang].astype(str), movie_ids[has_lang]),
+            "genre":    _partition(g_gid, g_mid),
+            "year":     _partition(np.asarray(years)[has_year], movie_ids[has_year]),
+        })
+
+    def extend(self,
+               movie_ids: np.ndarray,
+               languages: np.ndarray,
+               genre_pairs: tuple[np.ndarray, np.ndarray],
+               years: np.ndarray) -> "MovieIndex":
+        """
+        合并新插入的电影，只重建被触及的分区；旧索引保持不变
+        """
+        delta = MovieIndex.build(movie_ids, languages, genre_pairs, years)
+        parts = {}
+        for field in FIELDS:
+            merged = dict(self._parts[field])
+            for key, ids in delta._parts[field].items():
+                old = merged.get(key)
+                merged[key] = ids if old is None else np.union1d(old, ids)
+            parts[field] = merged
+        return MovieIndex(parts)
+
+    # ------------------------------------------------------------------ #
+    #                               查询                                  #
+    # ------------------------------------------------------------------ #
+    def keys(self, field: str) -> list:
+        return list(self._parts[field])
+
+    def ids(self, field: str, keys: Iterable | None = None) -> np.ndarray:
+        """
+        字段内求并；keys 为 None 时返回该字段所有分区的并集
+        """
+        part = self._parts[field]
+        arrays = [part[k] for k in (part if keys is None else keys) if k in part]
+        if not arrays:
+            return _EMPTY
+        if len(arrays) == 1:
+            return arrays[0]
+        if FIELDS[field]:
+            return np.sort(np.concatenate(arrays))
+        return np.unique(np.concatenate(arrays))
+
+    def candidates(self,
+                   languages: Iterable[str] | None = None,
+                   genres: Iterable[int] | None = None,
+                   years: Iterable[int] | None = None) -> np.ndarray:
+        """
+        各字段过滤条件求交；未给出的字段不参与过滤（全部为 None 时返回空）
+        """
+        result = None
+        for field, keys in (("language", languages), ("genre", genres), ("year", years)):
+            if keys is None:
+                continue
+            ids = self.ids(field, keys)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                break
+        return _EMPTY if result is None else result
+
+    def sizes(self) -> dict:
+        return {f: {k: len(v) for k, v in p.items()} for f, p in self._parts.items()}
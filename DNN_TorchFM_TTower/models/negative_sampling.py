@@ -0,0 +1,534 @@
+# DNN_TorchFM_TTower\models\negative_sampling.py
+"""
+向量化负采样：替代逐用户 Python 集合运算 (all_movies - pos, isdisjoint)
+
+数据表示
+  • movie → genre : 每部电影一个 genre 位掩码 (N, W) uint64，W = ceil(#genre / 64)
+  • user → watched: CSR (indptr, rows)，rows 为 catalog 行号，每个用户段内升序
+  • user genre    : 已看电影掩码按段 bitwise_or.reduceat
+
+“题材不重叠” = (movie_mask & user_mask) == 0，一次位运算判定一整批候选。
+
+采样
+  • 拒绝采样：对每个用户均匀抽 catalog 行，保留「题材不重叠 & 未看过」的，
+    去重后不足的用户下一轮补抽
+  • 合格电影占比很低的用户（拒绝率太高）直接枚举合格行后无放回抽取
+  • 每个用户的负样本数 = min(neg_ratio × 正样本数, 合格电影数)，与原实现一致
+
+复现 / 并行
+  用户按固定数量的 shard 切分，第 i 个 shard 使用 SeedSequence(seed).spawn 的第 i 个子种子；
+  结果只取决于 seed 和 n_shards，与 n_jobs（线程数）无关。
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def genre_masks(n_rows: int, pair_rows: np.ndarray, pair_genres: np.ndarray) -> np.ndarray:
+    """
+    (行号, genre_id) 对 → (n_rows, W) uint64 位掩码；genre_id 先压缩成稠密编号
+    """
+    pair_rows = np.asarray(pair_rows, dtype=np.int64)
+    genres, codes = np.unique(np.asarray(pair_genres, dtype=np.int64), return_inverse=True)
+    n_words = max(1, -(-len(genres) // 64))
+    masks = np.zeros((n_rows, n_words), dtype=np.uint64)
+    keep = pair_rows >= 0
+    codes = codes[keep]
+    bits = np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64))
+    np.bitwise_or.at(masks, (pair_rows[keep], codes // 64), bits)
+    return masks
+
+
+def _disjoint(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ 逐行判断两组掩码没有公共位；a/b 形状 (..., W) 可广播 """
+    return ~np.any(a & b, axis=-1)
+
+
+class UserHistory:
+    """
+    用户 → 已看 catalog 行 的 CSR
+      users  : (U,) 升序 user_id
+      indptr : (U + 1,)
+      rows   : 每个用户段内升序的行号
+      keys   : 用户位置 × N + 行号，全局升序，用于批量判断“是否看过”
+    """
+
+    def __init__(self, user_ids, movie_rows, n_rows: int):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        movie_rows = np.asarray(movie_rows, dtype=np.int64)
+        ok = movie_rows >= 0                      # 不在 catalog 里的电影丢弃
+        self.n_rows = n_rows
+        self.users, pos = np.unique(user_ids[ok], return_inverse=True)
+        self._set_keys(np.unique(pos.reshape(-1) * n_rows + movie_rows[ok]))
+
+    def _set_keys(self, keys: np.ndarray) -> None:
+        self.keys = keys
+        self.rows = keys % self.n_rows
+        self.indptr = np.searchsorted(keys, np.arange(len(self.users) + 1) * self.n_rows)
+
+    @classmethod
+    def from_sorted_chunks(cls, chunks, row_of, n_rows: int) -> "UserHistory":
+        """
+        chunks : 按 (user_id, movie_id) 升序的 (n, 2) 整数块，如 copy_chunks(… ORDER BY user_id, movie_id)
+        row_of : movie_id → 行号（catalog.rows，行号随 movie_id 单调递增）
+        逐块追加 keys，不物化整表 (user, movie) 对；相邻重复的观看记录合并
+        """
+        self = cls.__new__(cls)
+        self.n_rows = n_rows
+        users, keys = [], []
+        n_users, last_user, last_key = 0, -1, -1
+        for chunk in chunks:
+            u = np.asarray(chunk[:, 0], dtype=np.int64)
+            r = np.asarray(row_of(chunk[:, 1]), dtype=np.int64)
+            ok = r >= 0
+            u, r = u[ok], r[ok]
+            if not len(u):
+                continue
+            new = np.empty(len(u), dtype=bool)
+            new[0] = u[0] != last_user
+            np.not_equal(u[1:], u[:-1], out=new[1:])
+            pos = n_users - 1 + np.cumsum(new)
+            k = pos * n_rows + r
+            fresh = np.empty(len(k), dtype=bool)
+            fresh[0] = k[0] != last_key
+            np.not_equal(k[1:], k[:-1], out=fresh[1:])
+            users.append(u[new])
+            keys.append(k[fresh])
+            n_users += int(new.sum())
+            last_user, last_key = int(u[-1]), int(k[-1])
+        self.users = np.concatenate(users) if users else _EMPTY
+        self._set_keys(np.concatenate(keys) if keys else _EMPTY)
+        return self
+
+    def __len__(self):
+        return len(self.users)
+
+    def pairs(self, idx) -> tuple[np.ndarray, np.ndarray]:
+        """ 第 idx 个 (用户, 已看行) 对 → (user_ids, 行号)，idx 为 keys 的下标 """
+        keys = self.keys[idx]
+        return self.users[keys // self.n_rows], keys % self.n_rows
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def positions(self, user_ids) -> np.ndarray:
+        """ user_id → 在 users 中的位置；没有历史的用户为 -1 """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        pos = np.searchsorted(self.users, user_ids)
+        pos = np.minimum(pos, max(len(self.users) - 1, 0))
+        hit = len(self.users) > 0 and self.users[pos] == user_ids
+        return np.where(hit, pos, -1)
+
+    def seen(self, pos: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """ 逐元素判断 (用户位置, 行号) 是否在历史中；pos / rows 可广播 """
+        pos, rows = np.broadcast_arrays(pos, rows)
+        keys = pos * self.n_rows + rows
+        at = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        return (pos >= 0) & (len(self.keys) > 0) & (self.keys[at] == keys)
+
+    def genre_masks(self, masks: np.ndarray) -> np.ndarray:
+        """ 每个用户已看电影 genre 掩码的按位或 (U, W) """
+        if not len(self.users):
+            return np.zeros((0, masks.shape[1]), dtype=np.uint64)
+        return np.bitwise_or.reduceat(masks[self.rows], self.indptr[:-1], axis=0)
+
+
+def catalog_genre_masks(catalog) -> np.ndarray:
+    """ 直接复用 catalog 的 genre 倒排分区，不再单独查 movie_genre """
+    pair_ids, pair_genres = catalog.genre_pairs()
+    return genre_masks(len(catalog), catalog.rows(pair_ids), pair_genres)
+
+
+class NegativeSampler:
+    """
+    sampler = NegativeSampler.from_catalog(get_catalog(), seed=42)
+    neg_users, neg_movies = sampler.sample(pos_users, pos_movies, neg_ratio=4)
+    """
+
+    def __init__(self,
+                 movie_ids: np.ndarray,
+                 masks: np.ndarray,
+                 seed: int = 42,
+                 n_shards: int = 16,
+                 n_jobs: int = 1,
+                 max_rounds: int = 8,
+                 min_accept: float = 0.02):
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)   # 行号 -> movie_id
+        self.masks = masks
+        self.seed = seed
+        self.n_shards = n_shards
+        self.n_jobs = n_jobs
+        self.max_rounds = max_rounds
+        self.min_accept = min_accept      # 合格占比低于此值的用户走枚举
+
+        # 相同掩码的电影合并计数，用来快速求每个用户的合格电影数
+        self._uniq_masks, self._mask_counts = np.unique(masks, axis=0, return_counts=True)
+
+    @classmethod
+    def from_catalog(cls, catalog, **kwargs) -> "NegativeSampler":
+        return cls(catalog.movie_ids, catalog_genre_masks(catalog), **kwargs)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def _eligible_counts(self, user_masks: np.ndarray) -> np.ndarray:
+        """ 每个用户掩码下题材不重叠的电影数 """
+        uniq, inv = np.unique(user_masks, axis=0, return_inverse=True)
+        counts = np.empty(len(uniq), dtype=np.int64)
+        step = max(1, (1 << 22) // max(1, len(self._uniq_masks)))
+        for s in range(0, len(uniq), step):
+            ok = _disjoint(uniq[s:s + step, None, :], self._uniq_masks[None, :, :])
+            counts[s:s + step] = ok @ self._mask_counts
+        return counts[inv.reshape(-1)]
+
+    # ------------------------------------------------------------------ #
+    #                               采 样                                 #
+    # ------------------------------------------------------------------ #
+    def sample(self, user_ids, movie_ids, neg_ratio: int = 1,
+               genre_disjoint: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """
+        user_ids / movie_ids : 正样本对（可重复，内部去重）
+        genre_disjoint=False 时只排除已看过的电影（均匀负采样）
+        返回 (neg_user_ids, neg_movie_ids)，按用户升序
+        """
+        hist = UserHistory(user_ids, self._rows_of(movie_ids), len(self))
+        if not len(hist):
+            return _EMPTY, _EMPTY
+
+        n_pos = hist.counts()
+        if genre_disjoint:
+            user_masks = hist.genre_masks(self.masks)
+            # 已看电影的题材必然与用户掩码重叠，除非它本身没有 genre
+            no_genre = ~np.any(self.masks[hist.rows], axis=1)
+            watched_free = np.add.reduceat(no_genre.astype(np.int64), hist.indptr[:-1])
+            eligible = self._eligible_counts(user_masks) - watched_free
+        else:
+            user_masks = np.zeros((len(hist), self.masks.shape[1]), dtype=np.uint64)
+            eligible = len(self) - n_pos
+        n_neg = np.minimum(neg_ratio * n_pos, eligible)
+
+        shards = np.array_split(np.arange(len(hist)), min(self.n_shards, len(hist)))
+        seeds = np.random.SeedSequence(self.seed).spawn(len(shards))
+        args = [(s, user_masks[s], n_neg[s], eligible[s], hist, seq)
+                for s, seq in zip(shards, seeds)]
+        if self.n_jobs > 1:
+            with ThreadPoolExecutor(self.n_jobs) as ex:
+                parts = list(ex.map(lambda a: self._sample_shard(*a), args))
+        else:
+            parts = [self._sample_shard(*a) for a in args]
+
+        neg_u = np.concatenate([p[0] for p in parts])
+        neg_r = np.concatenate([p[1] for p in parts])
+        return hist.users[neg_u], self.movie_ids[neg_r]
+
+    def _rows_of(self, movie_ids):
+        lookup = np.full(int(self.movie_ids[-1]) + 1 if len(self) else 1, -1, dtype=np.int64)
+        lookup[self.movie_ids] = np.arange(len(self))
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        ok = (ids >= 0) & (ids < len(lookup))
+        out = np.full(len(ids), -1, dtype=np.int64)
+        out[ok] = lookup[ids[ok]]
+        return out
+
+    def draw(self, user_masks: np.ndarray, n: int, rng: np.random.Generator,
+             rounds: int = 4) -> np.ndarray:
+        """
+        按 batch 现抽：user_masks (B, W) → (B, n) 个与用户题材不重叠的行号（collate 用，
+        见 GenreDisjointNegatives）；rounds 轮拒绝采样后仍重叠的位置保留均匀样本
+        """
+        rows = rng.integers(0, len(self), (len(user_masks), n))
+        for _ in range(rounds):
+            bad = ~_disjoint(self.masks[rows], user_masks[:, None, :])
+            if not bad.any():
+                break
+            rows[bad] = rng.integers(0, len(self), int(bad.sum()))
+        return rows
+
+    def _sample_shard(self, uidx, umask, n_neg, eligible, hist: UserHistory, seq):
+        """
+        uidx 为 UserHistory.users 中的位置；“是否看过”统一走 hist.seen / hist 的 CSR 段，
+        与 UserHistory.keys 用同一套编号（位置 × N + 行号）。返回 (位置, 行号) 两个数组
+        """
+        rng = np.random.default_rng(seq)
+        N = len(self)
+
+        dense = (eligible >= self.min_accept * N) & (n_neg > 0)
+        out_u, out_r = [], []
+
+        # ---------- 拒绝采样 ----------
+        pend = np.flatnonzero(dense)
+        got_keys = _EMPTY
+        got_order = _EMPTY
+        need = n_neg[pend]
+        accept = np.maximum(eligible[pend], 1) / N
+        for _ in range(self.max_rounds):
+            if not len(pend):
+                break
+            draws = np.ceil(need / accept * 1.2).astype(np.int64) + 1
+            who = np.repeat(pend, draws)
+            r = rng.integers(0, N, len(who))
+            ok = _disjoint(self.masks[r], umask[who]) & ~hist.seen(uidx[who], r)
+            keys = uidx[who] * N + r
+
+            # 与已接受样本合并去重；保留抽取顺序，截断时不偏向小行号
+            keys = np.concatenate([got_keys, keys[ok]])
+            order = np.concatenate([got_order, rng.random(int(ok.sum())) + len(got_order)])
+            keys, first = np.unique(keys, return_index=True)
+            order = order[first]
+            seq_order = np.lexsort((order, keys // N))
+            keys, order = keys[seq_order], order[seq_order]
+
+            users_of = np.searchsorted(uidx, keys // N)
+            starts = np.flatnonzero(np.r_[True, users_of[1:] != users_of[:-1]])
+            rank = np.arange(len(keys)) - np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+            keep = rank < n_neg[users_of]
+            got_keys, got_order = keys[keep], np.arange(int(keep.sum()), dtype=np.float64)
+
+            have = np.bincount(users_of[keep], minlength=len(uidx))
+            pend = np.flatnonzero(dense & (have < n_neg))
+            need = n_neg[pend] - have[pend]
+            accept = np.maximum(eligible[pend], 1) / N
+
+        if len(got_keys):
+            out_u.append(np.searchsorted(uidx, got_keys // N))
+            out_r.append(got_keys % N)
+
+        # ---------- 枚举：稀疏用户 + 拒绝采样轮数用尽仍不足的用户 ----------
+        have = np.bincount(out_u[0], minlength=len(uidx)) if out_u else np.zeros(len(uidx), dtype=np.int64)
+        rest = np.flatnonzero((~dense & (n_neg > 0)) | (dense & (have < n_neg)))
+        if len(rest) and out_u:
+            # 已部分接受的用户丢弃拒绝采样结果，统一枚举，避免重复
+            drop = np.isin(out_u[0], rest)
+            out_u[0], out_r[0] = out_u[0][~drop], out_r[0][~drop]
+        for i in rest:
+            cand = np.flatnonzero(_disjoint(self.masks, umask[i]))
+            watched = hist.rows[hist.indptr[uidx[i]]:hist.indptr[uidx[i] + 1]]
+            cand = np.setdiff1d(cand, watched, assume_unique=True)
+            pick = rng.choice(cand, min(int(n_neg[i]), len(cand)), replace=False)
+            out_u.append(np.full(len(pick), i, dtype=np.int64))
+            out_r.append(pick)
+
+        if not out_u:
+            return _EMPTY, _EMPTY
+        return uidx[np.concatenate(out_u)], np.concatenate(out_r)
+
+
+# --------------------------------------------------------------------------- #
+#               按需负采样策略（在 DataLoader 的 collate 里逐 batch 抽取）       #
+# --------------------------------------------------------------------------- #
+# 统一接口：draw(pos, pos_rows, n, rng) -> (B, n) catalog 行号
+#   pos      : batch 内每个正样本用户在 UserHistory 中的位置（-1 = 无历史）
+#   pos_rows : batch 内正样本电影的行号
+# 已看过的抽样结果由 NegativeSamplingCollate 统一剔除。
+class UniformNegatives:
+    name = "uniform"
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+
+    def draw(self, pos, pos_rows, n, rng):
+        return rng.integers(0, self.n_rows, (len(pos), n))
+
+    def refresh(self, model) -> None:
+        pass
+
+
+class PopularityNegatives(UniformNegatives):
+    """ P(movie) ∝ (观看次数 + 1) ^ alpha；alpha=0 退化为均匀，alpha=1 按热度 """
+    name = "popularity"
+
+    def __init__(self, history: UserHistory, alpha: float = 0.75):
+        super().__init__(history.n_rows)
+        weights = (np.bincount(history.rows, minlength=history.n_rows) + 1.0) ** alpha
+        self._cdf = np.cumsum(weights)
+
+    def draw(self, pos, pos_rows, n, rng):
+        u = rng.random((len(pos), n)) * self._cdf[-1]
+        return np.minimum(np.searchsorted(self._cdf, u, side="right"), self.n_rows - 1)
+
+
+class GenreDisjointNegatives(UniformNegatives):
+    """ 题材不重叠约束交给 NegativeSampler.draw；无历史的用户掩码为 0，即均匀采样 """
+    name = "genre"
+
+    def __init__(self, history: UserHistory, sampler: NegativeSampler, rounds: int = 4):
+        super().__init__(history.n_rows)
+        self.sampler = sampler
+        self.user_masks = history.genre_masks(sampler.masks)
+        self.rounds = rounds
+
+    def draw(self, pos, pos_rows, n, rng):
+        known = pos >= 0
+        if not known.any():
+            return rng.integers(0, self.n_rows, (len(pos), n))
+        umask = np.zeros((len(pos), self.sampler.masks.shape[1]), dtype=np.uint64)
+        umask[known] = self.user_masks[pos[known]]
+        return self.sampler.draw(umask, n, rng, self.rounds)
+
+
+class HardNegatives(UniformNegatives):
+    """
+    从当前双塔模型对该用户的 top-k 召回里抽负样本（mix 比例），其余均匀抽取。
+    refresh(model) 重新计算每个用户的 top-k 行号，训练时每个 epoch 调一次；
+    未 refresh 之前全部退化为均匀采样。需要 arch=dot 的双塔（item 向量可整表预计算）。
+    不在模型 user 词表里的用户（模型之后才注册）没有 top-k，一直走均匀采样；
+    不在 item 词表里的电影不会被选作难负样本。
+    """
+    name = "hard"
+
+    def __init__(self, history: UserHistory, movie_ids: np.ndarray,
+                 k: int = 200, mix: float = 0.5, chunk: int = 1024):
+        super().__init__(history.n_rows)
+        self.history = history
+        self.movie_ids = movie_ids
+        self.k = min(k, history.n_rows)
+        self.mix = mix
+        self.chunk = chunk
+        self._top = None                    # (U, k) 行号；未知用户整行为 -1
+        self._known = None                  # (U,) 用户是否在模型词表里
+
+    def refresh(self, model) -> None:
+        import torch
+        from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerDotModel
+
+        if not isinstance(model, TwoTowerDotModel):
+            raise ValueError("hard negatives need a dot-product two-tower (arch='dot')")
+        was_training = model.training
+        model.eval()
+        device = next(model.parameters()).device
+        with torch.no_grad():
+            ids = torch.from_numpy(self.movie_ids)
+            known_items = ids < model.movie_embedding.num_embeddings
+            items = torch.zeros(len(ids), model.item_tower[-1].out_features)
+            items[known_items] = model.item_vectors(ids[known_items].to(device)).cpu()
+            known = self.history.users < model.user_embedding.num_embeddings
+            who = np.flatnonzero(known)
+            top = np.full((len(known), self.k), -1, dtype=np.int64)
+            for s in range(0, len(who), self.chunk):
+                rows = who[s:s + self.chunk]
+                uvec = model.user_vectors(torch.from_numpy(self.history.users[rows]).to(device)).cpu()
+                scores = (uvec @ items.T).masked_fill_(~known_items, float("-inf"))
+                top[rows] = torch.topk(scores, self.k, dim=1).indices.numpy()
+        model.train(was_training)
+        self._top, self._known = top, known
+
+    def draw(self, pos, pos_rows, n, rng):
+        rows = super().draw(pos, pos_rows, n, rng)
+        if self._top is None:
+            return rows
+        ok = pos >= 0
+        ok[ok] = self._known[pos[ok]]
+        hard = (rng.random(rows.shape) < self.mix) & ok[:, None]
+        b, j = np.nonzero(hard)
+        rows[b, j] = self._top[pos[b], rng.integers(0, self.k, len(b))]
+        return rows
+
+
+class InBatchNegatives(UniformNegatives):
+    """ 共享负样本：用同一 batch 里其他正样本的电影作负样本（天然按热度分布） """
+    name = "inbatch"
+
+    def draw(self, pos, pos_rows, n, rng):
+        B = len(pos_rows)
+        if B < 2:
+            return super().draw(pos, pos_rows, n, rng)
+        other = (np.arange(B)[:, None] + rng.integers(1, B, (B, n))) % B
+        return pos_rows[other]
+
+
+NEG_STRATEGIES = ("uniform", "popularity", "genre", "hard", "inbatch")
+
+
+def build_strategy(name: str, catalog, history: UserHistory, alpha: float = 0.75,
+                   hard_k: int = 200, hard_mix: float = 0.5):
+    if name == "uniform":
+        return UniformNegatives(len(catalog))
+    if name == "popularity":
+        return PopularityNegatives(history, alpha)
+    if name == "genre":
+        return GenreDisjointNegatives(history, NegativeSampler.from_catalog(catalog))
+    if name == "hard":
+        return HardNegatives(history, catalog.movie_ids, k=hard_k, mix=hard_mix)
+    if name == "inbatch":
+        return InBatchNegatives(len(catalog))
+    raise ValueError(f"unknown negative strategy {name!r}, expected one of {NEG_STRATEGIES}")
+
+
+# --------------------------------------------------------------------------- #
+#                            DataLoader 接入                                  #
+# --------------------------------------------------------------------------- #
+class PositivePairs:
+    """ 只存正样本 (user_id, movie_id)；负样本由 collate 按 batch 现抽，不落地 """
+
+    def __init__(self, user_ids, movie_ids):
+        self.users = np.asarray(user_ids, dtype=np.int64)
+        self.movies = np.asarray(movie_ids, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __getitem__(self, idx):
+        return self.users[idx], self.movies[idx]
+
+
+class NegativeSamplingCollate:
+    """
+    DataLoader(PositivePairs(...), batch_size=B, collate_fn=NegativeSamplingCollate(...))
+    每个 batch = B 个正样本 + 至多 B × neg_ratio 个负样本；抽到已看过的电影重抽一次，仍命中则丢弃。
+
+    featurize(user_ids, movie_ids, labels) 决定输出格式，默认 (users, movies, labels) 三个 tensor。
+    随机数按 (seed, epoch, worker id) 派生：每个 epoch 调 set_epoch() 换一批负样本，多 worker 也可复现。
+    """
+
+    def __init__(self, strategy, history: UserHistory, catalog, neg_ratio: int = 1,
+                 seed: int = 42, featurize=None):
+        self.strategy = strategy
+        self.history = history
+        self.catalog = catalog
+        self.neg_ratio = neg_ratio
+        self.seed = seed
+        self.featurize = featurize
+        self.epoch = 0
+        self._rng = None
+        self._rng_key = None
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _generator(self):
+        from torch.utils.data import get_worker_info
+        info = get_worker_info()
+        key = (self.epoch, info.id if info is not None else -1)
+        if key != self._rng_key:
+            self._rng = np.random.default_rng([self.seed, key[0], key[1] + 1])
+            self._rng_key = key
+        return self._rng
+
+    def __call__(self, batch):
+        import torch
+
+        rng = self._generator()
+        pairs = np.asarray(batch, dtype=np.int64).reshape(-1, 2)
+        users, movies = pairs[:, 0], pairs[:, 1]
+        pos = self.history.positions(users)
+        pos_rows = self.catalog.rows(movies).astype(np.int64)
+
+        neg_rows = self.strategy.draw(pos, np.maximum(pos_rows, 0), self.neg_ratio, rng)
+        hit = self.history.seen(pos[:, None], neg_rows)
+        if hit.any():
+            neg_rows[hit] = rng.integers(0, len(self.catalog), int(hit.sum()))
+            hit = self.history.seen(pos[:, None], neg_rows)
+        keep = ~hit.ravel()
+
+        u = np.concatenate([users, np.repeat(users, self.neg_ratio)[keep]])
+        m = np.concatenate([movies, self.catalog.movie_ids[neg_rows.ravel()[keep]]])
+        y = np.concatenate([np.ones(len(users), dtype=np.float32),
+                            np.zeros(int(keep.sum()), dtype=np.float32)])
+        if self.featurize is not None:
+            return self.featurize(u, m, y)
+        return torch.from_numpy(u), torch.from_numpy(m), torch.from_numpy(y)
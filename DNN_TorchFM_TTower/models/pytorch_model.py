@@ -1,5 +1,8 @@
+import inspect
+
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 class TwoTowerMLPModel(nn.Module):
     def __init__(self, num_users, num_movies, embedding_dim=32, hidden_dim=64):
@@ -22,3 +25,70 @@ class TwoTowerMLPModel(nn.Module):
         x = self.dropout(x)
         logit = self.fc2(x).squeeze(1)              # (batch_size,)
         return logit  # raw logits (BCEWithLogitsLoss)
+
+
+class TwoTowerDotModel(nn.Module):
+    """
+    真正的双塔：user tower / item tower 互不相连，打分 = 两塔输出的点积 (或 cosine)。
+    item 向量与用户无关，可以整表预计算缓存，召回变成一次矩阵 × 向量。
+    """
+    def __init__(self, num_users, num_movies, embedding_dim=32, hidden_dim=64,
+                 out_dim=32, score="dot", temperature=0.1):
+        super(TwoTowerDotModel, self).__init__()
+        if score not in ("dot", "cosine"):
+            raise ValueError(f"score must be 'dot' or 'cosine', got {score!r}")
+        self.score = score
+        self.temperature = temperature
+
+        self.user_embedding = nn.Embedding(num_users + 1, embedding_dim)
+        self.movie_embedding = nn.Embedding(num_movies + 1, embedding_dim)
+        self.user_tower = self._tower(embedding_dim, hidden_dim, out_dim)
+        self.item_tower = self._tower(embedding_dim, hidden_dim, out_dim)
+
+    @staticmethod
+    def _tower(in_dim, hidden_dim, out_dim):
+        return nn.Sequential(
+            nn.Linear(in_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(hidden_dim, out_dim),
+        )
+
+    def _finish(self, x):
+        return F.normalize(x, dim=-1) if self.score == "cosine" else x
+
+    def user_vectors(self, user_ids):
+        return self._finish(self.user_tower(self.user_embedding(user_ids)))    # (B, out_dim)
+
+    def item_vectors(self, movie_ids):
+        return self._finish(self.item_tower(self.movie_embedding(movie_ids)))  # (B, out_dim)
+
+    def score_vectors(self, user_vec, item_vec):
+        """ (B, D) × (B, D) -> (B,)；也可 (D,) 与 (N, D) 广播 """
+        logit = (user_vec * item_vec).sum(dim=-1)
+        if self.score == "cosine":
+            logit = logit / self.temperature   # cosine ∈ [-1, 1]，放大后再进 sigmoid
+        return logit
+
+    def forward(self, user_ids, movie_ids):
+        return self.score_vectors(self.user_vectors(user_ids),
+                                  self.item_vectors(movie_ids))  # raw logits (BCEWithLogitsLoss)
+
+
+TWO_TOWER_ARCHS = {
+    "mlp": TwoTowerMLPModel,
+    "dot": TwoTowerDotModel,
+}
+
+
+def build_two_tower(arch="mlp", **kwargs):
+    """
+    按 checkpoint meta 里的 arch 重建网络；旧 checkpoint 没有 arch 字段，视为 mlp。
+    meta 中与网络结构无关的字段会被忽略。
+    """
+    try:
+        cls = TWO_TOWER_ARCHS[arch]
+    except KeyError:
+        raise ValueError(f"unknown two-tower arch {arch!r}") from None
+    params = inspect.signature(cls.__init__).parameters
+    return cls(**{k: v for k, v in kwargs.items() if k in params})
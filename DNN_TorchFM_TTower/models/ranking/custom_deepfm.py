@@ -3,7 +3,11 @@
 支持:
   • sparse_x : LongTensor (batch, num_sparse_fields)
   • dense_x  : FloatTensor (batch, num_dense_fields)
+  • bags     : 多值字段 (genres / keywords / cast …)，每个字段一对 CSR 风格的
+               (indices, offsets)，nn.EmbeddingBag 按 offsets 做 mean 池化，无需 padding
 输出 raw logit (BCEWithLogitsLoss 对应)
+
+bag_dims 为空时结构、参数名与旧版完全一致，旧 checkpoint 可直接加载
 """
 
 import torch
@@ -42,6 +46,17 @@ class FeaturesEmbedding(nn.Module):
         return self.embedding(x)          # (B, F, D)
 
 
+class FeaturesBag(nn.Module):
+    """ 一个多值字段：二阶 / Deep 共用的池化向量 + 一阶权重，均为 mean 池化；空 bag 输出 0 """
+    def __init__(self, vocab_size, embed_dim):
+        super().__init__()
+        self.embedding = nn.EmbeddingBag(vocab_size, embed_dim, mode="mean")
+        self.linear = nn.EmbeddingBag(vocab_size, 1, mode="mean")
+
+    def forward(self, indices, offsets):
+        return self.embedding(indices, offsets), self.linear(indices, offsets)   # (B, D), (B, 1)
+
+
 class FactorizationMachine(nn.Module):
     """ FM 二阶交叉项 Σ⟨v_i, v_j⟩ """
     def forward(self, embed_x):
@@ -73,28 +88,45 @@ class DeepFM(nn.Module):
                  num_dense,           # int
                  embed_dim=16,
                  mlp_dims=(128, 64),
-                 dropout=0.2):
+                 dropout=0.2,
+                 bag_dims=None):      # {字段名: vocab_size}，多值字段
         super().__init__()
         self.num_dense = num_dense
+        self.bag_dims = dict(bag_dims or {})
+        self.bag_fields = list(self.bag_dims)
 
         self.linear_sparse = FeaturesLinear(field_dims)
         self.linear_dense  = DenseLinear(num_dense)
 
         self.embedding = FeaturesEmbedding(field_dims, embed_dim)
         self.fm = FactorizationMachine()
+        if bag_dims:
+            self.bags = nn.ModuleDict({name: FeaturesBag(v, embed_dim)
+                                       for name, v in bag_dims.items()})
 
-        dnn_input_dim = len(field_dims) * embed_dim + num_dense
+        dnn_input_dim = (len(field_dims) + len(self.bag_fields)) * embed_dim + num_dense
         self.mlp = MLP(dnn_input_dim, mlp_dims, dropout)
         self.mlp_out = nn.Linear(mlp_dims[-1], 1)
 
-    def forward(self, sparse_x, dense_x):
+    def forward(self, sparse_x, dense_x, bags=None):
         """
         sparse_x : LongTensor (B, F_s)
         dense_x  : FloatTensor(B, F_d)
+        bags     : 与 bag_fields 对齐的 [(indices, offsets), …]；None 时按空 bag 处理
         """
         embed_x = self.embedding(sparse_x)           # (B, Fs, D)
 
         linear_term = self.linear_sparse(sparse_x) + self.linear_dense(dense_x)
+        if self.bag_fields:
+            if bags is None:
+                empty = sparse_x.new_empty(0)
+                bags = [(empty, sparse_x.new_zeros(sparse_x.size(0)))] * len(self.bag_fields)
+            pooled = []
+            for name, (indices, offsets) in zip(self.bag_fields, bags):
+                emb, lin = self.bags[name](indices, offsets)
+                pooled.append(emb)
+                linear_term = linear_term + lin
+            embed_x = torch.cat([embed_x, torch.stack(pooled, dim=1)], dim=1)   # (B, Fs+Fb, D)
         fm_term     = self.fm(embed_x)               # (B, 1)
 
         dnn_input   = torch.cat([embed_x.reshape(embed_x.size(0), -1),
@@ -3,95 +3,94 @@
 """
 把数据库字段整理成 DeepCTR-Torch 需要的 DataFrame
 仅使用 *现有* 表：users · movies · movie_genre · view_history
+静态特征 (genre · vote_average · popularity · age) 统一取自特征仓库
+(models/ranking/feature_store.py)，训练与推断按 id 直接 gather，保证一致
 """
 
-from collections import defaultdict
 from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
+import torch
 
-from DNN_TorchFM_TTower.models.db import fetchall_dict, fetchone_dict
+from DNN_TorchFM_TTower.models.ranking.feature_store import (
+    DENSE_COLS,
+    SPARSE_COLS,
+    FeatureSnapshot,
+    features_for,
+)
+from DNN_TorchFM_TTower.models.streaming import load_interactions
 
 
 # ------------------------------------------------------------------- #
-#                        基础静态特征拉取                             #
+#             按 batch 现算特征（配合 DataLoader 内负采样）              #
 # ------------------------------------------------------------------- #
-def _get_movie_features() -> pd.DataFrame:
-    """
-    movie_id | genre_id | vote_average | popularity
-    若一部电影有多 genre，只取第一条；可后续改成多值特征
-    """
-    # genre
-    rows = fetchall_dict("""
-        SELECT movie_id, genre_id
-        FROM movie_genre
-        ORDER BY movie_id, genre_id
-    """)
-    first_genre = {}
-    for r in rows:
-        first_genre.setdefault(r["movie_id"], r["genre_id"])
-
-    # movies main table
-    rows = fetchall_dict("""
-        SELECT id AS movie_id,
-               vote_average,
-               popularity
-        FROM movies
-    """)
-    for r in rows:
-        r["genre_id"] = first_genre.get(r["movie_id"], 0)
-    return pd.DataFrame(rows)
-
-
-def _get_user_features() -> pd.DataFrame:
-    """
-    user_id | age
-    """
-    rows = fetchall_dict("SELECT id AS user_id, COALESCE(age, 0) AS age FROM users")
-    return pd.DataFrame(rows)
+def get_positive_pairs() -> Tuple[np.ndarray, np.ndarray]:
+    """ view_history 全部 (user_id, movie_id)，label = 1；COPY 流式解析，无逐行 dict """
+    pairs = load_interactions()
+    return pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
 
 
-# ------------------------------------------------------------------- #
-#                       训练数据构造 (label)                           #
-# ------------------------------------------------------------------- #
-def build_training_df(neg_ratio: int = 1) -> pd.DataFrame:
-    """
-    label = 1 -> view_history 里的正样本
-    label = 0 -> 随机负采样 (未观看)
-    """
-    pos_rows = fetchall_dict("SELECT user_id, movie_id FROM view_history")
-    if not pos_rows:                       # 数据不足
-        return pd.DataFrame()
+def bag_tensors(bags) -> list[tuple[torch.Tensor, torch.Tensor]]:
+    """ featurize_bags 的 numpy (indices, offsets) → EmbeddingBag 输入 """
+    return [(torch.from_numpy(i), torch.from_numpy(o)) for i, o in bags]
 
-    pos_df = pd.DataFrame(pos_rows)
-    pos_df["label"] = 1
 
-    # Negative samples ------------------------------------------------
-    all_movies = {r["movie_id"] for r in fetchall_dict("SELECT id AS movie_id FROM movies")}
-    user_pos = defaultdict(set)
-    for r in pos_rows:
-        user_pos[r["user_id"]].add(r["movie_id"])
+class RecallScorer:
+    """
+    冻结的双塔对任意 (user, movie) 对打分：sigmoid(logit)，与在线召回给精排的 recall_score 同尺度。
+    超出双塔词表的 id（比召回 checkpoint 新）得 0，与“无召回分”一致
+    """
 
-    import random
-    neg_records = []
-    for u, watched in user_pos.items():
-        cand = list(all_movies - watched)
-        k = min(len(cand), neg_ratio * len(watched))
-        for m in random.sample(cand, k):
-            neg_records.append({"user_id": u, "movie_id": m, "label": 0})
-    neg_df = pd.DataFrame(neg_records)
+    def __init__(self, model):
+        self.model = model.eval()
+        for p in self.model.parameters():
+            p.requires_grad_(False)
+        self.num_users = model.user_embedding.num_embeddings
+        self.num_movies = model.movie_embedding.num_embeddings
+
+    def __call__(self, user_ids, movie_ids) -> np.ndarray:
+        u = torch.as_tensor(np.asarray(user_ids, dtype=np.int64))
+        m = torch.as_tensor(np.asarray(movie_ids, dtype=np.int64))
+        ok = (u < self.num_users) & (m < self.num_movies)
+        out = torch.zeros(len(u))
+        if ok.any():
+            with torch.no_grad():
+                out[ok] = torch.sigmoid(self.model(u[ok], m[ok]).flatten())
+        return out.numpy()
+
+
+class TrainingFeatures:
+    """
+    NegativeSamplingCollate 的 featurize：(user_ids, movie_ids, labels) → (Xs, Xd, y, bags)
+    列与推断 (build_infer_batch) 相同，即 SPARSE_COLS / DENSE_COLS：
+        sparse = user_id · movie_id · genre_id
+        dense  = recall_score · vote_average · popularity · age
+        bags   = bag_dims 中各多值字段的 (indices, offsets)，无多值字段时为 []
+    特征取自 FeatureSnapshot（在线仓库或由训练快照构建），与推断完全同源；
+    recall_score 由 recall_scorer（冻结双塔）现算，未给出时为 0；
+    preprocess (DensePreprocessor) 给出时对稠密列做与推断相同的变换
+    """
 
-    data_df = pd.concat([pos_df, neg_df], ignore_index=True)
+    def __init__(self, features: FeatureSnapshot, bag_dims: dict | None = None,
+                 recall_scorer=None, preprocess=None):
+        self.features = features
+        self.bag_dims = bag_dims or {}
+        self.recall_scorer = recall_scorer
+        self.preprocess = preprocess
 
-    # 加入静态特征 ------------------------------------------------------
-    movies_df = _get_movie_features()
-    users_df = _get_user_features()
-    df = data_df.merge(movies_df, on="movie_id", how="left") \
-                .merge(users_df, on="user_id", how="left")
+    def raw_dense(self, user_ids, movie_ids) -> np.ndarray:
+        """ 变换前的稠密列，供拟合 DensePreprocessor """
+        recall = self.recall_scorer(user_ids, movie_ids) if self.recall_scorer is not None else None
+        return self.features.featurize(user_ids, movie_ids, recall)[1]
 
-    # 若有缺失，用 0 填充
-    df.fillna(0, inplace=True)
-    return df
+    def __call__(self, user_ids, movie_ids, labels):
+        recall = self.recall_scorer(user_ids, movie_ids) if self.recall_scorer is not None else None
+        xs, xd = self.features.featurize(user_ids, movie_ids, recall)
+        if self.preprocess is not None:
+            self.preprocess.transform(xd)
+        bags = bag_tensors(self.features.featurize_bags(movie_ids, self.bag_dims))
+        return torch.from_numpy(xs), torch.from_numpy(xd), torch.from_numpy(labels), bags
 
 
 # ------------------------------------------------------------------- #
@@ -103,24 +102,31 @@ def build_infer_df(user_id: int,
                    ) -> pd.DataFrame:
     """
     组装推断时特征。包含 recall_score 列！
+    特征从特征仓库按 id gather，不再整表读 users / movies 再 merge；缺失填 0
+    """
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    user_ids = np.full(len(movie_ids), user_id, dtype=np.int64)
+    xs, xd = features_for([user_id]).featurize(user_ids, movie_ids,
+                                               np.asarray(recall_scores, dtype=np.float32))
+    return pd.DataFrame({**{c: xs[:, j] for j, c in enumerate(SPARSE_COLS)},
+                         **{c: xd[:, j] for j, c in enumerate(DENSE_COLS)}})
+
+
+def build_infer_batch(user_ids: np.ndarray,
+                      movie_ids: np.ndarray,
+                      recall_scores: np.ndarray,
+                      bag_dims: dict | None = None,
+                      preprocess=None
+                      ) -> Tuple[torch.Tensor, torch.Tensor, list]:
+    """
+    多用户拼接后的推断特征，逐行 (user_id, movie_id, recall_score)：
+    返回 (Xs, Xd, bags)，列与 SPARSE_COLS / DENSE_COLS 一致，全部取自特征仓库；
+    preprocess 为 ranker checkpoint 里的 DensePreprocessor
     """
-    movies_df = _get_movie_features()
-    users_df  = _get_user_features()
-
-    # 若用户不存在，补 age=0
-    if user_id not in users_df["user_id"].values:
-        users_df = pd.concat([users_df,
-                              pd.DataFrame([{"user_id": user_id, "age": 0}])])
-
-    infer_df = pd.DataFrame({
-        "user_id":      user_id,
-        "movie_id":     movie_ids,
-        "recall_score": recall_scores,
-    })
-
-    infer_df = (infer_df
-                .merge(movies_df, on="movie_id", how="left")
-                .merge(users_df,  on="user_id", how="left"))
-
-    infer_df.fillna(0, inplace=True)
-    return infer_df
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    features = features_for(user_ids)
+    xs, xd = features.featurize(user_ids, movie_ids, np.asarray(recall_scores, dtype=np.float32))
+    if preprocess is not None:
+        preprocess.transform(xd)
+    bags = bag_tensors(features.featurize_bags(movie_ids, bag_dims or {}))
+    return torch.from_numpy(xs), torch.from_numpy(xd), bags
@@ -0,0 +1,396 @@
+# models/ranking/feature_store.py
+"""
+精排特征仓库：按 id 直接索引的稠密数组，训练与推断共用同一份
+
+    movie_genre[movie_id]   first genre（与 catalog 一致：最小 genre_id，0 = 无）
+    movie_vote[movie_id]    vote_average
+    movie_pop[movie_id]     popularity
+    user_age[user_id]       age（0 = 缺失）
+    bags[name]              多值字段的 CSR 列：movie_id → 全部 genre / keyword / cast id
+                            (indptr 按 movie_id 直接索引)，喂给 DeepFM 的 EmbeddingBag
+
+构造特征 = 纯数组 gather (arr[ids])，越界 / 不存在的 id 取 0，不再每次请求整表
+读 movies / movie_genre / users 再 pandas merge。
+多值字段由 BAG_SOURCES 定义，加载哪些由 RANKING_BAG_FIELDS 决定；
+genres 取自 catalog（movie_genre），其余按 SQL 读入，随全量重载刷新。
+
+刷新策略（与 catalog 相同的思路）：
+  • 电影列直接取自 catalog 快照；catalog 版本变化时重新 scatter，不访问数据库
+  • 用户列：后台线程每 FEATURE_STORE_CHECK_INTERVAL 秒查 MAX(id) / COUNT(*)，
+    只有新注册 → 增量追加 id > max_user_id 的行；其它变化或超过 FEATURE_STORE_TTL → 全量重载
+  • 推断时遇到比仓库更新的 user_id（刚注册的用户）→ 同步做一次增量追加，
+    按 FEATURE_STORE_USER_REFRESH_INTERVAL 限流；限流期间未知用户的特征为 0
+  • 新快照构建完成后整体替换引用，读者永远看到完整的一版
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+
+from DNN_TorchFM_TTower.models.catalog import get_catalog
+from DNN_TorchFM_TTower.models.config import (
+    FEATURE_STORE_TTL, FEATURE_STORE_CHECK_INTERVAL, FEATURE_STORE_USER_REFRESH_INTERVAL,
+    RANKING_BAG_FIELDS,
+)
+from DNN_TorchFM_TTower.models.db import fetchone_dict, get_pool
+
+SPARSE_COLS = ["user_id", "movie_id", "genre_id"]
+DENSE_COLS  = ["recall_score", "vote_average", "popularity", "age"]
+
+# 多值字段 → (movie_id, value_id) 来源；None = 取 catalog.genre_pairs()
+BAG_SOURCES = {
+    "genres":   None,
+    "keywords": "SELECT movie_id, keyword_id FROM movie_keyword",
+    "cast":     "SELECT movie_id, actor_id FROM casting",
+}
+
+
+def _gather(arr: np.ndarray, ids: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """ arr[ids]，越界 id 取 0；给出 out 时直接写入（可为二维缓冲的一列） """
+    if len(ids) and int(ids.max()) < len(arr) and int(ids.min()) >= 0:
+        return np.take(arr, ids, out=out)
+    if out is None:
+        out = np.zeros(len(ids), dtype=arr.dtype)
+    else:
+        out[:] = 0
+    ok = (ids >= 0) & (ids < len(arr))
+    out[ok] = arr[ids[ok]]
+    return out
+
+
+class CSRColumn:
+    """
+    movie_id → 若干 value id 的 CSR 存储：
+        vals[ptr[m] : ptr[m + 1]]   = 电影 m 的全部值（升序）
+    gather(ids) 直接产出 EmbeddingBag 需要的 (indices, offsets)
+    """
+
+    def __init__(self, ptr: np.ndarray, vals: np.ndarray):
+        self.ptr = ptr                      # int64, len = max_movie_id + 2
+        self.vals = vals                    # int64
+
+    @classmethod
+    def from_pairs(cls, movie_ids, values, max_id: int) -> "CSRColumn":
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        keep = (movie_ids >= 0) & (movie_ids <= max_id)
+        movie_ids, values = movie_ids[keep], values[keep]
+        order = np.lexsort((values, movie_ids))
+        ptr = np.zeros(max_id + 2, dtype=np.int64)
+        np.cumsum(np.bincount(movie_ids, minlength=max_id + 1), out=ptr[1:])
+        return cls(ptr, values[order])
+
+    @property
+    def vocab_size(self) -> int:
+        """ 最大 value id + 2（与 sparse 字段一样预留 padding / OOV） """
+        return int(self.vals.max()) + 2 if len(self.vals) else 2
+
+    def gather(self, movie_ids: np.ndarray, vocab_size: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        每部电影一个 bag → (indices, offsets)；不存在的电影为空 bag。
+        给出 vocab_size 时丢弃 >= vocab_size 的值（比模型词表新的 genre 等），当作缺失
+        """
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        ok = (ids >= 0) & (ids < len(self.ptr) - 1)
+        safe = np.where(ok, ids, 0)
+        starts = np.where(ok, self.ptr[safe], 0)
+        lengths = np.where(ok, self.ptr[safe + 1], 0) - starts
+        offsets = np.zeros(len(ids), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        total = int(lengths.sum())
+        indices = self.vals[np.repeat(starts - offsets, lengths) + np.arange(total)]
+        if vocab_size is not None and total and int(indices.max()) >= vocab_size:
+            keep = indices < vocab_size
+            rows = np.repeat(np.arange(len(ids)), lengths)
+            offsets[1:] = np.cumsum(np.bincount(rows[keep], minlength=len(ids)))[:-1]
+            indices = indices[keep]
+        return indices, offsets
+
+
+# --------------------------------------------------------------------------- #
+#                                 快 照                                        #
+# --------------------------------------------------------------------------- #
+class FeatureSnapshot:
+    """ 只读；可 pickle（DataLoader worker 共享） """
+
+    def __init__(self, movie_genre: np.ndarray, movie_vote: np.ndarray, movie_pop: np.ndarray,
+                 user_age: np.ndarray, catalog_version: int = 0, user_count: int = 0,
+                 bags: dict[str, CSRColumn] | None = None):
+        self.movie_genre = movie_genre      # int64
+        self.movie_vote = movie_vote        # float32
+        self.movie_pop = movie_pop          # float32
+        self.user_age = user_age            # float32
+        self.bags = bags or {}
+        self.catalog_version = catalog_version
+        self.user_count = user_count
+        self.loaded_at = time.time()
+
+    @property
+    def max_user_id(self) -> int:
+        return len(self.user_age) - 1
+
+    @staticmethod
+    def _movie_columns(catalog) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = catalog.max_id + 1
+        genre = np.zeros(n, dtype=np.int64)
+        vote = np.zeros(n, dtype=np.float32)
+        pop = np.zeros(n, dtype=np.float32)
+        genre[catalog.movie_ids] = catalog.genre_id
+        vote[catalog.movie_ids] = catalog.vote_average
+        pop[catalog.movie_ids] = catalog.popularity
+        return genre, vote, pop
+
+    @classmethod
+    def build(cls, catalog, user_age: np.ndarray, user_count: int = 0,
+              bag_fields=RANKING_BAG_FIELDS) -> "FeatureSnapshot":
+        """
+        catalog 快照 + user_id → age 稠密数组（可来自数据库或训练快照）；
+        genres 以外的多值字段从数据库读取
+        """
+        bags = {name: _load_bag(name, catalog) for name in bag_fields}
+        return cls(*cls._movie_columns(catalog), np.asarray(user_age, dtype=np.float32),
+                   catalog_version=catalog.version, user_count=user_count, bags=bags)
+
+    def with_catalog(self, catalog) -> "FeatureSnapshot":
+        """ 电影列重新 scatter；genres 随 catalog 重建，SQL 来源的多值字段留到下次全量重载 """
+        bags = dict(self.bags)
+        if "genres" in bags:
+            bags["genres"] = _load_bag("genres", catalog)
+        snap = FeatureSnapshot(*self._movie_columns(catalog), self.user_age,
+                               catalog_version=catalog.version, user_count=self.user_count,
+                               bags=bags)
+        snap.loaded_at = self.loaded_at
+        return snap
+
+    def with_bags(self, catalog, bag_fields) -> "FeatureSnapshot":
+        """ 补载尚未加载的多值字段，返回新快照（在线仓库只加载 RANKING_BAG_FIELDS，训练可能要更多） """
+        missing = [name for name in bag_fields if name not in self.bags]
+        if not missing:
+            return self
+        bags = {**self.bags, **{name: _load_bag(name, catalog) for name in missing}}
+        snap = FeatureSnapshot(self.movie_genre, self.movie_vote, self.movie_pop, self.user_age,
+                               catalog_version=self.catalog_version, user_count=self.user_count,
+                               bags=bags)
+        snap.loaded_at = self.loaded_at
+        return snap
+
+    def with_users(self, user_ids: np.ndarray, ages: np.ndarray) -> "FeatureSnapshot":
+        """ 追加 id > max_user_id 的新用户，返回新快照 """
+        if not len(user_ids):
+            return self
+        user_age = np.zeros(max(int(user_ids.max()) + 1, len(self.user_age)), dtype=np.float32)
+        user_age[:len(self.user_age)] = self.user_age
+        user_age[user_ids] = ages
+        snap = FeatureSnapshot(self.movie_genre, self.movie_vote, self.movie_pop, user_age,
+                               catalog_version=self.catalog_version,
+                               user_count=self.user_count + len(user_ids), bags=self.bags)
+        snap.loaded_at = self.loaded_at     # TTL 从上次全量重载算起
+        return snap
+
+    # ------------------------------------------------------------------ #
+    #                               构造特征                               #
+    # ------------------------------------------------------------------ #
+    def featurize(self, user_ids, movie_ids, recall_scores=None,
+                  out: tuple[np.ndarray, np.ndarray] | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        逐行 (user_id, movie_id[, recall_score]) → (Xs int64 [N,3], Xd float32 [N,4])
+        列顺序为 SPARSE_COLS / DENSE_COLS；recall_scores 为 None 时该列为 0。
+        user_ids 可为标量（单用户）；out=(xs, xd) 时写入其前 N 行并返回这两个视图
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        n = len(movie_ids)
+        if out is None:
+            xs = np.empty((n, len(SPARSE_COLS)), dtype=np.int64)
+            xd = np.empty((n, len(DENSE_COLS)), dtype=np.float32)
+        else:
+            xs, xd = out[0][:n], out[1][:n]
+        xs[:, 0] = user_ids
+        xs[:, 1] = movie_ids
+        _gather(self.movie_genre, movie_ids, out=xs[:, 2])
+
+        xd[:, 0] = 0.0 if recall_scores is None else recall_scores
+        _gather(self.movie_vote, movie_ids, out=xd[:, 1])
+        _gather(self.movie_pop, movie_ids, out=xd[:, 2])
+        if user_ids.ndim == 0:
+            xd[:, 3] = _gather(self.user_age, user_ids.reshape(1))[0]
+        else:
+            _gather(self.user_age, user_ids, out=xd[:, 3])
+        return xs, xd
+
+    def featurize_bags(self, movie_ids, bag_dims: dict) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        与 bag_dims（模型的 {字段名: vocab_size}）对齐的 [(indices, offsets), …]；
+        超出模型词表的值丢弃。仓库没加载的字段抛 KeyError（检查 RANKING_BAG_FIELDS）
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        out = []
+        for name, vocab in bag_dims.items():
+            if name not in self.bags:
+                raise KeyError(f"bag field {name!r} not loaded; add it to RANKING_BAG_FIELDS")
+            out.append(self.bags[name].gather(movie_ids, vocab))
+        return out
+
+
+# --------------------------------------------------------------------------- #
+#                              数 据 读 取                                     #
+# --------------------------------------------------------------------------- #
+def _load_bag(name: str, catalog) -> CSRColumn:
+    try:
+        source = BAG_SOURCES[name]
+    except KeyError:
+        raise ValueError(f"unknown bag field {name!r}, expected one of {tuple(BAG_SOURCES)}") from None
+    if source is None:
+        mids, vals = catalog.genre_pairs()
+    else:
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(source)
+                rows = cur.fetchall()
+        n = len(rows)
+        mids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        vals = np.fromiter((r[1] for r in rows), dtype=np.int64, count=n)
+    return CSRColumn.from_pairs(mids, vals, catalog.max_id)
+
+def _fetch_users(min_id: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """ id > min_id 的 (user_ids, ages)；普通 tuple cursor """
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, COALESCE(age, 0) FROM users WHERE id > %s", (min_id,))
+            rows = cur.fetchall()
+    n = len(rows)
+    return (np.fromiter((r[0] for r in rows), dtype=np.int64, count=n),
+            np.fromiter((r[1] for r in rows), dtype=np.float32, count=n))
+
+
+def load_user_ages() -> tuple[np.ndarray, int]:
+    """ (user_id → age 稠密数组, 用户数) """
+    ids, ages = _fetch_users()
+    out = np.zeros(int(ids.max()) + 1 if len(ids) else 1, dtype=np.float32)
+    out[ids] = ages
+    return out, len(ids)
+
+
+def load_features() -> FeatureSnapshot:
+    ages, count = load_user_ages()
+    return FeatureSnapshot.build(get_catalog(), ages, user_count=count)
+
+
+# --------------------------------------------------------------------------- #
+#                         进程级缓存 + 后台刷新                                #
+# --------------------------------------------------------------------------- #
+class FeatureStore:
+    def __init__(self, ttl: float = FEATURE_STORE_TTL,
+                 check_interval: float = FEATURE_STORE_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshot: FeatureSnapshot | None = None
+        self._load_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._users_checked_at = float("-inf")     # 上次 refresh_users 查库的时刻 (monotonic)
+
+    def get(self) -> FeatureSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._snapshot = load_features()
+                    self.start()
+                snap = self._snapshot
+        cat = get_catalog()
+        if cat.version != snap.catalog_version:
+            # 电影列只依赖 catalog，重新 scatter 即可（无数据库访问）
+            with self._load_lock:
+                snap = self._snapshot
+                if cat.version != snap.catalog_version:
+                    snap = self._snapshot = snap.with_catalog(cat)
+        return snap
+
+    def refresh_users(self, min_interval: float = 0.0) -> bool:
+        """
+        增量追加新注册用户；返回是否发生了替换。
+        距上次查库不足 min_interval 秒时直接返回 False（请求路径用：客户端给出不存在的
+        大 user_id 时不会每个请求都查一次库，期间这些用户按缺失特征 0 处理）
+        """
+        if time.monotonic() - self._users_checked_at < min_interval:
+            return False
+        with self._load_lock:
+            old = self._snapshot
+            if old is None or time.monotonic() - self._users_checked_at < min_interval:
+                return False
+            self._users_checked_at = time.monotonic()
+            ids, ages = _fetch_users(min_id=old.max_user_id)
+            if not len(ids):
+                return False
+            self._snapshot = old.with_users(ids, ages)
+        return True
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        必要时重新加载并原子替换；返回是否发生了替换
+          • 只有新注册用户 → 增量追加
+          • 其它变化 / TTL 到期 / force → 全量重载
+        """
+        with self._load_lock:
+            old = self._snapshot
+            if old is None or force or time.time() - old.loaded_at > self.ttl:
+                self._snapshot, mode = load_features(), "full"
+            else:
+                row = fetchone_dict("SELECT MAX(id) AS m, COUNT(*) AS n FROM users")
+                max_id, count = row["m"] or 0, row["n"]
+                if max_id == old.max_user_id and count == old.user_count:
+                    return False
+                new, mode = None, "full"
+                if max_id > old.max_user_id:
+                    ids, ages = _fetch_users(min_id=old.max_user_id)
+                    if old.user_count + len(ids) == count:
+                        new, mode = old.with_users(ids, ages), "incremental"
+                self._snapshot = new if new is not None else load_features()
+            new = self._snapshot
+        print(f"[feature_store] reloaded ({mode}, {new.user_count} users, "
+              f"catalog v{new.catalog_version})")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:          # 刷新失败时继续沿用旧快照
+                print(f"[feature_store] refresh failed: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="feature-store-refresh",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_STORE = FeatureStore()
+
+
+def get_features() -> FeatureSnapshot:
+    return _STORE.get()
+
+
+def refresh_features(force: bool = False) -> bool:
+    return _STORE.refresh(force=force)
+
+
+def features_for(user_ids) -> FeatureSnapshot:
+    """
+    推断用：有比仓库更新的 user_id（刚注册）时同步增量追加一次；
+    查库按 FEATURE_STORE_USER_REFRESH_INTERVAL 限流，其余请求直接用现有快照（未知用户特征为 0）
+    """
+    snap = _STORE.get()
+    if len(user_ids) and int(np.max(user_ids)) > snap.max_user_id:
+        if _STORE.refresh_users(min_interval=FEATURE_STORE_USER_REFRESH_INTERVAL):
+            snap = _STORE.get()
+    return snap
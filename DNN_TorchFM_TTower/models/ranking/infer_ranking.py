@@ -1,16 +1,29 @@
 # models/ranking/infer_ranking.py
 """
 用自定义 DeepFM 对召回候选精排
+
+单用户请求路径不经过 pandas：特征从特征仓库直接 gather 进预分配、可复用的
+sparse_x / dense_x 缓冲（每线程一份，容量不足时按 2 的幂扩容），一次前向后
+torch.topk 取 ids 与分数
 """
 
+import threading
+
 import numpy as np
 import torch
 
 from DNN_TorchFM_TTower.models.db import fetchone_dict
-from DNN_TorchFM_TTower.models.ranking.feature_engineer import build_infer_df
+from DNN_TorchFM_TTower.models.checkpoint import load_checkpoint
+from DNN_TorchFM_TTower.models.config import SAVE_DIR
+from DNN_TorchFM_TTower.models.registry import CheckpointRegistry
+from DNN_TorchFM_TTower.models.export import artifact_path, export_checkpoint, load_exported
+from DNN_TorchFM_TTower.models.ranking.feature_engineer import bag_tensors, build_infer_batch
+from DNN_TorchFM_TTower.models.ranking.feature_store import SPARSE_COLS, DENSE_COLS, features_for
 from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
+from DNN_TorchFM_TTower.models.ranking.preprocess import DensePreprocessor
+from DNN_TorchFM_TTower.models.topk import topk_indices, topk_tensor
 
-MODEL_PATH = "saved_model/deepfm_ranker.pt"
+MODEL_PATH = SAVE_DIR / "deepfm_ranker.pt"
 
 
 def _vocab_sizes():
@@ -20,42 +33,190 @@ def _vocab_sizes():
     return [mu + 2, mm + 2, mg + 2]
 
 
-def _load_model(field_dims, num_dense):
-    m = DeepFM(field_dims, num_dense)
-    try:
-        m.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
-        m.eval()
-        return m
-    except FileNotFoundError:
-        return None
+def _example_inputs(model, batch: int) -> dict:
+    """ 导出 / 复核用的随机输入；多值字段每行 0~3 个值（含空 bag） """
+    xs = torch.randint(0, model.embedding.embedding.num_embeddings, (batch, len(SPARSE_COLS)))
+    xd = torch.randn(batch, model.num_dense)
+    if not model.bag_dims:
+        return {"forward": (xs, xd)}
+    bags = []
+    for vocab in model.bag_dims.values():
+        lengths = torch.randint(0, 4, (batch,))
+        bags.append((torch.randint(0, vocab, (int(lengths.sum()),)), torch.cumsum(lengths, 0) - lengths))
+    return {"forward": (xs, xd, bags)}
+
+
+def _graph_forward(graph, n_bags: int):
+    """ 推断图的签名在导出时固定：无多值字段为 (xs, xd)，有则 (xs, xd, bags)；bags=None 补空 bag """
+    def forward(sparse_x, dense_x, bags=None):
+        if not n_bags:
+            return graph(sparse_x, dense_x)
+        if bags is None:
+            empty = sparse_x.new_empty(0)
+            bags = [(empty, sparse_x.new_zeros(sparse_x.size(0)))] * n_bags
+        return graph(sparse_x, dense_x, bags)
+    return forward
+
+
+def _load_model(path, exported: bool = True):
+    """
+    结构参数取自 checkpoint meta；旧格式 checkpoint 没有 meta，
+    只在加载这一次时查库推算 vocab size。
+    exported=True 时旁边有匹配的推断图 (models/export.py) 就用它做前向
+    """
+    state, meta = load_checkpoint(path)
+    field_dims = meta.get("field_dims") or _vocab_sizes()
+    m = DeepFM(field_dims,
+               num_dense=meta.get("num_dense", len(DENSE_COLS)),
+               embed_dim=meta.get("embed_dim", 16),
+               mlp_dims=tuple(meta.get("mlp_dims", (128, 64))),
+               dropout=meta.get("dropout", 0.2),
+               bag_dims=meta.get("bag_dims"))      # 旧 checkpoint 没有多值字段
+    m.load_state_dict(state)
+    # 稠密列预处理参数随 checkpoint 一起发布；旧 checkpoint 为 None，按原始值输入
+    m.preprocess = DensePreprocessor.from_state(meta.get("dense_preprocess"))
+    m.eval()
+    m.runtime = "eager"
+    if exported:
+        graph = load_exported(path, m, _example_inputs(m, 8))
+        if graph is not None:
+            m.forward = _graph_forward(graph, len(m.bag_fields))
+            m.runtime = "torchscript"
+    return m
+
+
+def export_model(path=MODEL_PATH):
+    """ 把 ranker checkpoint 导出成 TorchScript 推断图（与 eager 对比通过才写入） """
+    return export_checkpoint(path, lambda p: _load_model(p, exported=False), _example_inputs)
+
+
+def _warmup(model, n_dummy: int = 3):
+    """ swap 前用 dummy batch 跑几次前向，避免新模型第一次真实请求的延迟尖峰 """
+    xs = torch.ones(8, len(SPARSE_COLS), dtype=torch.long)
+    xd = torch.zeros(8, model.num_dense)
+    with torch.no_grad():
+        for _ in range(n_dummy):
+            model(xs, xd)
+
 
+# 进程内只加载一次；train_ranking 写入新文件后自动预热 + 热替换
+RANKER = CheckpointRegistry(MODEL_PATH, _load_model, warmup=_warmup, name="deepfm_ranker",
+                            companions=(artifact_path(MODEL_PATH),))
 
-def rank_candidates(user_id, movie_ids, recall_scores, top_n=10):
-    if not movie_ids:
-        return []
 
-    df = build_infer_df(user_id, movie_ids, recall_scores)
+class InferenceBuffers:
+    """
+    预分配的 (sparse_x, dense_x) torch 缓冲；numpy 视图与 tensor 共享内存，
+    特征直接写进去，不再 DataFrame → .values → torch.tensor 逐次拷贝
+    """
+
+    def __init__(self, capacity: int = 512):
+        self._alloc(capacity)
+
+    def _alloc(self, capacity: int):
+        self.capacity = capacity
+        self.sparse = torch.empty((capacity, len(SPARSE_COLS)), dtype=torch.long)
+        self.dense = torch.empty((capacity, len(DENSE_COLS)), dtype=torch.float32)
+        self._np = (self.sparse.numpy(), self.dense.numpy())
+
+    def fill(self, features, user_ids, movie_ids, recall_scores) -> tuple[torch.Tensor, torch.Tensor]:
+        """ 写入前 N 行并返回 (sparse_x, dense_x) 视图；下次 fill 前有效 """
+        n = len(movie_ids)
+        if n > self.capacity:
+            self._alloc(1 << (n - 1).bit_length())
+        features.featurize(user_ids, movie_ids, recall_scores, out=self._np)
+        return self.sparse[:n], self.dense[:n]
+
+
+_LOCAL = threading.local()
+
 
-    sparse_cols = ["user_id", "movie_id", "genre_id"]
-    dense_cols  = ["recall_score", "vote_average", "popularity", "age"]
+def _buffers() -> InferenceBuffers:
+    buf = getattr(_LOCAL, "buffers", None)
+    if buf is None:
+        buf = _LOCAL.buffers = InferenceBuffers()
+    return buf
 
-    field_dims  = _vocab_sizes()
-    model = _load_model(field_dims, num_dense=len(dense_cols))
+
+def score_candidates(model, features, user_id, movie_ids, recall_scores, top_n=10,
+                     buffers: InferenceBuffers | None = None) -> tuple[list[int], list[float]]:
+    """
+    张量路径：特征写入缓冲 → 一次前向 → torch.topk。返回 (movie_ids, 概率)，按分数降序。
+    有 id 超出 ranker 词表时（train_ranking --resume 之前的新用户 / 新电影）按召回分返回
+    """
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    recall = np.asarray(recall_scores, dtype=np.float32)
+    xs, xd = (buffers or _buffers()).fill(features, user_id, movie_ids, recall)
+    preprocess = getattr(model, "preprocess", None)
+    if preprocess is not None:
+        preprocess.transform(xd.numpy())        # 原地变换缓冲
+
+    if int(xs.max()) >= model.embedding.embedding.num_embeddings:
+        idx = topk_indices(recall, top_n)
+        return movie_ids[idx].tolist(), recall[idx].tolist()
+
+    bags = bag_tensors(features.featurize_bags(movie_ids, model.bag_dims)) if model.bag_dims else None
+    with torch.inference_mode():
+        logit = model(xs, xd, bags)
+    vals, idx = topk_tensor(logit, top_n)       # sigmoid 单调，只对 top-k 求
+    return movie_ids[idx.numpy()].tolist(), torch.sigmoid(vals).tolist()
+
+
+def rank_candidates(user_id, movie_ids, recall_scores, top_n=10):
+    if not len(movie_ids):
+        return []
+
+    model = RANKER.get()
 
     if model is None:
         # 模型未训练：按召回分降序
-        idx = np.argsort(-np.array(recall_scores))[:top_n]
+        idx = topk_indices(np.asarray(recall_scores, dtype=np.float32), top_n)
         return list(np.array(movie_ids)[idx])
 
-    xs = torch.tensor(df[sparse_cols].values, dtype=torch.long)
-    xd = torch.tensor(df[dense_cols ].values, dtype=torch.float32)
-
-    with torch.no_grad():
-        score = torch.sigmoid(model(xs, xd)).numpy()
-
-    df["score"] = score
-    return (df.sort_values("score", ascending=False)
-              .head(top_n)["movie_id"].tolist())
+    mids, _ = score_candidates(model, features_for([user_id]), user_id,
+                               movie_ids, recall_scores, top_n)
+    return mids
+
+
+def rank_candidates_batch(user_ids, movie_ids, recall_scores, top_n=10):
+    """
+    rank_candidates 的批量版：movie_ids / recall_scores 是与 user_ids 对齐的列表的列表。
+    所有用户的候选拼成一个 batch，只做一次特征构造 + 一次 DeepFM 前向，再按用户切段取 top-k。
+    返回与 user_ids 对齐的排序后 movie_id 列表
+    """
+    lengths = np.array([len(m) for m in movie_ids], dtype=np.int64)
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    if not bounds[-1]:
+        return [[] for _ in user_ids]
+    users = np.repeat(np.asarray(user_ids, dtype=np.int64), lengths)
+    movies = np.concatenate([np.asarray(m, dtype=np.int64) for m in movie_ids])
+    recall = np.concatenate([np.asarray(r, dtype=np.float32) for r in recall_scores])
+
+    model = RANKER.get()
+    score = recall                      # 模型未训练：按召回分降序
+    if model is not None:
+        xs, xd, bags = build_infer_batch(users, movies, recall, model.bag_dims,
+                                         getattr(model, "preprocess", None))
+        # 有 id 比 ranker 词表新的用户整段按召回分返回，其余用户一次前向
+        seg = np.repeat(np.arange(len(lengths)), lengths)
+        oob = (xs >= model.embedding.embedding.num_embeddings).any(dim=1).numpy()
+        stale = np.zeros(len(lengths), dtype=bool)
+        stale[seg[oob]] = True
+        ok = torch.from_numpy(~stale[seg])
+        score = recall.copy()
+        if ok.any():
+            with torch.no_grad():
+                # 按 logit 排序（sigmoid 单调且不会饱和成并列），与 score_candidates 一致
+                if model.bag_dims and not ok.all():
+                    bags = bag_tensors(features_for(users).featurize_bags(movies[ok.numpy()],
+                                                                          model.bag_dims))
+                score[ok.numpy()] = model(xs[ok], xd[ok], bags or None).numpy()
+
+    out = []
+    for i in range(len(lengths)):
+        lo, hi = bounds[i], bounds[i + 1]
+        out.append(movies[lo:hi][topk_indices(score[lo:hi], top_n)].tolist())
+    return out
 
 
 # -- quick CLI test -----------------
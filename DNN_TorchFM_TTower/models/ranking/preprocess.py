@@ -0,0 +1,97 @@
+# models/ranking/preprocess.py
+"""
+DeepFM 稠密输入的预处理：离线拟合，参数写进 ranker checkpoint，推断时原地向量化变换
+
+每列一种变换 (DEFAULT_SPEC)：
+  • quantile   经验分位数映射到 [0, 1]（np.interp 于 n_quantiles 个分位点），对尺度 / 长尾不敏感
+  • log        log1p 后标准化，适合 popularity 这类重尾计数
+  • standard   (x - mean) / std
+  • bucket     按正值的分位数切桶，输出 (桶号 + 1) / 桶数 ∈ (0, 1]；x <= 0 视为缺失，输出 0
+  • none       原样
+
+参数只含 float 列表，可 JSON 序列化；旧 checkpoint 没有 dense_preprocess 时
+from_state(None) 返回 None，调用方按原始值输入（与旧版一致）
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+DEFAULT_SPEC = {
+    "recall_score": "quantile",
+    "vote_average": "standard",
+    "popularity":   "log",
+    "age":          "bucket",
+}
+TRANSFORMS = ("quantile", "log", "standard", "bucket", "none")
+
+
+def _fit_column(x: np.ndarray, kind: str, n_quantiles: int, n_buckets: int) -> dict:
+    x = x[np.isfinite(x)].astype(np.float64)
+    if kind == "quantile":
+        q = np.unique(np.quantile(x, np.linspace(0, 1, n_quantiles))) if len(x) else np.zeros(1)
+        return {"kind": kind, "quantiles": q.tolist()}
+    if kind in ("log", "standard"):
+        y = np.log1p(np.maximum(x, 0)) if kind == "log" else x
+        mean = float(y.mean()) if len(y) else 0.0
+        std = float(y.std()) if len(y) else 1.0
+        return {"kind": kind, "mean": mean, "std": max(std, 1e-6)}
+    if kind == "bucket":
+        pos = x[x > 0]
+        inner = np.linspace(0, 1, n_buckets + 1)[1:-1]
+        bounds = np.unique(np.quantile(pos, inner)) if len(pos) else np.empty(0)
+        return {"kind": kind, "bounds": bounds.tolist()}
+    if kind == "none":
+        return {"kind": kind}
+    raise ValueError(f"unknown transform {kind!r}, expected one of {TRANSFORMS}")
+
+
+def _apply_column(x: np.ndarray, p: dict) -> None:
+    """ 原地变换一列（x 可为二维数组的列视图） """
+    kind = p["kind"]
+    if kind == "quantile":
+        q = np.asarray(p["quantiles"])
+        x[:] = np.interp(x, q, np.linspace(0, 1, len(q))) if len(q) > 1 else 0.0
+    elif kind == "log":
+        x[:] = (np.log1p(np.maximum(x, 0)) - p["mean"]) / p["std"]
+    elif kind == "standard":
+        x -= p["mean"]
+        x /= p["std"]
+    elif kind == "bucket":
+        bounds = np.asarray(p["bounds"])
+        b = np.searchsorted(bounds, x, side="right") + 1
+        x[:] = np.where(x > 0, b / (len(bounds) + 1), 0.0)
+
+
+class DensePreprocessor:
+    def __init__(self, columns: list[str], params: list[dict]):
+        self.columns = list(columns)
+        self.params = params
+
+    @classmethod
+    def fit(cls, xd: np.ndarray, columns: list[str], spec: dict | None = None,
+            n_quantiles: int = 64, n_buckets: int = 8) -> "DensePreprocessor":
+        """ xd: (N, len(columns)) 的训练样本；spec 未列出的列不变换 """
+        spec = DEFAULT_SPEC if spec is None else spec
+        params = [_fit_column(xd[:, j], spec.get(c, "none"), n_quantiles, n_buckets)
+                  for j, c in enumerate(columns)]
+        return cls(columns, params)
+
+    def transform(self, xd: np.ndarray) -> np.ndarray:
+        """ 原地变换 (N, F) float32 数组并返回它 """
+        for j, p in enumerate(self.params):
+            _apply_column(xd[:, j], p)
+        return xd
+
+    def state(self) -> dict:
+        return {"columns": self.columns, "params": self.params}
+
+    @classmethod
+    def from_state(cls, state: dict | None) -> "DensePreprocessor | None":
+        if not state:
+            return None
+        return cls(state["columns"], state["params"])
+
+    def __repr__(self):
+        kinds = ", ".join(f"{c}:{p['kind']}" for c, p in zip(self.columns, self.params))
+        return f"DensePreprocessor({kinds})"
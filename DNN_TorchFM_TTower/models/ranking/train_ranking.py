@@ -1,23 +1,49 @@
 """
 训练自定义 DeepFM 精排模型（统一 4 维稠密特征：
   recall_score · vote_average · popularity · age）
+recall_score 取自冻结的双塔（与线上召回同一 checkpoint），不再训练时填 0；
+稠密列经 DensePreprocessor 变换，拟合参数写进 checkpoint，推断侧原样复用
 运行:
     python -m models.ranking.train_ranking --epochs 3
 """
 
 import os, argparse
+import numpy as np
 import torch
 import torch.nn as nn
-from torch.utils.data import TensorDataset, DataLoader
-from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 from DNN_TorchFM_TTower.models.db import fetchone_dict
-from DNN_TorchFM_TTower.models.ranking.feature_engineer import build_training_df
+from DNN_TorchFM_TTower.models.checkpoint import load_checkpoint, save_checkpoint
+from DNN_TorchFM_TTower.models.export import export_after_save
+from DNN_TorchFM_TTower.models.embeddings import GROW_INITS, load_state_dict_grown
+from DNN_TorchFM_TTower.models.config import SAVE_DIR, RANKING_BAG_FIELDS
+from DNN_TorchFM_TTower.models.catalog import get_catalog
+from DNN_TorchFM_TTower.models.negative_sampling import (
+    NEG_STRATEGIES,
+    NegativeSamplingCollate,
+    UserHistory,
+    build_strategy,
+)
+from DNN_TorchFM_TTower.models.snapshot import open_snapshot
+from DNN_TorchFM_TTower.models.streaming import load_history, positive_loaders, set_epoch
+from DNN_TorchFM_TTower.models.ranking.feature_engineer import (
+    RecallScorer,
+    TrainingFeatures,
+    get_positive_pairs,
+)
+from DNN_TorchFM_TTower.models.ranking.preprocess import DensePreprocessor
+from DNN_TorchFM_TTower.models.ranking.feature_store import (
+    BAG_SOURCES,
+    DENSE_COLS,
+    SPARSE_COLS,
+    FeatureSnapshot,
+    get_features,
+)
 from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
 
-os.makedirs("saved_model", exist_ok=True)
-MODEL_PATH = "saved_model/deepfm_ranker.pt"
+MODEL_PATH = SAVE_DIR / "deepfm_ranker.pt"
 
 
 # ------------------------------------------------------------------ #
@@ -30,47 +56,141 @@ def _vocab_sizes():
     return [mu + 2, mm + 2, mg + 2]          # +2 for padding / OOV
 
 
-# ------------------------------------------------------------------ #
-#                       helper → TensorDataset                       #
-# ------------------------------------------------------------------ #
-def _to_tensor(df, sparse_cols, dense_cols):
-    Xs = torch.tensor(df[sparse_cols].values, dtype=torch.long)
-    Xd = torch.tensor(df[dense_cols ].values, dtype=torch.float32)
-    y  = torch.tensor(df["label"].values,   dtype=torch.float32)
-    return TensorDataset(Xs, Xd, y)
+def _recall_scorer():
+    """ 冻结的线上双塔；还没有召回模型时返回 None（recall_score 退回 0） """
+    from DNN_TorchFM_TTower.models.recall.two_tower import load_model
+    try:
+        return RecallScorer(load_model())
+    except FileNotFoundError as e:
+        print(f"[train_ranking] ⚠️ {e}，recall_score 按 0 训练")
+        return None
+
+
+def _fit_preprocess(featurize, users, movies, catalog, neg_ratio, seed, n_fit=100_000,
+                    history=None):
+    """
+    在正样本 + 同用户的随机负样本上拟合稠密列变换（与训练时正负比例一致）；
+    --stream 时 users / movies 为 None，正样本从 history 里抽
+    """
+    rng = np.random.default_rng(seed)
+    total = len(users) if users is not None else len(history.keys)
+    n_pos = min(total, max(1, n_fit // (1 + neg_ratio)))
+    pick = rng.choice(total, n_pos, replace=False)
+    if users is not None:
+        u_pos, m_pos = users[pick], movies[pick]
+    else:
+        u_pos, rows = history.pairs(pick)
+        m_pos = catalog.movie_ids[rows]
+    u_neg = np.repeat(u_pos, neg_ratio)
+    m_neg = catalog.movie_ids[rng.integers(0, len(catalog), len(u_neg))]
+    xd = featurize.raw_dense(np.concatenate([u_pos, u_neg]),
+                             np.concatenate([m_pos, m_neg]))
+    return DensePreprocessor.fit(xd, DENSE_COLS)
 
 
 # ------------------------------------------------------------------ #
 #                               main                                 #
 # ------------------------------------------------------------------ #
-def main(epochs=3, batch_size=2048, neg_ratio=1):
+def main(epochs=3, batch_size=2048, neg_ratio=1, resume=False, grow_init="mean",
+         neg="uniform", alpha=0.75, seed=42, workers=0, stream=False, snapshot=None,
+         bag_fields=RANKING_BAG_FIELDS, preprocess=True):
+    """
+    正样本来自 view_history；负样本在 DataLoader 里按 batch 现抽 (--neg)，
+    不再把 neg_ratio 倍的负样本连同特征整表物化成 DataFrame。
+    batch_size 指每个 batch 的正样本数；stream=True 时正样本每个 epoch 从库里流式读取。
+    snapshot="latest" / 快照目录时全部数据取自 memmap 快照 (models/snapshot.py)，不访问数据库。
+    bag_fields 为多值字段 (EmbeddingBag)；续训时沿用旧 checkpoint 的多值字段，保证结构一致。
+    preprocess=True 时拟合稠密列变换；续训时沿用旧 checkpoint 的变换（旧 checkpoint 没有则不变换），
+    保证已训练的权重看到的输入分布不变。
+    """
+    unknown = [f for f in bag_fields if f not in BAG_SOURCES]
+    if unknown:
+        raise ValueError(f"[train_ranking] unknown bag fields {unknown}, expected some of {tuple(BAG_SOURCES)}")
 
-    df = build_training_df(neg_ratio)
-    if df.empty:
+    snap = open_snapshot(snapshot) if snapshot else None
+    if snap is not None:
+        users, movies = (np.asarray(a, dtype=np.int64) for a in snap.interactions())
+        stream = False
+        print(f"[train_ranking] snapshot {snap.name} ({snap.manifest['created_at']})")
+    elif not stream:
+        users, movies = get_positive_pairs()
+    else:
+        users = movies = None       # 正样本每个 epoch 流式读取，整表对不驻留内存
+
+    # -------- 稀疏 & 稠密特征列 --------
+    sparse_cols, dense_cols = SPARSE_COLS, DENSE_COLS
+
+    catalog  = snap.catalog() if snap is not None else get_catalog()
+    history  = (load_history(catalog) if users is None
+                else UserHistory(users, catalog.rows(movies), len(catalog)))
+    n_pos = len(users) if users is not None else len(history.keys)
+    if not n_pos:
         print("[train_ranking] ❌ 无训练样本")
         return
+    strategy = build_strategy(neg, catalog, history, alpha=alpha)
+    # recall_score 与线上一致：冻结双塔对 (user, movie) 打分
+    scorer = _recall_scorer()
+    if neg == "hard":
+        # 难负样本来自当前线上的双塔召回（需 arch=dot）
+        if scorer is None:
+            raise FileNotFoundError("[train_ranking] --neg hard 需要已训练的双塔召回模型")
+        strategy.refresh(scorer.model)
+    # 特征与线上推断同源：在线仓库，或由训练快照构建的同结构数组
+    features  = (FeatureSnapshot.build(catalog, snap.user_ages(), bag_fields=bag_fields)
+                 if snap is not None else get_features())
 
-    # -------- 稀疏 & 稠密特征列 --------
-    sparse_cols = ["user_id", "movie_id", "genre_id"]
-    dense_cols  = ["recall_score", "vote_average", "popularity", "age"]
+    # -------- 词表 (sparse + 多值字段) --------
+    field_dims = [m + 2 for m in snap.max_ids()] if snap is not None else _vocab_sizes()
+    prev = None
+    if resume and MODEL_PATH.exists():
+        # 续训：词表只增不减；旧 checkpoint 的行原样保留，新 id 的行按 grow_init 初始化
+        prev, prev_meta = load_checkpoint(MODEL_PATH)
+        old_dims = prev_meta.get("field_dims") or field_dims
+        field_dims = [max(a, b) for a, b in zip(field_dims, old_dims)]
+        old_bags = prev_meta.get("bag_dims") or {}
+        if tuple(old_bags) != tuple(bag_fields):
+            print(f"[train_ranking] 续训沿用 checkpoint 的多值字段 {list(old_bags)}")
+        bag_fields = tuple(old_bags)
+    # 在线仓库只加载了 RANKING_BAG_FIELDS；--bags / 续训的 checkpoint 要的其它字段在这里补载
+    features = features.with_bags(catalog, bag_fields)
+    extra = [f for f in bag_fields if f not in RANKING_BAG_FIELDS]
+    if extra:
+        print(f"[train_ranking] ⚠️ 多值字段 {extra} 不在 RANKING_BAG_FIELDS 中，"
+              f"上线前需加入 config，否则在线精排取不到这些特征")
+    bag_dims = {name: features.bags[name].vocab_size for name in bag_fields}
+    if "genres" in bag_dims:
+        bag_dims["genres"] = max(bag_dims["genres"], field_dims[2])
+    if prev is not None:
+        bag_dims = {name: max(v, old_bags[name]) for name, v in bag_dims.items()}
+    featurize = TrainingFeatures(features, bag_dims, recall_scorer=scorer)
 
-    # 训练阶段 recall_score 不存在 → 填 0.0
-    df["recall_score"] = 0.0
+    # -------- 稠密列预处理 --------
+    if prev is not None:
+        featurize.preprocess = DensePreprocessor.from_state(prev_meta.get("dense_preprocess"))
+    elif preprocess:
+        featurize.preprocess = _fit_preprocess(featurize, users, movies, catalog, neg_ratio, seed,
+                                               history=history)
+    print(f"[train_ranking] dense preprocess: {featurize.preprocess or 'none (raw)'}")
 
     # -------- train / val split --------
-    tr_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
-    train_loader = DataLoader(_to_tensor(tr_df, sparse_cols, dense_cols),
-                              batch_size=batch_size, shuffle=True)
-    val_loader   = DataLoader(_to_tensor(val_df, sparse_cols, dense_cols),
-                              batch_size=batch_size, shuffle=False)
+    train_collate = NegativeSamplingCollate(strategy, history, catalog, neg_ratio,
+                                            seed=seed, featurize=featurize)
+    val_collate   = NegativeSamplingCollate(strategy, history, catalog, neg_ratio,
+                                            seed=seed + 1, featurize=featurize)
+    train_loader, val_loader = positive_loaders(users, movies, train_collate, val_collate,
+                                                batch_size, workers=workers, stream=stream, seed=seed)
 
     # -------- 构建模型 --------
-    field_dims = _vocab_sizes()
-    model = DeepFM(field_dims,
-                   num_dense=len(dense_cols),
-                   embed_dim=16,
-                   mlp_dims=(128, 64),
-                   dropout=0.2)
+    model_meta = dict(field_dims=field_dims,
+                      num_dense=len(dense_cols),
+                      embed_dim=16,
+                      mlp_dims=(128, 64),
+                      dropout=0.2,
+                      bag_dims=bag_dims)
+    model = DeepFM(**model_meta)
+    if prev is not None:
+        grown = load_state_dict_grown(model, prev, init=grow_init)
+        print(f"[train_ranking] resumed from {MODEL_PATH.name}, grown: {grown or 'none'}")
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model.to(device)
@@ -78,15 +198,17 @@ def main(epochs=3, batch_size=2048, neg_ratio=1):
     opt      = torch.optim.Adam(model.parameters(), lr=1e-3)
     loss_fn  = nn.BCEWithLogitsLoss()
 
-    print(f"[train_ranking] 样本={len(df)}  正负≈1:{neg_ratio}")
+    print(f"[train_ranking] 正样本={n_pos}  正负≈1:{neg_ratio}  负采样={neg}")
     for ep in range(1, epochs + 1):
+        set_epoch(train_loader, ep)
         # ---- Train ----
         model.train()
         tot, n = 0., 0
-        for Xs, Xd, y in tqdm(train_loader, desc=f"Ep {ep}/{epochs}", ncols=80):
+        for Xs, Xd, y, bags in tqdm(train_loader, desc=f"Ep {ep}/{epochs}", ncols=80):
             Xs, Xd, y = Xs.to(device), Xd.to(device), y.to(device)
+            bags = [(i.to(device), o.to(device)) for i, o in bags]
             opt.zero_grad()
-            loss = loss_fn(model(Xs, Xd), y)
+            loss = loss_fn(model(Xs, Xd, bags), y)
             loss.backward()
             opt.step()
             tot += loss.item() * len(y)
@@ -97,15 +219,22 @@ def main(epochs=3, batch_size=2048, neg_ratio=1):
         model.eval()
         with torch.no_grad():
             tot_v, nv = 0., 0
-            for Xs, Xd, y in val_loader:
+            for Xs, Xd, y, bags in val_loader:
                 Xs, Xd, y = Xs.to(device), Xd.to(device), y.to(device)
-                tot_v += loss_fn(model(Xs, Xd), y).item() * len(y)
+                bags = [(i.to(device), o.to(device)) for i, o in bags]
+                tot_v += loss_fn(model(Xs, Xd, bags), y).item() * len(y)
                 nv    += len(y)
         print(f"  val_loss  ={tot_v/nv:.4f}")
 
     # -------- Save --------
-    torch.save(model.cpu().state_dict(), MODEL_PATH)
+    # vocab size 等结构参数写进 checkpoint，推断侧无需再查库；原子写入，服务端可直接热替换
+    save_checkpoint(MODEL_PATH, model.cpu().state_dict(),
+                    sparse_cols=sparse_cols, dense_cols=dense_cols,
+                    dense_preprocess=featurize.preprocess.state() if featurize.preprocess else None,
+                    recall_scores="two_tower" if scorer is not None else "zero",
+                    **model_meta)
     print("✅ DeepFM 已保存 →", MODEL_PATH)
+    export_after_save("ranker", MODEL_PATH)
 
 
 if __name__ == "__main__":
@@ -113,5 +242,21 @@ if __name__ == "__main__":
     ap.add_argument("--epochs",     type=int, default=3)
     ap.add_argument("--batch",      type=int, default=2048)
     ap.add_argument("--neg_ratio",  type=int, default=1)
+    ap.add_argument("--resume",     action="store_true",
+                    help="continue from the saved ranker, growing its tables to the current vocab")
+    ap.add_argument("--grow_init",  choices=GROW_INITS, default="mean")
+    ap.add_argument("--neg",        choices=NEG_STRATEGIES, default="uniform")
+    ap.add_argument("--alpha",      type=float, default=0.75)
+    ap.add_argument("--seed",       type=int, default=42)
+    ap.add_argument("--workers",    type=int, default=0)
+    ap.add_argument("--stream",     action="store_true")
+    ap.add_argument("--snapshot",   default=None, help="'latest' or a snapshot dir; skips the DB")
+    ap.add_argument("--bags",       default=",".join(RANKING_BAG_FIELDS),
+                    help="comma-separated multi-valued fields (genres, keywords, cast); '' for none")
+    ap.add_argument("--no_preprocess", action="store_true",
+                    help="feed raw dense values instead of fitted quantile/log/bucket transforms")
     args = ap.parse_args()
-    main(args.epochs, args.batch, args.neg_ratio)
+    main(args.epochs, args.batch, args.neg_ratio, args.resume, args.grow_init,
+         args.neg, args.alpha, args.seed, args.workers, args.stream, args.snapshot,
+         bag_fields=tuple(f for f in args.bags.split(",") if f),
+         preprocess=not args.no_preprocess)
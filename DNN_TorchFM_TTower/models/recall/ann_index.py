@@ -0,0 +1,256 @@
+# models/recall/ann_index.py
+"""
+Two-Tower 召回的 top-k 检索后端
+
+  • ExactIndex : 整表 item 矩阵 · user 向量，精确 top-k
+  • IVFIndex   : 倒排文件 (IVF-Flat)。k-means 把 item 向量分到 nlist 个簇，
+                 查询时只扫描与 user 向量内积最大的 nprobe 个簇。
+                 纯 NumPy 实现，不额外依赖 faiss / hnswlib。
+
+两者接口一致：
+    index.search(query_vec, k, allowed=None) -> (movie_ids, scores)
+allowed 为与 index 行对齐的 bool 掩码（如语言过滤后的候选集）。
+
+持久化：
+    save_index(index, dir)          → dir/*.npy + dir/meta.json
+    load_index(dir, mmap=True)      → np.load(mmap_mode="r")，多进程共享页缓存
+
+命令行：
+    # 从当前 dot 双塔 + catalog 构建并保存
+    python -m DNN_TorchFM_TTower.models.recall.ann_index build
+    # 评估 recall@k 与耗时 (ANN vs exact)
+    python -m DNN_TorchFM_TTower.models.recall.ann_index eval --k 300
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from DNN_TorchFM_TTower.models.topk import topk_indices
+
+
+# --------------------------------------------------------------------------- #
+#                                 Exact                                       #
+# --------------------------------------------------------------------------- #
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray):
+        self.vectors = vectors          # (N, D) float32
+        self.ids = ids                  # (N,)   int64
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, vectors, ids, **_):
+        return cls(np.ascontiguousarray(vectors, dtype=np.float32),
+                   np.asarray(ids, dtype=np.int64))
+
+    def search(self, query: np.ndarray, k: int, allowed: np.ndarray | None = None):
+        scores = self.vectors @ query.astype(np.float32)
+        if allowed is not None:
+            rows = np.flatnonzero(allowed)
+            top = rows[topk_indices(scores[rows], k)]
+        else:
+            top = topk_indices(scores, k)
+        return self.ids[top], scores[top]
+
+    def _arrays(self):
+        return {"vectors": self.vectors, "ids": self.ids}
+
+    def _meta(self):
+        return {}
+
+
+# --------------------------------------------------------------------------- #
+#                                IVF-Flat                                     #
+# --------------------------------------------------------------------------- #
+def _kmeans(x: np.ndarray, nlist: int, niter: int, rng: np.random.Generator) -> np.ndarray:
+    """ L2 k-means，返回 (nlist, D) 质心 """
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(niter):
+        assign = _assign(x, centroids)
+        sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=nlist)
+                         for d in range(x.shape[1])], axis=1).astype(np.float32)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():                 # 空簇重新随机挑点
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for s in range(0, len(x), chunk):
+        out[s:s + chunk] = np.argmin(c_sq - 2.0 * x[s:s + chunk] @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, centroids, offsets, vectors, ids, rows, nprobe: int = 8):
+        self.centroids = centroids      # (nlist, D)
+        self.offsets = offsets          # (nlist + 1,) 第 c 个簇 = [offsets[c], offsets[c+1])
+        self.vectors = vectors          # (N, D) 按簇重排后的 item 向量
+        self.ids = ids                  # (N,)   重排后的 movie_id
+        self.rows = rows                # (N,)   重排后位置 -> 原始行号（用于 allowed 掩码）
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, vectors, ids, nlist: int | None = None, nprobe: int = 8,
+              niter: int = 10, seed: int = 42):
+        x = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(x)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        train = x if n <= 256 * nlist else x[rng.choice(n, 256 * nlist, replace=False)]
+        centroids = _kmeans(train, nlist, niter, rng)
+
+        assign = _assign(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+        return cls(centroids, offsets, x[order], ids[order], order, nprobe=nprobe)
+
+    def search(self, query: np.ndarray, k: int, allowed: np.ndarray | None = None,
+               nprobe: int | None = None):
+        q = query.astype(np.float32)
+        probe = topk_indices(self.centroids @ q, nprobe or self.nprobe)
+        spans = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe]
+        pos = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+        if allowed is not None:
+            pos = pos[allowed[self.rows[pos]]]
+        scores = self.vectors[pos] @ q
+        top = topk_indices(scores, k)
+        return self.ids[pos[top]], scores[top]
+
+    def _arrays(self):
+        return {"centroids": self.centroids, "offsets": self.offsets,
+                "vectors": self.vectors, "ids": self.ids, "rows": self.rows}
+
+    def _meta(self):
+        return {"nprobe": self.nprobe}
+
+
+INDEX_TYPES = {"exact": ExactIndex, "ivf": IVFIndex}
+
+
+# --------------------------------------------------------------------------- #
+#                           build / save / load                               #
+# --------------------------------------------------------------------------- #
+def build_index(kind: str, vectors: np.ndarray, ids: np.ndarray, **kwargs):
+    try:
+        cls = INDEX_TYPES[kind]
+    except KeyError:
+        raise ValueError(f"unknown index kind {kind!r}, expected one of {list(INDEX_TYPES)}") from None
+    return cls.build(vectors, ids, **kwargs)
+
+
+def save_index(index, path) -> None:
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name, arr in index._arrays().items():
+        np.save(path / f"{name}.npy", np.ascontiguousarray(arr))
+    meta = {"kind": index.kind, "size": len(index), **index._meta()}
+    (path / "meta.json").write_text(json.dumps(meta, indent=2))
+
+
+def load_index(path, mmap: bool = True):
+    """ mmap=True 时数组以只读内存映射方式打开，不整体读入内存 """
+    path = Path(path)
+    meta = json.loads((path / "meta.json").read_text())
+    cls = INDEX_TYPES[meta.pop("kind")]
+    meta.pop("size", None)
+    mode = "r" if mmap else None
+    arrays = {p.stem: np.load(p, mmap_mode=mode) for p in path.glob("*.npy")}
+    if cls is ExactIndex:
+        return ExactIndex(arrays["vectors"], arrays["ids"])
+    return IVFIndex(arrays["centroids"], arrays["offsets"], arrays["vectors"],
+                    arrays["ids"], arrays["rows"], **meta)
+
+
+# --------------------------------------------------------------------------- #
+#                               评 估                                         #
+# --------------------------------------------------------------------------- #
+def evaluate(index, exact: ExactIndex, queries: np.ndarray, k: int = 300,
+             allowed: np.ndarray | None = None) -> dict:
+    """
+    recall@k = |ANN top-k ∩ exact top-k| / k，并统计两者的单次查询耗时；
+    allowed 同 search（如排除不在模型词表里的占位行）
+    """
+    recalls, t_ann, t_exact = [], 0.0, 0.0
+    for q in queries:
+        tic = time.perf_counter()
+        got, _ = index.search(q, k, allowed=allowed)
+        t_ann += time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        ref, _ = exact.search(q, k, allowed=allowed)
+        t_exact += time.perf_counter() - tic
+
+        recalls.append(len(np.intersect1d(got, ref)) / max(1, len(ref)))
+    n = max(1, len(queries))
+    return {
+        "k": k,
+        "queries": len(queries),
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "ann_ms": 1000 * t_ann / n,
+        "exact_ms": 1000 * t_exact / n,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import torch
+
+    from DNN_TorchFM_TTower.models.config import ANN_INDEX_DIR, ANN_NLIST, ANN_NPROBE
+    from DNN_TorchFM_TTower.models.catalog import get_catalog
+    from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerDotModel
+    from DNN_TorchFM_TTower.models.recall.two_tower import load_model, item_matrix, item_vocab
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["build", "eval"])
+    ap.add_argument("--kind", choices=list(INDEX_TYPES), default="ivf")
+    ap.add_argument("--nlist", type=int, default=ANN_NLIST)
+    ap.add_argument("--nprobe", type=int, default=ANN_NPROBE)
+    ap.add_argument("--out", default=str(ANN_INDEX_DIR))
+    ap.add_argument("--k", type=int, default=300)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    model = load_model()
+    if not isinstance(model, TwoTowerDotModel):
+        raise SystemExit("[ann_index] 需要 arch=dot 的双塔模型 (train_two_tower --arch dot)")
+    catalog = get_catalog()
+    vectors = item_matrix(model, catalog).numpy()
+
+    tic = time.time()
+    index = build_index(args.kind, vectors, catalog.movie_ids,
+                        **({"nlist": args.nlist, "nprobe": args.nprobe} if args.kind == "ivf" else {}))
+    print(f"[ann_index] {args.kind} index over {len(index)} items built in {time.time() - tic:.1f}s")
+
+    if args.cmd == "build":
+        save_index(index, args.out)
+        print(f"[ann_index] saved → {args.out}")
+    else:
+        n_users = model.user_embedding.num_embeddings
+        users = torch.randint(1, n_users, (args.queries,))
+        with torch.no_grad():
+            queries = model.user_vectors(users).numpy()
+        exact = ExactIndex.build(vectors, catalog.movie_ids)
+        print(json.dumps(evaluate(index, exact, queries, k=args.k,
+                                  allowed=item_vocab(model, catalog)), indent=2))
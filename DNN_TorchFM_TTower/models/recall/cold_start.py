@@ -1,25 +1,219 @@
 # models/recall/cold_start.py
-import random
+"""
+冷启动候选池：预先算好、定时刷新，请求时只做一次加权抽样
+
+候选池 (ids, weights)，每个池最多 POOL_SIZE 部：
+  • global        vote_count > 0，按 (vote_average DESC, vote_count DESC) 取前 POOL_SIZE，与原 SQL 一致
+  • language[l]   同上，限定 original_language = l（用户有观影语言时使用）
+  • genre[g]      同上，限定 genre g（注册时在 user_preferences 里选的题材）
+  • age[b]        同年龄段用户在 view_history 里看得最多的电影
+权重：评分池 ∝ vote_average · log1p(vote_count)，年龄池 ∝ 观看次数。
+
+抽样时把用户可用的池按份额混合 (genre / language / age / global)，同一部电影的权重相加，
+再不放回地加权抽 top_n。池子由后台线程每 COLD_POOL_REFRESH 秒或 catalog 版本变化时重建，
+请求路径不查 movies 表，只在需要时按主键查一次用户画像（年龄 + 偏好题材）。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+
+from DNN_TorchFM_TTower.models.catalog import get_catalog
+from DNN_TorchFM_TTower.models.config import COLD_POOL_REFRESH
 from DNN_TorchFM_TTower.models.db import fetchall_dict
+from DNN_TorchFM_TTower.models.topk import topk_indices
 
-def recommend_cold_start(top_n=10):
-    """
-    针对无历史用户(冷启动)：先选一批高评分热门电影，再随机抽取 top_n。
-    示例：我们假设在 movies 表中有 vote_average, vote_count 字段。
+POOL_SIZE = 50
+AGE_BUCKETS = (18, 25, 35, 50, 65)      # 左闭右开：<18, 18-24, 25-34, 35-49, 50-64, 65+
+
+# 混合份额：有对应画像时各自占比，剩余给 global
+GENRE_SHARE = 0.5
+LANGUAGE_SHARE = 0.2
+AGE_SHARE = 0.2
+
+
+def age_bucket(age) -> int | None:
+    if not age:
+        return None
+    return int(np.searchsorted(AGE_BUCKETS, age, side="right"))
+
+
+# --------------------------------------------------------------------------- #
+#                                 候 选 池                                     #
+# --------------------------------------------------------------------------- #
+class ColdStartPools:
+    def __init__(self, catalog_version: int, global_pool, by_language: dict,
+                 by_genre: dict, by_age: dict):
+        self.catalog_version = catalog_version
+        self.global_pool = global_pool
+        self.by_language = by_language
+        self.by_genre = by_genre
+        self.by_age = by_age
+        self.built_at = time.time()
+
+    @staticmethod
+    def _rated_pool(cat, rows: np.ndarray):
+        rows = rows[cat.vote_count[rows] > 0]
+        if not len(rows):
+            return None
+        idx = topk_indices(cat.vote_average[rows], POOL_SIZE, tiebreak=cat.vote_count[rows])
+        top = rows[idx]
+        w = cat.vote_average[top].astype(np.float64) * np.log1p(cat.vote_count[top])
+        return cat.movie_ids[top], np.maximum(w, 1e-6)
+
+    @classmethod
+    def build(cls, cat) -> "ColdStartPools":
+        tic = time.time()
+        rated = cls._rated_pool
+        global_pool = rated(cat, np.arange(len(cat)))
+
+        by_language = {}
+        for lang in cat.index.keys("language"):
+            pool = rated(cat, cat.rows(cat.ids_for_languages([lang])).astype(np.int64))
+            if pool is not None:
+                by_language[lang] = pool
+
+        by_genre = {}
+        for g in cat.index.keys("genre"):
+            pool = rated(cat, cat.rows(cat.index.ids("genre", [g])).astype(np.int64))
+            if pool is not None:
+                by_genre[int(g)] = pool
+
+        by_age = {}
+        bounds = ",".join(str(b) for b in AGE_BUCKETS)
+        rows = fetchall_dict(f"""
+            SELECT width_bucket(u.age, ARRAY[{bounds}]) AS bucket, v.movie_id, COUNT(*) AS n
+            FROM view_history v
+            JOIN users u ON u.id = v.user_id
+            WHERE u.age > 0
+            GROUP BY bucket, v.movie_id
+        """)
+        grouped: dict[int, list] = {}
+        for r in rows:
+            grouped.setdefault(r["bucket"], []).append((r["movie_id"], r["n"]))
+        for bucket, pairs in grouped.items():
+            ids = np.array([p[0] for p in pairs], dtype=np.int64)
+            counts = np.array([p[1] for p in pairs], dtype=np.float64)
+            idx = topk_indices(counts, POOL_SIZE, tiebreak=-ids)
+            by_age[int(bucket)] = ids[idx], counts[idx]
+
+        pools = cls(cat.version, global_pool, by_language, by_genre, by_age)
+        print(f"[cold_start] pools built in {time.time() - tic:.2f}s "
+              f"({len(by_language)} languages, {len(by_genre)} genres, {len(by_age)} age buckets)")
+        return pools
+
+    def mixture(self, genres=(), languages=(), bucket=None):
+        """ 按份额混合可用的池，返回 (ids, 概率) """
+        parts = []
+        genre_pools = [self.by_genre[g] for g in genres if g in self.by_genre]
+        lang_pools = [self.by_language[l] for l in languages if l in self.by_language]
+        age_pool = self.by_age.get(bucket) if bucket is not None else None
+
+        rest = 1.0
+        for pools, share in ((genre_pools, GENRE_SHARE), (lang_pools, LANGUAGE_SHARE),
+                             ([age_pool] if age_pool is not None else [], AGE_SHARE)):
+            for ids, w in pools:
+                parts.append((ids, w / w.sum() * share / len(pools)))
+            if pools:
+                rest -= share
+        if self.global_pool is not None and (rest > 0 or not parts):
+            ids, w = self.global_pool
+            parts.append((ids, w / w.sum() * max(rest, 1.0 if not parts else 0.0)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        ids, inv = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        prob = np.zeros(len(ids))
+        np.add.at(prob, inv, np.concatenate([p[1] for p in parts]))
+        return ids, prob / prob.sum()
+
+
+class _PoolStore:
+    """ 首次同步构建；之后过期 / catalog 版本变化时后台重建，请求线程继续用旧池 """
+
+    def __init__(self, refresh_interval: float = COLD_POOL_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._pools: ColdStartPools | None = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def _rebuild(self):
+        try:
+            pools = ColdStartPools.build(get_catalog())
+            self._pools = pools         # 原子替换引用
+        except Exception as e:          # 数据库暂不可用：继续用旧池
+            print(f"[cold_start] pool rebuild failed: {type(e).__name__}: {e}")
+        finally:
+            self._rebuilding = False
+
+    def get(self) -> ColdStartPools:
+        pools = self._pools
+        if pools is None:
+            with self._lock:
+                if self._pools is None:
+                    self._pools = ColdStartPools.build(get_catalog())
+                return self._pools
+        stale = (time.time() - pools.built_at > self.refresh_interval
+                 or get_catalog().version != pools.catalog_version)
+        if stale and not self._rebuilding:
+            with self._lock:
+                if not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(target=self._rebuild, name="cold-start-pools", daemon=True).start()
+        return pools
+
+    def refresh(self) -> None:
+        self._rebuilding = True
+        self._rebuild()
+
+
+_STORE = _PoolStore()
+
+
+def get_pools() -> ColdStartPools:
+    return _STORE.get()
+
+
+def refresh_pools() -> None:
+    _STORE.refresh()
+
+
+# --------------------------------------------------------------------------- #
+#                                  画 像                                       #
+# --------------------------------------------------------------------------- #
+def cold_profiles(user_ids) -> dict[int, tuple[int | None, list[int]]]:
+    """ {user_id: (年龄段, 偏好 genre 列表)}，一条 SQL 查全部用户 """
+    rows = fetchall_dict("""
+        SELECT u.id AS user_id, u.age,
+               COALESCE(ARRAY_AGG(up.genre_id) FILTER (WHERE up.genre_id IS NOT NULL), '{}') AS genres
+        FROM users u
+        LEFT JOIN user_preferences up ON up.user_id = u.id
+        WHERE u.id = ANY(%s)
+        GROUP BY u.id, u.age
+    """, (list(user_ids),))
+    return {r["user_id"]: (age_bucket(r["age"]), list(r["genres"])) for r in rows}
+
+
+# --------------------------------------------------------------------------- #
+#                                  抽 样                                       #
+# --------------------------------------------------------------------------- #
+def recommend_cold_start(top_n=10, user_id=None, languages=(), profile=None, rng=None):
     """
-    query = """
-        SELECT id
-        FROM movies
-        WHERE vote_count > 0
-        ORDER BY vote_average DESC, vote_count DESC
-        LIMIT 50
+    针对无历史用户(冷启动)：从预计算池里不放回地加权抽 top_n。
+    user_id 给出时按其年龄段 / 注册时选的题材个性化（profile 可由 cold_profiles 批量预取）；
+    languages 为用户观影语言（老用户回退到冷启动时）
     """
-    rows = fetchall_dict(query)
-    if not rows:
+    if profile is None and user_id is not None:
+        profile = cold_profiles([user_id]).get(user_id)
+    bucket, genres = profile if profile is not None else (None, [])
+
+    ids, prob = get_pools().mixture(genres, languages or (), bucket)
+    if not len(ids):
         return []
-    candidate_ids = [r["id"] for r in rows]
-    
-    # 从这 50 部评分最高的影片里随机抽 top_n
-    if len(candidate_ids) <= top_n:
-        return candidate_ids
-    return random.sample(candidate_ids, top_n)
+    if len(ids) <= top_n:
+        return ids[np.argsort(-prob, kind="stable")].tolist()
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.choice(ids, size=top_n, replace=False, p=prob).tolist()
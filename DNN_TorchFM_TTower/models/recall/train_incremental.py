@@ -2,10 +2,20 @@
 """
 Two-Tower 模型增量训练脚本
 = 原 train_incremental.py，但从 train_two_tower 导入数据构造工具
+
+只消费上次 checkpoint 之后的新行为：
+  • checkpoint meta["high_water"] 记录已训练到的 MAX(view_date)。NOW() 是事务开始时间，
+    读水位时尚未提交的事务可能带着更早的 view_date 晚到，所以每次读
+    (high_water - RETRAIN_OVERLAP, 当前水位]，外加 view_date 为 NULL 的行；
+    meta["recent_keys"] 记下上次已训练的重叠窗口 + NULL 行的 (user, movie)，重读到的直接丢弃
+  • replay buffer：按 replay_ratio × 新事件数，从水位之前的历史里随机抽一批一起训练，缓解遗忘
+  • 负样本用 NegativeSamplingCollate 现抽；“已看过”按本轮涉及用户的完整历史判断
+  • 每次运行报告新事件吞吐 (events/s)
 """
 
-import os
 import time
+import zlib
+from datetime import datetime, timedelta
 
 import numpy as np
 import torch
@@ -14,48 +24,180 @@ import torch.optim as optim
 from torch.utils.data import DataLoader
 
 from DNN_TorchFM_TTower.models.db import fetchone_dict
-from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerMLPModel
-from DNN_TorchFM_TTower.models.recall.train_two_tower import (
-    generate_training_data,
-    RecommendationDataset,
+from DNN_TorchFM_TTower.models.catalog import get_catalog
+from DNN_TorchFM_TTower.models.config import RETRAIN_OVERLAP
+from DNN_TorchFM_TTower.models.checkpoint import load_checkpoint, save_checkpoint
+from DNN_TorchFM_TTower.models.export import export_after_save
+from DNN_TorchFM_TTower.models.embeddings import GROW_INITS, grow_two_tower
+from DNN_TorchFM_TTower.models.negative_sampling import (
+    NEG_STRATEGIES,
+    NegativeSamplingCollate,
+    PositivePairs,
+    UserHistory,
+    build_strategy,
 )
+from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+from DNN_TorchFM_TTower.models.snapshot import open_snapshot
+from DNN_TorchFM_TTower.models.streaming import high_water_mark, load_interactions
+from DNN_TorchFM_TTower.models.recall.train_two_tower import MODEL_PATH
+
+# 第三列：是否落在下一轮的重叠窗口里（或 view_date 为 NULL），这些 (user, movie) 记进 recent_keys
+NEW_EVENTS_SQL = """
+    SELECT user_id, movie_id, (view_date IS NULL OR view_date > %s)::int
+    FROM view_history
+    WHERE (view_date > %s AND view_date <= %s) OR view_date IS NULL
+"""
+NEW_EVENTS_COUNT_SQL = """
+    SELECT COUNT(*) AS n FROM view_history
+    WHERE (view_date > %s AND view_date <= %s) OR view_date IS NULL
+"""
+# reltuples 是估计值，只用来换算 BERNOULLI 的抽样百分比；LIMIT 保证不超量
+REPLAY_SQL = """
+    SELECT user_id, movie_id FROM view_history
+    TABLESAMPLE BERNOULLI (%s) REPEATABLE (%s)
+    WHERE view_date <= %s
+    LIMIT %s
+"""
+USER_HISTORY_SQL = "SELECT user_id, movie_id FROM view_history WHERE user_id = ANY(%s)"
 
-MODEL_PATH = "saved_model/dnn_recommender.pt"
 
+def _shift(ts: str, seconds: float) -> str:
+    return (datetime.fromisoformat(ts) - timedelta(seconds=seconds)).isoformat()
 
-def incremental_train(neg_ratio: int = 1,
-                      epochs: int = 3,
-                      lr: float = 5e-4):
+
+def _pair_keys(pairs: np.ndarray) -> np.ndarray:
+    return (pairs[:, 0].astype(np.int64) << 32) | pairs[:, 1].astype(np.int64)
+
+
+def _new_events(since: str | None, until: str, known: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     """
-    • 用最新行为重新构造正/负样本  
-    • 在已有模型参数基础上小步训练
+    (since - RETRAIN_OVERLAP, until] 之间的事件 + view_date 为 NULL 的事件，去掉 known（上一轮已训练）；
+    since 为 None（旧 checkpoint 没有水位）时取全部历史。
+    返回 (新事件 (n, 2), 本轮读到的重叠窗口 / NULL 行的 key，供下一轮去重)
     """
-    df = generate_training_data(neg_ratio)
-    if df.empty:
-        print("[incremental] 无训练数据，跳过")
-        return
+    lo = "-infinity" if since is None else _shift(since, RETRAIN_OVERLAP)
+    rows = load_interactions(NEW_EVENTS_SQL, (_shift(until, RETRAIN_OVERLAP), lo, until), ncols=3,
+                             count_sql=NEW_EVENTS_COUNT_SQL, count_params=(lo, until))
+    keys = _pair_keys(rows)
+    new = rows[~np.isin(keys, known), :2]
+    return new, np.unique(keys[rows[:, 2] == 1])
+
 
-    loader = DataLoader(RecommendationDataset(df),
-                        batch_size=64, shuffle=True)
+def _replay_events(until: str, n: int, seed: int) -> np.ndarray:
+    """ 从水位之前的历史里近似均匀地抽 n 条；seed 每轮不同，否则 REPEATABLE 会反复抽到同一批旧行 """
+    if n <= 0:
+        return np.empty((0, 2), dtype=np.int32)
+    est = (fetchone_dict("SELECT reltuples::bigint AS n FROM pg_class WHERE relname = 'view_history'")
+           or {}).get("n") or 0
+    pct = 100.0 if est <= 0 else min(100.0, 150.0 * n / est)   # 多抽 50%，再由 LIMIT 截断
+    return load_interactions(REPLAY_SQL, (pct, seed, until, n), count_sql="SELECT 0 AS n")
 
-    max_u = fetchone_dict("SELECT MAX(id) AS m FROM users")["m"] or 0
-    max_m = fetchone_dict("SELECT MAX(id) AS m FROM movies")["m"] or 0
 
-    if not os.path.exists(MODEL_PATH):
+def _user_histories(user_ids: np.ndarray) -> np.ndarray:
+    """ 本轮涉及用户的全部观看记录，用于负采样时排除已看过的电影 """
+    ids = np.unique(user_ids).tolist()
+    return load_interactions(USER_HISTORY_SQL, (ids,),
+                             count_sql="SELECT COUNT(*) AS n FROM view_history WHERE user_id = ANY(%s)",
+                             count_params=(ids,))
+
+
+def _is_newer(a: str | None, b: str | None) -> bool:
+    if a is None or b is None:
+        return a is not None
+    return datetime.fromisoformat(a) > datetime.fromisoformat(b)
+
+
+def incremental_train(neg_ratio: int = 1,
+                      epochs: int = 3,
+                      lr: float = 5e-4,
+                      grow_init: str = "mean",
+                      snapshot: str | None = None,
+                      replay_ratio: float = 1.0,
+                      batch_size: int = 64,
+                      neg: str = "genre",
+                      seed: int = 42):
+    """
+    • 只取 checkpoint 水位之后的新行为作正样本，并混入 replay_ratio 倍的旧历史
+    • 在已有模型参数基础上小步训练，保存时把水位推进到本轮读取时的 MAX(view_date)
+    • 新用户 / 新电影超出 checkpoint 词表时，原地扩容 embedding 表（旧行保留）
+    • snapshot="latest" / 快照目录时数据取自 memmap 快照，不访问数据库；
+      快照没有逐条的 view_date，只能判断是否整体比 checkpoint 新，新则训练整份快照
+    """
+    if not MODEL_PATH.exists():
         raise FileNotFoundError(
             "[incremental] 基础模型不存在，请先完整训练"
         )
+    state, meta = load_checkpoint(MODEL_PATH)
+    since = meta.get("high_water")
 
-    model = TwoTowerMLPModel(max_u, max_m,
-                             embedding_dim=32, hidden_dim=64)
-    model.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
+    tic = time.time()
+    snap = open_snapshot(snapshot) if snapshot else None
+    if snap is not None:
+        until = snap.high_water
+        if since is not None and not _is_newer(until, since):
+            print(f"[incremental] 快照 {snap.name} 不比 checkpoint 新 (high_water={since})，跳过")
+            return
+        users, movies = (np.asarray(a, dtype=np.int64) for a in snap.interactions())
+        n_new = len(users)
+        hist_users, hist_movies = users, movies
+        catalog = snap.catalog()
+        max_u, max_m, _ = snap.max_ids()
+    else:
+        until = high_water_mark()
+        if until is None:
+            print("[incremental] view_history 为空，跳过")
+            return
+        if since is not None and not _is_newer(until, since):
+            until = since               # 水位不后退；不前进也要读，重叠窗口里可能有晚提交的行
+        # 全量训练的 checkpoint 没有 recent_keys：首轮会把重叠窗口 / NULL 行再训一遍（宁可重复不丢）
+        known = np.asarray(meta.get("recent_keys", []), dtype=np.int64)
+        new, recent_keys = _new_events(since, until, known)
+        n_new = len(new)
+        if not n_new:
+            print(f"[incremental] 自 {since} 以来没有新事件，跳过")
+            return
+        # 每轮一个 TABLESAMPLE 种子（随水位和本轮事件变化），replay 不会反复抽到同一批旧行
+        replay_seed = zlib.crc32(recent_keys.tobytes(), zlib.crc32(f"{seed}:{until}".encode())) & 0x7FFFFFFF
+        replay = _replay_events(since, int(n_new * replay_ratio), replay_seed) if since else new[:0]
+        pairs = np.concatenate([new, replay]).astype(np.int64)
+        users, movies = pairs[:, 0], pairs[:, 1]
+        hist = _user_histories(users).astype(np.int64)
+        hist_users, hist_movies = hist[:, 0], hist[:, 1]
+        catalog = get_catalog()
+        max_u = fetchone_dict("SELECT MAX(id) AS m FROM users")["m"] or 0
+        max_m = fetchone_dict("SELECT MAX(id) AS m FROM movies")["m"] or 0
+    load_s = time.time() - tic
+    print(f"[incremental] 新事件 {n_new} 条 ({since} → {until})，replay {len(users) - n_new} 条，"
+          f"读取 {load_s:.1f}s")
+
+    history = UserHistory(hist_users, catalog.rows(hist_movies), len(catalog))
+    strategy = build_strategy(neg, catalog, history)
+    collate = NegativeSamplingCollate(strategy, history, catalog, neg_ratio, seed=seed)
+    loader = DataLoader(PositivePairs(users, movies), batch_size=batch_size,
+                        shuffle=True, collate_fn=collate)
+
+    # 旧 checkpoint 没有 meta → 默认 mlp，词表大小从权重形状推出
+    meta = {"arch": "mlp", "embedding_dim": 32, "hidden_dim": 64,
+            "num_users": state["user_embedding.weight"].shape[0] - 1,
+            "num_movies": state["movie_embedding.weight"].shape[0] - 1, **meta}
+    model = build_two_tower(**meta)
+    model.load_state_dict(state)
+
+    # 先扩表再建 optimizer，新行才会被 Adam 跟踪
+    if grow_two_tower(model, max(max_u, meta["num_users"]), max(max_m, meta["num_movies"]),
+                      init=grow_init):
+        meta.update(num_users=model.user_embedding.num_embeddings - 1,
+                    num_movies=model.movie_embedding.num_embeddings - 1)
+    if neg == "hard":
+        strategy.refresh(model)         # 难负样本取自当前 checkpoint
 
     criterion = nn.BCEWithLogitsLoss()
     optimizer = optim.Adam(model.parameters(), lr=lr, weight_decay=1e-5)
 
     model.train()
-    tic = time.time()
+    train_tic = time.time()
     for ep in range(1, epochs + 1):
+        collate.set_epoch(ep)
         losses = []
         for u, m, y in loader:
             optimizer.zero_grad()
@@ -65,9 +207,18 @@ def incremental_train(neg_ratio: int = 1,
             losses.append(loss.item())
         print(f"[incremental] epoch {ep}/{epochs}  "
               f"loss={np.mean(losses):.4f}")
+    train_s = time.time() - train_tic
 
-    torch.save(model.state_dict(), MODEL_PATH)
-    print(f"[incremental] Δ 训练完成，用时 {time.time() - tic:.1f}s")
+    meta["high_water"] = until
+    if snap is None:
+        meta["recent_keys"] = recent_keys.tolist()
+    else:
+        meta.pop("recent_keys", None)   # 快照整份训练，没有逐行 view_date
+    save_checkpoint(MODEL_PATH, model.state_dict(), **meta)
+    total_s = time.time() - tic
+    print(f"[incremental] Δ 训练完成，用时 {total_s:.1f}s (训练 {train_s:.1f}s)  "
+          f"吞吐 {n_new / max(total_s, 1e-9):.1f} events/s  high_water → {until}")
+    export_after_save("two_tower", MODEL_PATH)
 
 
 if __name__ == "__main__":
@@ -75,6 +226,15 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--epochs", type=int, default=3)
     ap.add_argument("--neg_ratio", type=int, default=1)
+    ap.add_argument("--grow_init", choices=GROW_INITS, default="mean",
+                    help="init for embedding rows of ids newer than the checkpoint")
+    ap.add_argument("--snapshot", default=None, help="'latest' or a snapshot dir; skips the DB")
+    ap.add_argument("--replay_ratio", type=float, default=1.0,
+                    help="older events replayed per new event")
+    ap.add_argument("--neg", choices=NEG_STRATEGIES, default="genre")
+    ap.add_argument("--seed", type=int, default=42)
     args = ap.parse_args()
 
-    incremental_train(neg_ratio=args.neg_ratio, epochs=args.epochs)
+    incremental_train(neg_ratio=args.neg_ratio, epochs=args.epochs, grow_init=args.grow_init,
+                      snapshot=args.snapshot, replay_ratio=args.replay_ratio,
+                      neg=args.neg, seed=args.seed)
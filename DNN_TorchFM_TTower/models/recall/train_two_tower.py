@@ -3,110 +3,43 @@
 Two-Tower 召回模型离线训练脚本
 = 旧版 train.py，调整了 import 路径并改名
 """
-import os
-import random
 import time
-from pathlib import Path
-from typing import List, Dict, Set
 
 import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
 from tqdm import tqdm  # ← 新增
 
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
 
-from DNN_TorchFM_TTower.models.db import fetchall_dict, fetchone_dict
-from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerMLPModel
-
-# ---------------------------------------------------------------------------
-#                     固定 saved_model 目录到包根下                           #
-# ---------------------------------------------------------------------------
-ROOT_DIR   = Path(__file__).resolve().parents[2]           # …/CINEIA/DNN_TorchFM_TTower
-SAVE_DIR   = ROOT_DIR / "saved_model"
-SAVE_DIR.mkdir(parents=True, exist_ok=True)
+from DNN_TorchFM_TTower.models.db import fetchone_dict
+from DNN_TorchFM_TTower.models.catalog import get_catalog
+from DNN_TorchFM_TTower.models.checkpoint import save_checkpoint
+from DNN_TorchFM_TTower.models.config import SAVE_DIR
+from DNN_TorchFM_TTower.models.export import export_after_save
+from DNN_TorchFM_TTower.models.negative_sampling import (
+    NEG_STRATEGIES,
+    NegativeSamplingCollate,
+    UserHistory,
+    build_strategy,
+)
+from DNN_TorchFM_TTower.models.snapshot import open_snapshot
+from DNN_TorchFM_TTower.models.streaming import (
+    high_water_mark,
+    load_history,
+    load_interactions,
+    positive_loaders,
+    set_epoch,
+)
+from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+
+# saved_model 目录取自 config，与 registry (two_tower.MODEL_PATH) 同源；
+# 目录由 save_checkpoint 在写入时创建，import 时不再 mkdir
 MODEL_PATH = SAVE_DIR / "dnn_recommender.pt"
 
-
-# os.makedirs("saved_model", exist_ok=True)
-
 # --------------------------------------------------------------------------- #
-#                            数据提取 / 特征构造                               #
+#                            数据提取                                          #
 # --------------------------------------------------------------------------- #
-def get_all_movies() -> List[int]:
-    return [r["id"] for r in fetchall_dict("SELECT id FROM movies")]
-
-
-def get_movie_genres() -> Dict[int, Set[int]]:
-    rows = fetchall_dict("SELECT movie_id, genre_id FROM movie_genre")
-    m2g = {}
-    for r in rows:
-        m2g.setdefault(r["movie_id"], set()).add(r["genre_id"])
-    return m2g
-
-
-def get_positive_samples() -> pd.DataFrame:
-    """
-    view_history 中的每条观看记录视为正样本 (label=1)
-    """
-    rows = fetchall_dict("SELECT user_id, movie_id FROM view_history")
-    if not rows:
-        return pd.DataFrame(columns=["user_id", "movie_id", "rating"])
-    df = pd.DataFrame(rows)
-    df["rating"] = 1.0
-    return df
-
-
-def generate_training_data(neg_ratio: int = 1) -> pd.DataFrame:
-    """
-    正样本：view_history  
-    负样本：同用户未看过，且题材与已看影片不重叠的随机采样
-    """
-    pos_df = get_positive_samples()
-    if pos_df.empty:
-        return pos_df
-
-    all_movies = set(get_all_movies())
-    movie_genres = get_movie_genres()
-
-    user_pos = pos_df.groupby("user_id")["movie_id"].apply(set).to_dict()
-    user_genres = {
-        u: {g for m in ms for g in movie_genres.get(m, set())}
-        for u, ms in user_pos.items()
-    }
-
-    neg_records = []
-    for u, pos in user_pos.items():
-        watched_genres = user_genres.get(u, set())
-        # candidate: 未看 & 题材不重叠
-        cand = [m for m in all_movies - pos
-                if movie_genres.get(m, set()).isdisjoint(watched_genres)]
-        num_neg = min(len(cand), neg_ratio * len(pos))
-        if num_neg:
-            neg_records += [{"user_id": u, "movie_id": m, "rating": 0.0}
-                            for m in random.sample(cand, num_neg)]
-
-    neg_df = pd.DataFrame(neg_records)
-    train_df = pd.concat([pos_df, neg_df], ignore_index=True)
-    return train_df
-
-
-class RecommendationDataset(Dataset):
-    def __init__(self, df: pd.DataFrame):
-        self.users = torch.tensor(df["user_id"].values, dtype=torch.long)
-        self.movies = torch.tensor(df["movie_id"].values, dtype=torch.long)
-        self.labels = torch.tensor(df["rating"].values, dtype=torch.float32)
-
-    def __len__(self):
-        return len(self.users)
-
-    def __getitem__(self, idx):
-        return self.users[idx], self.movies[idx], self.labels[idx]
-
-
 def _get_max_ids() -> tuple[int, int]:
     mu = fetchone_dict("SELECT MAX(id) AS m FROM users")["m"] or 0
     mm = fetchone_dict("SELECT MAX(id) AS m FROM movies")["m"] or 0
@@ -116,22 +49,64 @@ def _get_max_ids() -> tuple[int, int]:
 # --------------------------------------------------------------------------- #
 #                               训 练 主 程 序                                 #
 # --------------------------------------------------------------------------- #
-def main(epochs: int = 3, batch_size: int = 128, neg_ratio: int = 1):
-    df = generate_training_data(neg_ratio)
-    if df.empty:
+def main(epochs: int = 3, batch_size: int = 128, neg_ratio: int = 1,
+         arch: str = "mlp", score: str = "dot", seed: int = 42,
+         neg: str = "genre", alpha: float = 0.75, workers: int = 0, stream: bool = False,
+         snapshot: str | None = None):
+    """
+    arch  : "mlp" = 原拼接 + MLP 打分；"dot" = 独立双塔 + 点积，item 向量可预计算
+    score : 仅 arch="dot" 时有效，"dot" | "cosine"
+    neg   : 负采样策略 (models/negative_sampling.NEG_STRATEGIES)，在 DataLoader 里按 batch 现抽；
+            "genre" 与旧版一致（未看 & 题材不重叠），"hard" 需要 arch="dot"
+    batch_size 指每个 batch 的正样本数，实际 batch ≈ batch_size × (1 + neg_ratio)
+    stream: 正样本每个 epoch 从 view_history 流式读取 (models/streaming.py)，负采样用的 history
+            也按块构建 (load_history)，整表 (user, movie) 对不驻留内存
+    snapshot: "latest" 或快照目录 (models/snapshot.py)；给出时全部数据取自 memmap 快照，不访问数据库
+    """
+    if neg == "hard" and arch != "dot":
+        raise SystemExit("[train_two_tower] --neg hard 需要 --arch dot")
+
+    snap = open_snapshot(snapshot) if snapshot else None
+    users = movies = None
+    if snap is not None:
+        users, movies = snap.interactions()
+        catalog = snap.catalog()
+        high_water = snap.high_water
+        stream = False              # memmap 本身就不占常驻内存
+        print(f"[train_two_tower] snapshot {snap.name} ({snap.manifest['created_at']})")
+    else:
+        high_water = high_water_mark()  # 先取水位再读表，读取期间的新事件留给增量训练
+        catalog = get_catalog()
+        if not stream:
+            pairs = load_interactions()
+            users, movies = pairs[:, 0], pairs[:, 1]
+
+    if stream:
+        # 正样本每个 epoch 流式读取；负采样用的 history 也逐块构建，整表 (user, movie) 对从不驻留内存
+        history = load_history(catalog)
+        n_pos = len(history.keys)
+    else:
+        users, movies = np.asarray(users, dtype=np.int64), np.asarray(movies, dtype=np.int64)
+        history = UserHistory(users, catalog.rows(movies), len(catalog))
+        n_pos = len(users)
+    if not n_pos:
         print("[train_two_tower] ❌ 训练集为空")
         return
 
-    print(f"[train_two_tower] 样本 {len(df)} | 用户 {df['user_id'].nunique()} | 电影 {df['movie_id'].nunique()}")
+    strategy = build_strategy(neg, catalog, history, alpha=alpha)
+    print(f"[train_two_tower] 正样本 {n_pos} | 用户 {len(history)} | 负采样 {neg} × {neg_ratio}")
 
-    train_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
-    train_loader = DataLoader(RecommendationDataset(train_df),
-                              batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(RecommendationDataset(val_df),
-                            batch_size=batch_size, shuffle=False)
+    train_collate = NegativeSamplingCollate(strategy, history, catalog, neg_ratio, seed=seed)
+    val_collate = NegativeSamplingCollate(strategy, history, catalog, neg_ratio, seed=seed + 1)
+    train_loader, val_loader = positive_loaders(users, movies, train_collate, val_collate,
+                                                batch_size, workers=workers, stream=stream, seed=seed)
 
-    max_u, max_m = _get_max_ids()
-    model = TwoTowerMLPModel(max_u, max_m, embedding_dim=32, hidden_dim=64)
+    max_u, max_m = snap.max_ids()[:2] if snap is not None else _get_max_ids()
+    model_meta = dict(arch=arch, num_users=max_u, num_movies=max_m,
+                      embedding_dim=32, hidden_dim=64, high_water=high_water)
+    if arch == "dot":
+        model_meta.update(out_dim=32, score=score)
+    model = build_two_tower(**model_meta)
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model = model.to(device)
@@ -142,6 +117,9 @@ def main(epochs: int = 3, batch_size: int = 128, neg_ratio: int = 1):
     best_val = float("inf")
     for ep in range(1, epochs + 1):
         ep_start = time.time()
+        set_epoch(train_loader, ep)
+        if neg == "hard" and ep > 1:
+            strategy.refresh(model)     # 用上一轮的模型重新挖难负样本
         model.train()
         tloss = []
 
@@ -168,10 +146,14 @@ def main(epochs: int = 3, batch_size: int = 128, neg_ratio: int = 1):
 
         if avg_v < best_val:
             best_val = avg_v
-            torch.save(model.state_dict(), MODEL_PATH)
+            save_checkpoint(MODEL_PATH,
+                            {k: v.cpu() for k, v in model.state_dict().items()},
+                            **model_meta)
             print("   ↳  Model saved")
 
     print(f"[train_two_tower] Done，best val={best_val:.4f}")
+    if best_val < float("inf"):
+        export_after_save("two_tower", MODEL_PATH)      # 最优 epoch 的 checkpoint → TorchScript 推断图
 
 
 if __name__ == "__main__":
@@ -180,6 +162,17 @@ if __name__ == "__main__":
     ap.add_argument("--epochs", type=int, default=3)        # 默认为 3
     ap.add_argument("--batch", type=int, default=128)
     ap.add_argument("--neg_ratio", type=int, default=1)
+    ap.add_argument("--arch", choices=["mlp", "dot"], default="mlp")
+    ap.add_argument("--score", choices=["dot", "cosine"], default="dot")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--neg", choices=NEG_STRATEGIES, default="genre")
+    ap.add_argument("--alpha", type=float, default=0.75, help="exponent for --neg popularity")
+    ap.add_argument("--workers", type=int, default=0, help="DataLoader workers")
+    ap.add_argument("--stream", action="store_true", help="stream positives from Postgres each epoch")
+    ap.add_argument("--snapshot", default=None, help="'latest' or a snapshot dir; skips the DB")
     args = ap.parse_args()
 
-    main(epochs=args.epochs, batch_size=args.batch, neg_ratio=args.neg_ratio)
\ No newline at end of file
+    main(epochs=args.epochs, batch_size=args.batch, neg_ratio=args.neg_ratio,
+         arch=args.arch, score=args.score, seed=args.seed,
+         neg=args.neg, alpha=args.alpha, workers=args.workers, stream=args.stream,
+         snapshot=args.snapshot)
\ No newline at end of file
@@ -6,38 +6,126 @@ Two-Tower 召回模型推断逻辑
     from models.recall.two_tower import load_model, recommend_warm_start
 """
 
+import math
 import os
 import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
 import torch
 
-from DNN_TorchFM_TTower.models.db import (
-    get_max_user_id,
-    get_max_movie_id,
-    get_all_movie_ids_with_language,
-    get_user_view_languages,
+from DNN_TorchFM_TTower.models.db import get_user_view_languages
+from DNN_TorchFM_TTower.models.catalog import CatalogSnapshot, get_catalog
+from DNN_TorchFM_TTower.models.checkpoint import load_checkpoint
+from DNN_TorchFM_TTower.models.config import (
+    SAVE_DIR, RECALL_SEARCH, ANN_NLIST, ANN_NPROBE, ANN_INDEX_DIR,
 )
-from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerMLPModel
+from DNN_TorchFM_TTower.models.registry import CheckpointRegistry
+from DNN_TorchFM_TTower.models.export import artifact_path, export_checkpoint, load_exported
+from DNN_TorchFM_TTower.models.recall.ann_index import IVFIndex, build_index, load_index
+from DNN_TorchFM_TTower.models.topk import topk_indices, topk_rows
+from DNN_TorchFM_TTower.models.pytorch_model import TwoTowerMLPModel, TwoTowerDotModel, build_two_tower
 
 
 # --------------------------------------------------------------------------- #
 #                           模型加载 / 缓存                                    #
 # --------------------------------------------------------------------------- #
-_MODEL_CACHE = {}  # {"path": model}
+MODEL_PATH = SAVE_DIR / "dnn_recommender.pt"
 
+# 批量召回每次打分的规模上限，控制峰值内存
+BATCH_SCORE_ELEMS = 1 << 22     # dot：(用户 × 候选) logits 元素数
+BATCH_MLP_PAIRS = 1 << 18       # mlp：一次前向的 (user, movie) 对数
 
-from pathlib import Path
+_MODEL_CACHE = {}  # {"path": model}，仅用于显式指定的其它 checkpoint
+
+
+def _example_inputs(model, batch: int) -> dict:
+    """ 导出 / 复核用的随机输入：{方法名: 参数元组}；dot 双塔的四个推断方法都要导出 """
+    users = torch.randint(0, model.user_embedding.num_embeddings, (batch,))
+    movies = torch.randint(0, model.movie_embedding.num_embeddings, (batch,))
+    inputs = {"forward": (users, movies)}
+    if isinstance(model, TwoTowerDotModel):
+        with torch.no_grad():
+            user_vec, item_vec = model.user_vectors(users), model.item_vectors(movies)
+        inputs.update(user_vectors=(users,), item_vectors=(movies,),
+                      score_vectors=(user_vec, item_vec))
+    return inputs
+
+
+def _build_model(model_path, exported: bool = True):
+    """
+    arch / 词表大小优先取 checkpoint meta；旧格式 checkpoint 按 mlp 重建，
+    词表大小直接从权重形状推出（不再依赖当前库里的 MAX(id)，新增用户也不会形状不匹配）。
+    exported=True 时旁边有匹配的推断图 (models/export.py) 就把推断方法换成推断图的。
+    """
+    state, meta = load_checkpoint(model_path)
+    if "num_users" not in meta:
+        meta.update(arch="mlp",
+                    num_users=state["user_embedding.weight"].shape[0] - 1,
+                    num_movies=state["movie_embedding.weight"].shape[0] - 1,
+                    embedding_dim=state["user_embedding.weight"].shape[1],
+                    hidden_dim=64)
+    model = build_two_tower(**meta)
+    model.load_state_dict(state)
+    model.eval()
+    model.runtime = "eager"
+    if exported:
+        inputs = _example_inputs(model, 8)
+        graph = load_exported(model_path, model, inputs)
+        if graph is not None:
+            for name in inputs:
+                setattr(model, name, getattr(graph, name))
+            model.runtime = "torchscript"
+    return model
+
+
+def export_model(path=MODEL_PATH):
+    """ 把双塔 checkpoint 导出成 TorchScript 推断图（与 eager 对比通过才写入） """
+    return export_checkpoint(path, lambda p: _build_model(p, exported=False), _example_inputs)
 
-def load_model(model_path: str = None, embedding_dim: int = 32) -> TwoTowerMLPModel:
+
+def _warmup(model, n_dummy: int = 3):
     """
-    读取并缓存 Two-Tower 模型；多次调用不会重复 load。
+    swap 之前预热新模型：几次 dummy 前向；dot 双塔顺带把 item 矩阵 / ANN 索引算好，
+    这样 swap 后的第一个真实请求不用再付这些一次性开销
     """
-    # 如果没有指定路径，默认用绝对路径
-    if model_path is None:
-        CURRENT_DIR = Path(__file__).resolve().parent  # DNN_TorchFM_TTower/models/recall
-        model_path = CURRENT_DIR.parent.parent / 'saved_model' / 'dnn_recommender.pt'
+    with torch.no_grad():
+        users = torch.ones(8, dtype=torch.long)
+        movies = torch.ones(8, dtype=torch.long)
+        for _ in range(n_dummy):
+            model(users, movies)
+
+    if isinstance(model, TwoTowerDotModel):
+        try:
+            catalog = get_catalog()
+        except Exception as e:          # 没有数据库时只做 dummy 前向
+            print(f"[two_tower] warmup skipped item cache: {e}")
+            return
+        item_matrix(model, catalog)
+        if RECALL_SEARCH != "exact":
+            ann_index(model, catalog)
+
+
+# 进程内共享的版本化模型；train_two_tower / train_incremental 覆盖文件后自动预热 + 热替换
+TOWER = CheckpointRegistry(MODEL_PATH, _build_model, warmup=_warmup, name="two_tower",
+                           companions=(artifact_path(MODEL_PATH),))
+
+
+def load_model(model_path: str = None):
+    """
+    默认路径 → registry 当前版本（文件更新后自动切换到新版本）；
+    显式指定其它路径 → 读取一次并缓存。
+    """
+    if model_path is None or Path(model_path).resolve() == MODEL_PATH.resolve():
+        model = TOWER.get()
+        if model is None:
+            raise FileNotFoundError(
+                f"[two_tower] 模型文件 {MODEL_PATH} 不存在，请先训练再推断。"
+            )
+        return model
 
     model_path = Path(model_path)
 
@@ -49,23 +137,178 @@ def load_model(model_path: str = None, embedding_dim: int = 32) -> TwoTowerMLPMo
             f"[two_tower] 模型文件 {model_path} 不存在，请先训练再推断。"
         )
 
-    max_u, max_m = get_max_user_id(), get_max_movie_id()
-    model = TwoTowerMLPModel(max_u, max_m,
-                             embedding_dim=embedding_dim,
-                             hidden_dim=64)
-    state = torch.load(model_path, map_location=torch.device("cpu"))
-    model.load_state_dict(state)
-    model.eval()
-
+    model = _build_model(model_path)
     _MODEL_CACHE[str(model_path)] = model
     return model
 
 
+# --------------------------------------------------------------------------- #
+#                  item 向量缓存（仅 TwoTowerDotModel）                         #
+# --------------------------------------------------------------------------- #
+_ITEM_CACHE = weakref.WeakKeyDictionary()   # model -> (catalog version, item matrix)
+
+
+def item_vocab(model, catalog: CatalogSnapshot) -> np.ndarray:
+    """ 与 catalog 行对齐的 bool 掩码：电影是否在模型的 item 词表里（模型之后新增的电影为 False） """
+    return catalog.movie_ids < model.movie_embedding.num_embeddings
+
+
+def item_matrix(model: TwoTowerDotModel, catalog: CatalogSnapshot) -> torch.Tensor:
+    """
+    整个 catalog 的 item 向量 (N, D)，行号与 catalog 行号一致。
+    每个 (模型, catalog 版本) 只计算一次；超出 embedding 表范围的电影只占位 (0 向量)，
+    打分 / 检索时须按 item_vocab 排除，不能当作 logit 0 的候选
+    """
+    cached = _ITEM_CACHE.get(model)
+    if cached is not None and cached[0] == catalog.version:
+        return cached[1]
+
+    ids = torch.from_numpy(catalog.movie_ids)
+    known = torch.from_numpy(item_vocab(model, catalog))
+    out_dim = model.item_tower[-1].out_features
+    mat = torch.zeros(len(ids), out_dim)
+    with torch.no_grad():
+        for start in range(0, len(ids), 65536):
+            chunk = slice(start, start + 65536)
+            k = known[chunk]
+            mat[chunk][k] = model.item_vectors(ids[chunk][k])
+
+    _ITEM_CACHE[model] = (catalog.version, mat)
+    return mat
+
+
+def _score_candidates(model, user_id: int, candidate_movies: np.ndarray,
+                      catalog: CatalogSnapshot) -> np.ndarray:
+    """ 返回候选集的 logits (numpy)；不在模型 item 词表里的候选为 -inf，不会进 top-k """
+    rows = catalog.rows(candidate_movies)
+    known = (rows >= 0) & (candidate_movies < model.movie_embedding.num_embeddings)
+    logits = np.full(len(candidate_movies), -np.inf, dtype=np.float32)
+    with torch.no_grad():
+        if isinstance(model, TwoTowerDotModel):
+            # 一次矩阵 × 向量：cached item matrix · user vector
+            items = item_matrix(model, catalog)[torch.from_numpy(rows[known]).long()]
+            user_vec = model.user_vectors(torch.tensor([user_id], dtype=torch.long))[0]
+            scores = model.score_vectors(user_vec, items)
+        else:
+            movie_tensor = torch.from_numpy(candidate_movies[known])
+            user_tensor = torch.full((len(movie_tensor),),
+                                     user_id, dtype=torch.long)
+            scores = model(user_tensor, movie_tensor)
+    logits[known] = scores.numpy().flatten()
+    return logits
+
+
+# --------------------------------------------------------------------------- #
+#               ANN 检索（RECALL_SEARCH = "ivf"，仅 dot 双塔）                  #
+# --------------------------------------------------------------------------- #
+_ANN_CACHE = weakref.WeakKeyDictionary()    # model -> (catalog version, index)
+_MASK_CACHE = weakref.WeakKeyDictionary()   # model -> (catalog version, {语言集合: allowed 掩码})
+MASK_CACHE_SIZE = 32                        # 每个 (模型, catalog 版本) 最多缓存的语言集合数 (LRU)
+INDEX_CHECK_ROWS = 1024                     # 校验持久化索引时抽查的向量行数
+
+
+def _persisted_index(model: TwoTowerDotModel, catalog: CatalogSnapshot, path=None):
+    """
+    ann_index build 落盘的索引 (mmap 打开，多 worker 共享页缓存)；
+    类型与 RECALL_SEARCH 不符、行与当前 catalog 不对齐、或抽查的向量与当前模型不一致时返回 None
+    """
+    path = Path(path or ANN_INDEX_DIR)
+    if not (path / "meta.json").exists():
+        return None
+    try:
+        index = load_index(path, mmap=True)
+    except Exception as e:              # 文件缺失 / 损坏
+        print(f"[two_tower] ANN index at {path} ignored: {type(e).__name__}: {e}")
+        return None
+    if index.kind != RECALL_SEARCH:
+        return None
+    rows = index.rows if isinstance(index, IVFIndex) else np.arange(len(index))
+    if len(index) != len(catalog) or not np.array_equal(catalog.rows(index.ids), rows):
+        print(f"[two_tower] ANN index at {path} is stale (catalog changed), rebuilding in memory")
+        return None
+    sample = np.unique(np.linspace(0, len(index) - 1, min(len(index), INDEX_CHECK_ROWS)).astype(np.int64))
+    expected = item_matrix(model, catalog).numpy()[rows[sample]]
+    if not np.allclose(index.vectors[sample], expected, rtol=1e-4, atol=1e-5):
+        print(f"[two_tower] ANN index at {path} is stale (model changed), rebuilding in memory")
+        return None
+    if isinstance(index, IVFIndex):
+        index.nprobe = ANN_NPROBE
+    return index
+
+
+def ann_index(model: TwoTowerDotModel, catalog: CatalogSnapshot):
+    """
+    每个 (模型, catalog 版本) 取一次 ANN 索引：优先 mmap 加载 ANN_INDEX_DIR 下与之匹配的持久化索引，
+    否则在进程内构建
+    """
+    cached = _ANN_CACHE.get(model)
+    if cached is not None and cached[0] == catalog.version:
+        return cached[1]
+    index = _persisted_index(model, catalog)
+    if index is None:
+        index = build_index(RECALL_SEARCH, item_matrix(model, catalog).numpy(), catalog.movie_ids,
+                            nlist=ANN_NLIST, nprobe=ANN_NPROBE)
+    _ANN_CACHE[model] = (catalog.version, index)
+    return index
+
+
+def _candidate_mask(model, catalog: CatalogSnapshot, langs: frozenset,
+                    candidate_movies: np.ndarray) -> np.ndarray:
+    """ 与 catalog 行对齐、且限于模型 item 词表的候选掩码；同一 (模型, catalog 版本, 语言集合) 只构建一次 """
+    cached = _MASK_CACHE.get(model)
+    if cached is None or cached[0] != catalog.version:
+        cached = (catalog.version, OrderedDict())
+        _MASK_CACHE[model] = cached
+    masks = cached[1]
+    mask = masks.get(langs)
+    if mask is None:
+        mask = np.zeros(len(catalog), dtype=bool)
+        mask[catalog.rows(candidate_movies)] = True
+        mask &= item_vocab(model, catalog)          # 占位的 0 向量行不参与检索
+        masks[langs] = mask
+        if len(masks) > MASK_CACHE_SIZE:
+            masks.popitem(last=False)
+    else:
+        masks.move_to_end(langs)
+    return mask
+
+
+def _ann_search(model, user_id: int, candidate_movies: np.ndarray,
+                catalog: CatalogSnapshot, top_n: int, langs: frozenset):
+    """
+    返回 (movie_ids, logits)；不适用 ANN 时返回 None，由调用方回退到精确打分。
+    langs 为生成 candidate_movies 的语言集合，用作候选掩码的缓存键。
+    候选只占 catalog 的 f 时，IVF 每个簇平均只剩 f 的 item 可用：nprobe 先按 1/f 放大，
+    结果仍不足 top_n 再翻倍，最多扫描全部簇（即过滤后的精确检索），不再整体回退
+    """
+    if RECALL_SEARCH == "exact" or not isinstance(model, TwoTowerDotModel):
+        return None
+    allowed = _candidate_mask(model, catalog, langs, candidate_movies)
+    with torch.no_grad():
+        user_vec = model.user_vectors(torch.tensor([user_id], dtype=torch.long))[0].numpy()
+    index = ann_index(model, catalog)
+    need = min(top_n, len(candidate_movies))
+    if isinstance(index, IVFIndex):
+        nlist = len(index.centroids)
+        nprobe = min(nlist, math.ceil(index.nprobe * len(catalog) / max(1, len(candidate_movies))))
+        while True:
+            ids, logits = index.search(user_vec, top_n, allowed=allowed, nprobe=nprobe)
+            if len(ids) >= need or nprobe >= nlist:
+                break
+            nprobe = min(nlist, 2 * nprobe)
+    else:
+        ids, logits = index.search(user_vec, top_n, allowed=allowed)
+    if len(ids) < need:
+        return None
+    if model.score == "cosine":
+        logits = logits / model.temperature
+    return ids, logits
+
 
 # --------------------------------------------------------------------------- #
 #                           推 断 主 逻 辑                                     #
 # --------------------------------------------------------------------------- #
-def recommend_warm_start(model: TwoTowerMLPModel,
+def recommend_warm_start(model,
                          user_id: int,
                          top_n: int = 10
                          ) -> Tuple[List[int], List[float]]:
@@ -81,35 +324,103 @@ def recommend_warm_start(model: TwoTowerMLPModel,
     """
     tic = time.time()
 
-    # 1) 根据用户偏好语言做 candidate 下采样
+    # 1) 根据用户偏好语言做 candidate 下采样（读内存快照，不扫 movies 表）
     preferred_langs = get_user_view_languages(user_id)
-    all_movies = get_all_movie_ids_with_language()
+    catalog = get_catalog()
+    candidate_movies = catalog.ids_for_languages(preferred_langs)
 
-    if preferred_langs:
-        candidate_movies = [m for m, lang in all_movies
-                            if lang in preferred_langs]
-    else:
-        candidate_movies = [m for m, _ in all_movies]
+    # 模型训练之后才出现的用户 / 电影不在 embedding 表里：
+    # 用户 → 交给上层走冷启动；电影 → 暂不参与召回，等 train_incremental 扩表
+    if user_id >= model.user_embedding.num_embeddings:
+        print(f"[two_tower] user {user_id} not in model vocab yet, skip warm recall")
+        return [], []
+    candidate_movies = candidate_movies[candidate_movies < model.movie_embedding.num_embeddings]
 
-    if not candidate_movies:
+    if not len(candidate_movies):
         return [], []
 
-    # 2) 模型推断
-    movie_tensor = torch.tensor(candidate_movies, dtype=torch.long)
-    user_tensor = torch.full((len(candidate_movies),),
-                             user_id, dtype=torch.long)
+    # 2) 模型推断 + 取 Top-N
+    #    ANN 索引 (RECALL_SEARCH="ivf")；否则 dot 双塔走缓存的 item 矩阵，mlp 逐候选前向
+    hit = _ann_search(model, user_id, candidate_movies, catalog, top_n,
+                      langs=frozenset(preferred_langs or ()))
+    if hit is not None:
+        top_movie_ids, top_logits = hit
+    else:
+        logits = _score_candidates(model, user_id, candidate_movies, catalog)
+        top_idx = topk_indices(logits, top_n)
+        top_movie_ids = candidate_movies[top_idx]
+        top_logits = logits[top_idx]
+    top_scores = torch.sigmoid(torch.from_numpy(top_logits)).numpy()
+
+    print(f"[two_tower] Inference finished in {time.time() - tic:.2f}s")
+    return top_movie_ids.tolist(), top_scores.tolist()
 
+
+def _score_users(model, user_ids: list[int], candidate_movies: np.ndarray,
+                 items: torch.Tensor | None) -> torch.Tensor:
+    """ (U, C) logits：dot 双塔一次矩阵乘；mlp 把 U × C 对拼成一个 batch 前向 """
+    users = torch.tensor(user_ids, dtype=torch.long)
     with torch.no_grad():
-        logits = model(user_tensor, movie_tensor)
-        scores = torch.sigmoid(logits).numpy().flatten()
+        if items is not None:
+            logits = model.user_vectors(users) @ items.T
+            if model.score == "cosine":
+                logits = logits / model.temperature
+            return logits
+        movies = torch.from_numpy(candidate_movies)
+        logits = model(users.repeat_interleave(len(movies)), movies.repeat(len(users)))
+    return logits.view(len(users), len(movies))
 
-    # 3) 取 Top-N
-    top_idx = np.argsort(-scores)[:top_n]
-    top_movie_ids = np.array(candidate_movies)[top_idx]
-    top_scores = scores[top_idx]
 
-    print(f"[two_tower] Inference finished in {time.time() - tic:.2f}s")
-    return top_movie_ids.tolist(), top_scores.tolist()
+def recommend_warm_start_batch(model,
+                               user_ids: List[int],
+                               top_n: int = 10,
+                               languages: dict | None = None
+                               ) -> dict[int, Tuple[List[int], List[float]]]:
+    """
+    recommend_warm_start 的批量版：返回 {user_id: (movie_ids, scores)}
+
+    偏好语言相同的用户共享同一候选集，(用户 × 候选) 一次打分再逐行 top-k，
+    不再每个用户各做一次前向。languages = {user_id: 偏好语言集合}，由调用方一次查出；
+    缺省时逐个查库。不在模型词表里的用户返回 ([], [])，交给上层走冷启动。
+    批量路径总是精确打分，不走 ANN 索引。
+    """
+    tic = time.time()
+    catalog = get_catalog()
+    if languages is None:
+        languages = {uid: get_user_view_languages(uid) for uid in user_ids}
+
+    out = {}
+    groups = {}
+    for uid in user_ids:
+        if uid >= model.user_embedding.num_embeddings:
+            out[uid] = ([], [])
+        else:
+            groups.setdefault(frozenset(languages.get(uid) or ()), []).append(uid)
+
+    is_dot = isinstance(model, TwoTowerDotModel)
+    for langs, uids in groups.items():
+        candidate_movies = catalog.ids_for_languages(langs)
+        candidate_movies = candidate_movies[candidate_movies < model.movie_embedding.num_embeddings]
+        if not len(candidate_movies):
+            out.update({uid: ([], []) for uid in uids})
+            continue
+
+        items = None
+        if is_dot:
+            rows = torch.from_numpy(catalog.rows(candidate_movies)).long()
+            items = item_matrix(model, catalog)[rows]
+        step = max(1, (BATCH_SCORE_ELEMS if is_dot else BATCH_MLP_PAIRS) // len(candidate_movies))
+        for start in range(0, len(uids), step):
+            chunk = uids[start:start + step]
+            top_logits, top_idx = topk_rows(_score_users(model, chunk, candidate_movies, items), top_n)
+            top_scores = torch.sigmoid(top_logits).numpy()
+            top_idx = top_idx.numpy()
+            for row, uid in enumerate(chunk):
+                out[uid] = (candidate_movies[top_idx[row]].tolist(), top_scores[row].tolist())
+
+    print(f"[two_tower] Batch inference for {len(user_ids)} users "
+          f"({len(groups)} candidate sets) finished in {time.time() - tic:.2f}s")
+    return out
 
 
 # --------------------------------------------------------------------------- #
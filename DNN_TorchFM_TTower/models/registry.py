@@ -0,0 +1,187 @@
+# DNN_TorchFM_TTower\models\registry.py
+"""
+进程内模型注册表：每个 checkpoint 只加载一次，文件更新后自动热替换
+
+    registry = CheckpointRegistry(path, loader, warmup=fn)
+    model = registry.get()        # 文件不存在时返回 None
+
+• 首次 get() 同步加载，并启动后台 watcher 线程
+• watcher 每 watch_interval 秒 stat 一次文件 (mtime_ns, size)
+• 签名变化 → 读文件算 sha1；内容确实变了才重新 loader(path)
+• companions：随 checkpoint 一起生效的附属文件（导出的推断图 .ts），其 (mtime_ns, size)
+  计入签名，出现 / 更新 / 删除时同样重新加载
+• 新模型先跑 warmup(model)（几次 dummy 推断 / 预计算缓存），再整体替换引用；
+  请求线程永远拿到已预热的完整模型，swap 后第一次请求没有延迟尖峰
+• 每次替换记一个递增版本号，最近若干版本的元信息可通过 status() 查看
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+_REGISTRIES: dict[str, "CheckpointRegistry"] = {}
+
+
+def _file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CheckpointRegistry:
+    def __init__(self,
+                 path,
+                 loader: Callable,
+                 warmup: Callable | None = None,
+                 watch_interval: float = 2.0,
+                 name: str | None = None,
+                 history: int = 5,
+                 companions=()):
+        self.path = Path(path)
+        self.companions = [Path(p) for p in companions]
+        self.loader = loader
+        self.warmup = warmup
+        self.watch_interval = watch_interval
+        self.name = name or self.path.stem
+
+        self._model = None
+        self._signature = None          # (mtime_ns, size) + 每个 companion 的 (mtime_ns, size)
+        self._sha1 = None
+        self._version = 0
+        self._history = deque(maxlen=history)
+        self._last_error = None
+
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        _REGISTRIES[self.name] = self
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        sig = (st.st_mtime_ns, st.st_size)
+        for p in self.companions:
+            try:
+                c = os.stat(p)
+                sig += (c.st_mtime_ns, c.st_size)
+            except FileNotFoundError:
+                sig += (None, None)
+        return sig
+
+    # ------------------------------------------------------------------ #
+    #                         加载 / 替换                                 #
+    # ------------------------------------------------------------------ #
+    def refresh(self, force: bool = False) -> bool:
+        """
+        检查文件并在内容变化时重新加载 + 预热 + 替换；返回是否发生了替换
+        """
+        with self._lock:
+            sig = self._stat()
+            if sig is None:
+                return False
+            if not force and sig == self._signature:
+                return False
+            sha1 = _file_sha1(self.path)
+            same_companions = self._signature is not None and sig[2:] == self._signature[2:]
+            if not force and sha1 == self._sha1 and same_companions:
+                self._signature = sig   # 仅 touch，内容未变
+                return False
+
+            tic = time.perf_counter()
+            model = self.loader(self.path)
+            load_s = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            if self.warmup is not None and model is not None:
+                self.warmup(model)
+            warmup_s = time.perf_counter() - tic
+
+            self._model = model         # 原子替换引用
+            self._signature, self._sha1 = sig, sha1
+            self._version += 1
+            self._history.appendleft({
+                "version": self._version,
+                "sha1": sha1,
+                "mtime": sig[0] / 1e9,
+                "loaded_at": time.time(),
+                "load_s": round(load_s, 4),
+                "warmup_s": round(warmup_s, 4),
+                "runtime": getattr(model, "runtime", "eager"),
+            })
+        print(f"[registry] {self.name} v{self._version} loaded (sha1={sha1[:10]}, "
+              f"runtime={getattr(self._model, 'runtime', 'eager')}, "
+              f"load={load_s:.2f}s, warmup={warmup_s:.2f}s)")
+        return True
+
+    def get(self):
+        if not self._started:
+            self.start()
+        return self._model
+
+    @property
+    def sha1(self) -> str | None:
+        """ 当前已加载 checkpoint 的内容哈希；离线结果用它标记模型版本 """
+        if not self._started:
+            self.start()
+        return self._sha1 if self._model is not None else None
+
+    # ------------------------------------------------------------------ #
+    #                          后台 watcher                               #
+    # ------------------------------------------------------------------ #
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self.refresh()
+                self._last_error = None
+            except Exception as e:      # 新文件损坏 / 加载失败时继续用旧模型
+                self._last_error = f"{type(e).__name__}: {e}"
+                print(f"[registry] {self.name} reload failed: {self._last_error}")
+
+    def start(self):
+        """ 同步加载一次，然后启动 watcher 线程；重复调用无副作用 """
+        with self._start_lock:          # 并发的首次 get() 会在这里等首个加载完成
+            if self._started:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                print(f"[registry] {self.name} initial load failed: {self._last_error}")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name=f"registry-{self.name}", daemon=True)
+            self._thread.start()
+            self._started = True
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        current = self._history[0] if self._history else None
+        return {
+            "name": self.name,
+            "path": str(self.path),
+            "loaded": self._model is not None,
+            "version": self._version,
+            "current": current,
+            "history": list(self._history),
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "last_error": self._last_error,
+        }
+
+
+def all_status() -> dict:
+    """ 所有已注册模型的状态，供 /api/admin/models 使用 """
+    return {name: reg.status() for name, reg in _REGISTRIES.items()}
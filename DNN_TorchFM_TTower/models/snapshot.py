@@ -0,0 +1,238 @@
+# DNN_TorchFM_TTower\models\snapshot.py
+"""
+离线训练快照：把训练要用的表导出成列式二进制文件，训练时 np.memmap 零拷贝读取
+
+    snapshots/<YYYYmmdd-HHMMSS>/
+        manifest.json                 导出时间、每张表的行数、每列的文件 / dtype
+        interactions/user_id.bin      view_history
+        interactions/movie_id.bin
+        movies/*.bin                  catalog 各列 (movie_id, lang_code, vote_average, ...)
+        movie_genre/*.bin
+        users/user_id.bin, users/age.bin
+    snapshots/LATEST                  最新一份快照的目录名
+
+每列是裸的小端定长数组，没有 .npy 头，行数与 dtype 都记录在 manifest 里；
+view_history 通过 COPY 流式写盘，导出时内存占用与表大小无关。
+先写到临时目录，全部完成后 rename，半成品不会被训练脚本读到。
+
+    python -m DNN_TorchFM_TTower.models.snapshot export
+    python -m DNN_TorchFM_TTower.models.snapshot info [--path latest]
+
+训练脚本：--snapshot latest | <目录>，不再访问数据库。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from DNN_TorchFM_TTower.models.config import SNAPSHOT_DIR, DB_HOST, DB_NAME
+
+FORMAT_VERSION = 1
+
+
+class _ColumnWriter:
+    """ 逐块追加写一列，结束时返回 manifest 条目 """
+
+    def __init__(self, root: Path, table: str, name: str, dtype):
+        self.rel = f"{table}/{name}.bin"
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        (root / table).mkdir(parents=True, exist_ok=True)
+        self.f = open(root / self.rel, "wb")
+        self.rows = 0
+
+    def write(self, values) -> None:
+        arr = np.ascontiguousarray(values, dtype=self.dtype)
+        self.f.write(arr.tobytes())
+        self.rows += len(arr)
+
+    def close(self) -> dict:
+        self.f.close()
+        return {"file": self.rel, "dtype": self.dtype.str}
+
+
+def _write_table(root: Path, table: str, columns: dict) -> dict:
+    cols = {}
+    rows = None
+    for name, values in columns.items():
+        w = _ColumnWriter(root, table, name, np.asarray(values).dtype)
+        w.write(values)
+        cols[name] = w.close()
+        rows = w.rows
+    return {"rows": rows or 0, "columns": cols}
+
+
+# --------------------------------------------------------------------------- #
+#                                  导 出                                      #
+# --------------------------------------------------------------------------- #
+def export_snapshot(root: Path = SNAPSHOT_DIR, name: str | None = None) -> Path:
+    from DNN_TorchFM_TTower.models.catalog import load_snapshot as load_catalog
+    from DNN_TorchFM_TTower.models.streaming import copy_chunks, high_water_mark
+
+    root = Path(root)
+    name = name or time.strftime("%Y%m%d-%H%M%S")
+    tmp = root / f".tmp-{name}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    tic = time.time()
+    tables = {}
+
+    # ---- view_history：COPY 流式写盘；先记下 MAX(view_date)，导出期间新写入的行留给增量训练 ----
+    high_water = high_water_mark()
+    w_user = _ColumnWriter(tmp, "interactions", "user_id", np.int32)
+    w_movie = _ColumnWriter(tmp, "interactions", "movie_id", np.int32)
+    for chunk in copy_chunks():
+        w_user.write(chunk[:, 0])
+        w_movie.write(chunk[:, 1])
+    tables["interactions"] = {"rows": w_user.rows,
+                              "columns": {"user_id": w_user.close(), "movie_id": w_movie.close()}}
+
+    # ---- movies / movie_genre：与线上 catalog 同一套列 ----
+    cat = load_catalog()
+    tables["movies"] = _write_table(tmp, "movies", {
+        "movie_id": cat.movie_ids, "lang_code": cat.lang_codes,
+        "vote_average": cat.vote_average, "vote_count": cat.vote_count,
+        "popularity": cat.popularity, "genre_id": cat.genre_id,
+        "release_year": cat.release_year,
+    })
+    pair_ids, pair_genres = cat.genre_pairs()
+    tables["movie_genre"] = _write_table(tmp, "movie_genre", {"movie_id": pair_ids,
+                                                             "genre_id": pair_genres})
+
+    # ---- users ----
+    w_uid = _ColumnWriter(tmp, "users", "user_id", np.int32)
+    w_age = _ColumnWriter(tmp, "users", "age", np.int32)
+    for chunk in copy_chunks("SELECT id, COALESCE(age, 0)::int FROM users"):
+        w_uid.write(chunk[:, 0])
+        w_age.write(chunk[:, 1])
+    tables["users"] = {"rows": w_uid.rows, "columns": {"user_id": w_uid.close(), "age": w_age.close()}}
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "name": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "created_ts": time.time(),
+        "source": {"host": DB_HOST, "db": DB_NAME},
+        "high_water": high_water,
+        "languages": list(cat.languages),
+        "tables": tables,
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    final = root / name
+    if final.exists():
+        shutil.rmtree(final)
+    os.replace(tmp, final)
+    (root / "LATEST").write_text(name)
+    rows = {t: v["rows"] for t, v in tables.items()}
+    print(f"[snapshot] exported {final} in {time.time() - tic:.1f}s  {rows}")
+    return final
+
+
+# --------------------------------------------------------------------------- #
+#                                  读 取                                      #
+# --------------------------------------------------------------------------- #
+class TrainingSnapshot:
+    """ 只读视图；所有列都是 np.memmap，不会整体读入内存 """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text())
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format {self.manifest.get('format')!r}")
+        self._catalog = None
+
+    @property
+    def name(self) -> str:
+        return self.manifest["name"]
+
+    @property
+    def high_water(self) -> str | None:
+        """ 导出时 view_history 的 MAX(view_date)，旧快照没有该字段 """
+        return self.manifest.get("high_water")
+
+    def rows(self, table: str) -> int:
+        return self.manifest["tables"][table]["rows"]
+
+    def column(self, table: str, name: str) -> np.ndarray:
+        spec = self.manifest["tables"][table]["columns"][name]
+        n = self.rows(table)
+        if n == 0:
+            return np.empty(0, dtype=spec["dtype"])
+        return np.memmap(self.path / spec["file"], dtype=spec["dtype"], mode="r", shape=(n,))
+
+    # ---- 训练脚本用到的视图 ----
+    def interactions(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.column("interactions", "user_id"), self.column("interactions", "movie_id")
+
+    def catalog(self):
+        """ 从快照重建 CatalogSnapshot（含倒排索引），与线上 catalog 同一接口 """
+        if self._catalog is None:
+            from DNN_TorchFM_TTower.models.catalog import CatalogSnapshot
+
+            langs = np.array(list(self.manifest["languages"]) + [None], dtype=object)
+            codes = np.asarray(self.column("movies", "lang_code"))
+            col = lambda n: np.asarray(self.column("movies", n))
+            self._catalog = CatalogSnapshot.from_columns({
+                "movie_id":     col("movie_id").astype(np.int64),
+                "language":     langs[codes],           # -1 → None
+                "vote_average": col("vote_average"),
+                "vote_count":   col("vote_count"),
+                "popularity":   col("popularity"),
+                "genre_id":     col("genre_id"),
+                "release_year": col("release_year"),
+                "genre_pairs":  (np.asarray(self.column("movie_genre", "movie_id")),
+                                 np.asarray(self.column("movie_genre", "genre_id"))),
+            })
+        return self._catalog
+
+    def user_ages(self) -> np.ndarray:
+        """ user_id → age 稠密数组，与 feature_store.load_user_ages() 一致 """
+        ids, ages = self.column("users", "user_id"), self.column("users", "age")
+        out = np.zeros(int(ids.max()) + 1 if len(ids) else 1, dtype=np.float32)
+        out[ids] = ages
+        return out
+
+    def max_ids(self) -> tuple[int, int, int]:
+        """ (MAX(users.id), MAX(movies.id), MAX(genre_id)) """
+        def mx(a):
+            return int(a.max()) if len(a) else 0
+        return (mx(self.column("users", "user_id")),
+                mx(self.column("movies", "movie_id")),
+                mx(self.column("movie_genre", "genre_id")))
+
+
+def open_snapshot(path="latest", root: Path = SNAPSHOT_DIR) -> TrainingSnapshot:
+    """ path = "latest" 时读 root/LATEST 指向的快照 """
+    root = Path(root)
+    if str(path) == "latest":
+        latest = root / "LATEST"
+        if not latest.exists():
+            raise FileNotFoundError(f"[snapshot] {latest} 不存在，请先 export")
+        path = root / latest.read_text().strip()
+    return TrainingSnapshot(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["export", "info"])
+    ap.add_argument("--root", default=str(SNAPSHOT_DIR))
+    ap.add_argument("--path", default="latest", help="snapshot dir for info")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        export_snapshot(Path(args.root))
+    else:
+        snap = open_snapshot(args.path, Path(args.root))
+        m = snap.manifest
+        print(json.dumps({"name": m["name"], "created_at": m["created_at"],
+                          "high_water": m.get("high_water"),
+                          "rows": {t: v["rows"] for t, v in m["tables"].items()}}, indent=2))
@@ -0,0 +1,250 @@
+# DNN_TorchFM_TTower\models\streaming.py
+"""
+从 Postgres 流式读取训练交互数据，不再 fetchall → dict → DataFrame → tensor
+
+  • copy_chunks(query)      COPY (query) TO STDOUT (csv) 按块解析成 int32 数组
+  • load_interactions()     整表读入预分配的 int32 缓冲区（无逐行 Python 对象）
+  • load_history(catalog)   按 (user, movie) 排序流式读入，直接拼 UserHistory CSR，不物化整表对
+  • high_water_mark()       MAX(view_date)，增量训练从它减去重叠窗口处开始读新事件
+  • InteractionStream       torch IterableDataset：逐块产出正样本 batch，
+                            DataLoader 多 worker 时按 user_id 取模分片，内存占用与表大小无关
+
+COPY 在后台线程执行，数据块经有界队列交给解析端；消费端提前退出时线程会被中止。
+要求查询的每一列都是非空整数。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Iterator
+
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+
+from DNN_TorchFM_TTower.models.db import fetchone_dict, get_connection
+
+INTERACTIONS_SQL = "SELECT user_id, movie_id FROM view_history"
+SORTED_INTERACTIONS_SQL = INTERACTIONS_SQL + " ORDER BY user_id, movie_id"
+
+_HASH_MULT = 2654435761
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _QueueWriter:
+    """ copy_expert 的“文件”：每次 write 的数据块放进有界队列 """
+
+    def __init__(self, q: queue.Queue, stop: threading.Event):
+        self.q = q
+        self.stop = stop
+
+    def write(self, data):
+        block = bytes(data)
+        while True:
+            if self.stop.is_set():
+                raise _Aborted()
+            try:
+                self.q.put(block, timeout=0.1)
+                return len(block)
+            except queue.Full:
+                continue
+
+
+def _parse(text: bytes, ncols: int) -> np.ndarray:
+    if not text:
+        return np.empty((0, ncols), dtype=np.int32)
+    vals = np.fromstring(text.replace(b"\n", b",")[:-1].decode(), dtype=np.int32, sep=",")
+    return vals.reshape(-1, ncols)
+
+
+def copy_chunks(query: str = INTERACTIONS_SQL, params=None, ncols: int = 2,
+                chunk_rows: int = 65536, max_blocks: int = 16) -> Iterator[np.ndarray]:
+    """
+    逐块产出 (n, ncols) int32 数组，n <= chunk_rows。
+    产出的是同一块预分配缓冲区的视图，下一次迭代会被覆盖；需要保留请自行 copy。
+    """
+    conn = get_connection()
+    q: queue.Queue = queue.Queue(maxsize=max_blocks)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def produce():
+        try:
+            with conn.cursor() as cur:
+                sql = cur.mogrify(query, params).decode()
+                cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", _QueueWriter(q, stop))
+        except _Aborted:
+            pass
+        except Exception as e:          # 交给消费端重新抛出
+            errors.append(e)
+        finally:
+            while not stop.is_set():
+                try:
+                    q.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    worker = threading.Thread(target=produce, name="copy-stream", daemon=True)
+    worker.start()
+
+    buf = np.empty((chunk_rows, ncols), dtype=np.int32)
+    fill = 0
+    tail = b""
+    try:
+        while True:
+            block = q.get()
+            if block is None:
+                break
+            data = tail + block
+            cut = data.rfind(b"\n") + 1
+            tail = data[cut:]
+            rows = _parse(data[:cut], ncols)
+            while len(rows):
+                take = min(chunk_rows - fill, len(rows))
+                buf[fill:fill + take] = rows[:take]
+                fill += take
+                rows = rows[take:]
+                if fill == chunk_rows:
+                    yield buf
+                    fill = 0
+        if errors:
+            raise errors[0]
+        rows = _parse(tail + b"\n" if tail else b"", ncols)
+        if len(rows):
+            buf[fill:fill + len(rows)] = rows
+            fill += len(rows)
+        if fill:
+            yield buf[:fill]
+    finally:
+        stop.set()
+        worker.join(timeout=5)
+        conn.close()
+
+
+def load_interactions(query: str = INTERACTIONS_SQL, params=None, ncols: int = 2,
+                      count_sql: str = "SELECT COUNT(*) AS n FROM view_history",
+                      count_params=None) -> np.ndarray:
+    """
+    整表读成 (N, ncols) int32；先 COUNT 预分配，行数在读取期间变化时再扩/截
+    """
+    n = (fetchone_dict(count_sql, count_params) or {}).get("n") or 0
+    out = np.empty((n, ncols), dtype=np.int32)
+    fill = 0
+    for chunk in copy_chunks(query, params, ncols):
+        if fill + len(chunk) > len(out):
+            out = np.resize(out, (max(2 * len(out), fill + len(chunk)), ncols))
+        out[fill:fill + len(chunk)] = chunk
+        fill += len(chunk)
+    return out[:fill]
+
+
+def load_history(catalog):
+    """
+    --stream 训练用：负采样需要的 UserHistory 逐块构建，峰值内存只有 CSR 本身
+    （不先 load_interactions 整表再建，也不经 np.unique 的全表临时数组）
+    """
+    from DNN_TorchFM_TTower.models.negative_sampling import UserHistory
+    return UserHistory.from_sorted_chunks(copy_chunks(SORTED_INTERACTIONS_SQL), catalog.rows, len(catalog))
+
+
+def high_water_mark() -> str | None:
+    """ view_history 当前最大 view_date（ISO 字符串），写进 checkpoint meta 作为增量训练的起点 """
+    m = (fetchone_dict("SELECT MAX(view_date) AS m FROM view_history") or {}).get("m")
+    return m.isoformat() if m is not None else None
+
+
+def val_mask(users: np.ndarray, movies: np.ndarray, val_every: int = 5) -> np.ndarray:
+    """ 按 (user, movie) 哈希做确定性的 train / val 切分；True = 验证集 """
+    h = (users.astype(np.int64) * _HASH_MULT + movies.astype(np.int64)) % val_every
+    return h == 0
+
+
+class InteractionStream(IterableDataset):
+    """
+    DataLoader(InteractionStream(batch_size=B), batch_size=None, collate_fn=..., num_workers=k)
+
+    每次产出一个 (B, 2) int64 的 (user_id, movie_id) 正样本 batch，可直接交给
+    NegativeSamplingCollate。多 worker 时 worker i 只读 user_id % k == i 的行。
+    split="train" / "val" 按 val_mask 切分；shuffle 只在块内进行（块大小 chunk_rows）。
+    """
+
+    def __init__(self, batch_size: int = 1024, split: str = "all", val_every: int = 5,
+                 shuffle: bool = True, seed: int = 42, chunk_rows: int = 65536,
+                 query: str = INTERACTIONS_SQL):
+        if split not in ("all", "train", "val"):
+            raise ValueError(f"split must be 'all', 'train' or 'val', got {split!r}")
+        self.batch_size = batch_size
+        self.split = split
+        self.val_every = val_every
+        self.shuffle = shuffle
+        self.seed = seed
+        self.chunk_rows = chunk_rows
+        self.query = query
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _shard_query(self):
+        info = get_worker_info()
+        if info is None or info.num_workers == 1:
+            return self.query, None, 0
+        sql = f"SELECT * FROM ({self.query}) AS q WHERE user_id %% %s = %s"
+        return sql, (info.num_workers, info.id), info.id
+
+    def __iter__(self):
+        sql, params, wid = self._shard_query()
+        rng = np.random.default_rng([self.seed, self.epoch, wid])
+        carry = np.empty((0, 2), dtype=np.int64)
+        for chunk in copy_chunks(sql, params, chunk_rows=self.chunk_rows):
+            pairs = chunk.astype(np.int64)
+            if self.split != "all":
+                is_val = val_mask(pairs[:, 0], pairs[:, 1], self.val_every)
+                pairs = pairs[is_val if self.split == "val" else ~is_val]
+            if self.shuffle:
+                pairs = pairs[rng.permutation(len(pairs))]
+            if len(carry):
+                pairs = np.concatenate([carry, pairs])
+            n_full = len(pairs) // self.batch_size * self.batch_size
+            for s in range(0, n_full, self.batch_size):
+                yield pairs[s:s + self.batch_size]
+            carry = pairs[n_full:]
+        if len(carry):
+            yield carry
+
+
+# --------------------------------------------------------------------------- #
+#                         训练脚本共用的 DataLoader 构造                        #
+# --------------------------------------------------------------------------- #
+def positive_loaders(users: np.ndarray, movies: np.ndarray, train_collate, val_collate,
+                     batch_size: int, workers: int = 0, stream: bool = False, seed: int = 42):
+    """
+    返回 (train_loader, val_loader)，两者都只含正样本，负样本由 collate 现抽。
+    train / val 统一按 val_mask 切分；stream=True 时正样本不驻留内存，
+    每个 epoch 从 view_history 重新流式读取（users / movies 仅用于内存模式）。
+    """
+    from torch.utils.data import DataLoader
+    from DNN_TorchFM_TTower.models.negative_sampling import PositivePairs
+
+    if stream:
+        train_ds = InteractionStream(batch_size, split="train", seed=seed)
+        val_ds = InteractionStream(batch_size, split="val", shuffle=False, seed=seed)
+        return (DataLoader(train_ds, batch_size=None, collate_fn=train_collate, num_workers=workers),
+                DataLoader(val_ds, batch_size=None, collate_fn=val_collate, num_workers=workers))
+
+    is_val = val_mask(users, movies)
+    return (DataLoader(PositivePairs(users[~is_val], movies[~is_val]), batch_size=batch_size,
+                       shuffle=True, collate_fn=train_collate, num_workers=workers),
+            DataLoader(PositivePairs(users[is_val], movies[is_val]), batch_size=batch_size,
+                       shuffle=False, collate_fn=val_collate, num_workers=workers))
+
+
+def set_epoch(loader, epoch: int) -> None:
+    """ 通知 dataset / collate 进入新 epoch（换 shuffle 顺序与负样本） """
+    for obj in (loader.dataset, loader.collate_fn):
+        if hasattr(obj, "set_epoch"):
+            obj.set_epoch(epoch)
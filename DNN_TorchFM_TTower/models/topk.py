@@ -0,0 +1,84 @@
+# DNN_TorchFM_TTower\models\topk.py
+"""
+部分 top-k 选择：只对最终需要的 k 个元素排序，替代整表 argsort / sort_values
+
+  • topk_indices(scores, k, tiebreak=None)  NumPy：argpartition O(N) + 小排序 O(k log k)
+  • topk_tensor(scores, k)                  Torch：torch.topk + 小排序
+  • topk_rows(scores, k)                    Torch：(U, N) 每行各取 top-k，批量召回用
+
+平分规则是确定的：分数降序 → tiebreak 降序 (若给出) → 下标升序。
+落在第 k 名边界上的并列元素同样按此规则取舍，同一输入永远得到同一结果。
+NaN 视为 -inf，排在最后。
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import torch
+
+
+def topk_indices(scores, k: int, tiebreak=None) -> np.ndarray:
+    """
+    返回 scores 中最大的 k 个下标，按上述平分规则降序排列
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if np.issubdtype(scores.dtype, np.floating) and np.isnan(scores).any():
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+
+    if k < n:
+        # 第 k 大的值作为阈值，所有 >= 阈值的元素都进入候选（包含边界并列）
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        cand = np.flatnonzero(scores >= kth)
+    else:
+        cand = np.arange(n)
+
+    keys = [cand, -scores[cand]]
+    if tiebreak is not None:
+        keys.insert(1, -np.asarray(tiebreak)[cand])
+    order = np.lexsort(keys)            # 最后一个 key 为主序
+    return cand[order[:k]]
+
+
+def topk_tensor(scores: torch.Tensor, k: int) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    1-D tensor 的 top-k，返回 (values, indices)，平分时下标小者优先
+    """
+    n = scores.numel()
+    k = min(int(k), n)
+    if k <= 0:
+        return scores[:0], torch.empty(0, dtype=torch.long, device=scores.device)
+
+    scores = torch.nan_to_num(scores, nan=float("-inf"))
+    kth = torch.topk(scores, k, sorted=False).values.min()
+    cand = torch.nonzero(scores >= kth, as_tuple=True)[0]   # 下标升序
+    vals = scores[cand]
+    order = torch.sort(vals, descending=True, stable=True).indices[:k]
+    return vals[order], cand[order]
+
+
+def topk_rows(scores: torch.Tensor, k: int) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    2-D tensor 逐行 top-k，返回 (values, indices)，形状 (U, k)；平分规则与 topk_tensor 相同。
+    torch.topk 给出每行第 k 大的值；严格大于它的全部入选，等于它的按下标升序补足 k 个
+    （一次 O(N) 的 cumsum，不排序整行），最后只对每行这 k 个元素做稳定排序
+    """
+    n = scores.size(1)
+    k = min(int(k), n)
+    if k <= 0:
+        return scores[:, :0], torch.empty(scores.size(0), 0, dtype=torch.long, device=scores.device)
+
+    scores = torch.nan_to_num(scores, nan=float("-inf"))
+    kth = torch.topk(scores, k, dim=1, sorted=False).values.min(dim=1, keepdim=True).values
+    above = scores > kth
+    tie = scores == kth
+    room = k - above.sum(dim=1, keepdim=True)           # 每行还差几个边界并列元素
+    keep = above | (tie & (tie.cumsum(dim=1) <= room))   # 每行恰好 k 个
+    cand = torch.nonzero(keep, as_tuple=True)[1].view(-1, k)   # 行内下标升序
+    vals = scores.gather(1, cand)
+    order = torch.sort(vals, dim=1, descending=True, stable=True).indices
+    return vals.gather(1, order), cand.gather(1, order)
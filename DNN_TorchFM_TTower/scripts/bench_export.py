@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+scripts/bench_export.py
+推断图 (models/export.py) vs eager 前向延迟：双塔 (mlp forward / dot user_vectors + score_vectors)
+与 DeepFM 精排 (含 genres 多值字段)
+
+    python -m DNN_TorchFM_TTower.scripts.bench_export --repeat 200
+
+模型随机初始化，checkpoint 与推断图写在临时目录，不访问数据库；加载走与线上相同的
+_build_model / _load_model，导出时已按容差校验，这里再对比一次计时用的输入
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from DNN_TorchFM_TTower.models.checkpoint import save_checkpoint
+from DNN_TorchFM_TTower.models.export import compare
+from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
+from DNN_TorchFM_TTower.models.ranking.feature_store import DENSE_COLS
+from DNN_TorchFM_TTower.models.ranking import infer_ranking
+from DNN_TorchFM_TTower.models.recall import two_tower
+
+
+def _timeit(fn, repeat):
+    with torch.inference_mode():
+        fn()                                 # warm-up
+        tic = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+    return 1000 * (time.perf_counter() - tic) / repeat
+
+
+def _pair(tmp: Path, name, save, export, load):
+    """ 写 checkpoint → 导出 → 分别按 eager / 推断图加载 """
+    path = tmp / f"{name}.pt"
+    save(path)
+    export(path)
+    eager, exported = load(path, exported=False), load(path)
+    assert exported.runtime == "torchscript", f"{name}: exported graph was not picked up"
+    return eager, exported
+
+
+def _row(label, eager, exported, fn, repeat):
+    t_e = _timeit(lambda: fn(eager), repeat)
+    t_x = _timeit(lambda: fn(exported), repeat)
+    print(f"{label:>22} | {t_e:>7.3f}ms | {t_x:>7.3f}ms | {t_e / t_x:5.2f}x")
+
+
+def main(sizes=(1, 300, 3_000), repeat=200, n_movies=50_000, n_users=10_000, seed=0):
+    torch.set_num_threads(1)                 # 与 Flask 单请求线程的情形一致
+    torch.manual_seed(seed)
+    with tempfile.TemporaryDirectory(prefix="bench_export_") as tmp:
+        tmp, towers = Path(tmp), {}
+        for arch in ("mlp", "dot"):
+            meta = dict(arch=arch, num_users=n_users, num_movies=n_movies, embedding_dim=32, hidden_dim=64)
+            towers[arch] = _pair(tmp, f"two_tower_{arch}",
+                                 lambda p: save_checkpoint(p, build_two_tower(**meta).state_dict(), **meta),
+                                 two_tower.export_model, two_tower._build_model)
+
+        meta = dict(field_dims=[n_users + 2, n_movies + 2, 22], num_dense=len(DENSE_COLS),
+                    bag_dims={"genres": 22})
+        ranker = _pair(tmp, "deepfm_ranker",
+                       lambda p: save_checkpoint(p, DeepFM(**meta).state_dict(), **meta),
+                       infer_ranking.export_model, infer_ranking._load_model)
+
+    print(f"{'model':<14}{'N':>8} | {'eager':>9} | {'exported':>9} | speed-up")
+    for n in sizes:
+        users = torch.full((n,), 42, dtype=torch.long)
+        movies = torch.randint(1, n_movies + 1, (n,))
+
+        eager, exported = towers["mlp"]
+        compare(eager, exported, {"forward": (users, movies)})
+        _row(f"{'two_tower mlp':<14}{n:>8}", eager, exported, lambda m: m(users, movies), repeat)
+
+        eager, exported = towers["dot"]
+        items = eager.item_vectors(movies).detach()
+        user = users[:1]
+        _row(f"{'two_tower dot':<14}{n:>8}", eager, exported,
+             lambda m: m.score_vectors(m.user_vectors(user)[0], items), repeat)
+
+        eager, exported = ranker
+        inputs = infer_ranking._example_inputs(eager, n)
+        compare(eager, exported, inputs)
+        _row(f"{'deepfm+genres':<14}{n:>8}", eager, exported, lambda m: m(*inputs["forward"]), repeat)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    main(repeat=args.repeat)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+scripts/bench_ranking.py
+DeepFM 精排单请求延迟：pandas 路径 vs 张量路径 (infer_ranking.score_candidates)
+
+    python -m DNN_TorchFM_TTower.scripts.bench_ranking --repeat 50
+
+pandas 路径即原 rank_candidates 的做法：建 DataFrame → merge 电影 / 用户表 → fillna →
+.values → torch.tensor → 赋 score 列 → sort_values。
+数据与模型均为随机合成，不访问数据库；两条路径的 top-k 分数必须一致
+（张量路径按 logit 排序，sigmoid 饱和成相同概率时的先后可能与 sort_values 不同）。
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
+from DNN_TorchFM_TTower.models.ranking.feature_store import DENSE_COLS, SPARSE_COLS, FeatureSnapshot
+from DNN_TorchFM_TTower.models.ranking.infer_ranking import InferenceBuffers, score_candidates
+
+
+def _timeit(fn, repeat):
+    fn()                                     # warm-up
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return 1000 * (time.perf_counter() - tic) / repeat
+
+
+def _pandas_path(model, movies_df, users_df, user_id, movie_ids, recall_scores, top_n):
+    infer_df = pd.DataFrame({"user_id": user_id, "movie_id": movie_ids, "recall_score": recall_scores})
+    infer_df = (infer_df
+                .merge(movies_df, on="movie_id", how="left")
+                .merge(users_df, on="user_id", how="left"))
+    infer_df.fillna(0, inplace=True)
+    xs = torch.tensor(infer_df[SPARSE_COLS].values, dtype=torch.long)
+    xd = torch.tensor(infer_df[DENSE_COLS].values, dtype=torch.float32)
+    with torch.no_grad():
+        infer_df["score"] = torch.sigmoid(model(xs, xd)).numpy()
+    top = infer_df.sort_values("score", ascending=False).head(top_n)
+    return top["movie_id"].tolist(), top["score"].tolist()
+
+
+def main(sizes=(300, 3_000, 30_000), top_n=20, repeat=50, n_movies=50_000, n_users=10_000, seed=0):
+    torch.set_num_threads(1)                 # 与 Flask 单请求线程的情形一致
+    rng = np.random.default_rng(seed)
+    movie_ids = np.arange(1, n_movies + 1, dtype=np.int64)
+    genre = rng.integers(1, 20, n_movies)
+    vote = rng.uniform(0, 10, n_movies).astype(np.float32)
+    pop = rng.uniform(0, 100, n_movies).astype(np.float32)
+    ages = rng.integers(15, 70, n_users + 1).astype(np.float32)
+
+    movies_df = pd.DataFrame({"movie_id": movie_ids, "genre_id": genre,
+                              "vote_average": vote, "popularity": pop})
+    users_df = pd.DataFrame({"user_id": np.arange(n_users + 1), "age": ages})
+    features = FeatureSnapshot(np.concatenate([[0], genre]), np.concatenate([[0], vote]).astype(np.float32),
+                               np.concatenate([[0], pop]).astype(np.float32), ages)
+
+    model = DeepFM([n_users + 2, n_movies + 2, 22], num_dense=len(DENSE_COLS)).eval()
+    buffers = InferenceBuffers()
+    user_id = 42
+
+    print(f"{'N':>8} | {'pandas':>9} | {'tensor':>9} | speed-up")
+    for n in sizes:
+        cand = rng.choice(movie_ids, n, replace=False)
+        recall = rng.random(n, dtype=np.float32)
+
+        ref_ids, ref_scores = _pandas_path(model, movies_df, users_df, user_id, cand, recall, top_n)
+        ids, scores = score_candidates(model, features, user_id, cand, recall, top_n, buffers=buffers)
+        assert len(ids) == len(ref_ids) and np.allclose(scores, ref_scores, atol=1e-6)
+
+        t_pd = _timeit(lambda: _pandas_path(model, movies_df, users_df, user_id, cand, recall, top_n), repeat)
+        t_tn = _timeit(lambda: score_candidates(model, features, user_id, cand, recall, top_n,
+                                                buffers=buffers), repeat)
+        print(f"{n:>8} | {t_pd:>7.3f}ms | {t_tn:>7.3f}ms | {t_pd / t_tn:5.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+    main(top_n=args.top, repeat=args.repeat)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+scripts/bench_topk.py
+全量排序 vs 部分 top-k (models/topk.py) 的微基准
+
+    python -m DNN_TorchFM_TTower.scripts.bench_topk --k 300 --repeat 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from DNN_TorchFM_TTower.models.topk import topk_indices, topk_tensor
+
+
+def _timeit(fn, repeat):
+    fn()                                     # warm-up
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return 1000 * (time.perf_counter() - tic) / repeat
+
+
+def main(sizes=(10_000, 100_000, 1_000_000), k=300, repeat=20, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'N':>10} | {'np.argsort':>11} | {'topk_indices':>12} | {'torch.sort':>10} | {'topk_tensor':>11} | speed-up (np / torch)")
+    for n in sizes:
+        scores = rng.random(n, dtype=np.float32)
+        t_scores = torch.from_numpy(scores)
+
+        # 两种实现结果必须一致
+        assert np.array_equal(np.argsort(-scores, kind="stable")[:k], topk_indices(scores, k))
+
+        full_np = _timeit(lambda: np.argsort(-scores)[:k], repeat)
+        part_np = _timeit(lambda: topk_indices(scores, k), repeat)
+        full_t = _timeit(lambda: torch.sort(t_scores, descending=True).indices[:k], repeat)
+        part_t = _timeit(lambda: topk_tensor(t_scores, k), repeat)
+        print(f"{n:>10} | {full_np:>9.3f}ms | {part_np:>10.3f}ms | {full_t:>8.3f}ms | {part_t:>9.3f}ms "
+              f"| {full_np / part_np:5.1f}x / {full_t / part_t:5.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, default=300)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    main(k=args.k, repeat=args.repeat)
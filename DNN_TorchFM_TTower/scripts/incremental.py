@@ -5,7 +5,7 @@ Interactive CLI demo:
 1. 如果用户不存在则自动插入 users 表
 2. 冷启动推荐 Top-K 让你选择想看的片
 3. 把选择写入 view_history
-4. 触发一次增量训练（可选）
+4. 观看事件交给后台重训 (service/retrainer.py)，不阻塞下一轮推荐
 5. 走 Warm Start + 精排，再推荐下一批
 6. 支持循环，直到用户输入 q 退出
 """
@@ -19,10 +19,9 @@ from DNN_TorchFM_TTower.models.recall.cold_start import recommend_cold_start
 from DNN_TorchFM_TTower.models.recall.two_tower import load_model as load_recall_model
 from DNN_TorchFM_TTower.models.recall.two_tower import recommend_warm_start
 from DNN_TorchFM_TTower.models.ranking.infer_ranking import rank_candidates
-from DNN_TorchFM_TTower.models.recall.train_incremental import incremental_train
+from DNN_TorchFM_TTower.service.retrainer import Retrainer
 
-RECALL_MODEL = load_recall_model()
-USER_ID = int(input("请输入用户 ID（新用户填一个从未用过的数字）：").strip())
+RETRAINER = Retrainer(every_n=1, min_interval=0, ranking_kwargs=None)
 
 def ensure_user(uid):
     if not fetchone_dict("SELECT 1 FROM users WHERE id=%s", (uid,)):
@@ -34,7 +33,7 @@ def ensure_user(uid):
 
 def insert_views(uid, movie_ids):
     for mid in movie_ids:
-        execute_sql("INSERT INTO view_history (user_id, movie_id) VALUES (%s, %s)", (uid, mid))
+        execute_sql("INSERT INTO view_history (user_id, movie_id, view_date) VALUES (%s, %s, NOW())", (uid, mid))
 
 def choose_movies(candidates, title_map):
     print("\n请在下面输入想看的电影编号，用空格分隔（回车结束，q 返回退出）：")
@@ -60,11 +59,12 @@ def main_loop():
 
         if watch_cnt == 0:
             # ---- Cold Start ----
-            rec_ids = recommend_cold_start(top_n=10)
+            rec_ids = recommend_cold_start(top_n=10, user_id=USER_ID)
             phase = "冷启动"
         else:
             # ---- Recall + Ranking ----
-            rec_ids, recall_scores = recommend_warm_start(RECALL_MODEL, USER_ID, top_n=300)
+            # 每轮取 registry 的当前版本，后台重训发布后自动用上新模型
+            rec_ids, recall_scores = recommend_warm_start(load_recall_model(), USER_ID, top_n=300)
             rec_ids = rank_candidates(USER_ID, rec_ids, recall_scores, top_n=10)
             phase = "热启动 (召回+精排)"
 
@@ -81,8 +81,15 @@ def main_loop():
         insert_views(USER_ID, chosen)
         print(f"✅ 已记录 {len(chosen)} 部影片观看历史。")
 
-        # 每次循环小规模增量训练一下（真实线上可异步 / 定时）
-        incremental_train(neg_ratio=1, epochs=1)
+        # 每次循环小规模增量训练一下，后台进程执行，训练期间照常推荐
+        for mid in chosen:
+            RETRAINER.submit(USER_ID, mid)
 
 if __name__ == "__main__":
-    main_loop()
+    # 放在 main 里：后台训练子进程 (spawn) 会重新 import 本模块，不能在导入时等待输入
+    USER_ID = int(input("请输入用户 ID（新用户填一个从未用过的数字）：").strip())
+    RETRAINER.start()
+    try:
+        main_loop()
+    finally:
+        RETRAINER.stop()
@@ -7,9 +7,10 @@ CLI 交互式推荐演示 interactive demo
   1. 输入一个用户 ID（若不存在自动插入）
   2. 调用 service.recommender 推荐 TOP_N 部电影
   3. 用户手动选择若干部想看的 → 写入 view_history
-  4. 每 LOOP_FOR_RETRAIN 轮：
+  4. 每累计 RETRAIN_EVERY_N 条观看事件，后台 (service/retrainer.py) 异步：
         • 召回侧增量训练 1 epoch
         • 精排侧增量训练 1 epoch
+     训练期间照常推荐；新 checkpoint 发布后 registry 自动换上新模型
   5. 回到步骤 2，直到输入 q / quit 退出
 """
 
@@ -26,12 +27,11 @@ from DNN_TorchFM_TTower.models.db import (
     get_movie_titles, get_user_view_count,
 )
 
-from DNN_TorchFM_TTower.models.recall.train_incremental import incremental_train as recall_inc_train
-from DNN_TorchFM_TTower.models.ranking.train_ranking import main as ranking_train_main
 from DNN_TorchFM_TTower.service.recommender import recommend_movies_for_user
+from DNN_TorchFM_TTower.service.retrainer import Retrainer
 
 TOP_N = 10
-LOOP_FOR_RETRAIN = 3      # 每 3 轮做一次增量重训（可调为 0 关闭）
+RETRAIN_EVERY_N = 10      # 每 10 条观看事件触发一次后台增量重训（可调为 0 关闭）
 
 
 # ------------------------------------------------------------------ #
@@ -49,7 +49,7 @@ def ensure_user(user_id: int):
 def insert_views(user_id: int, movie_ids: List[int]):
     for mid in movie_ids:
         execute_sql(
-            "INSERT INTO view_history (user_id, movie_id) VALUES (%s, %s)",
+            "INSERT INTO view_history (user_id, movie_id, view_date) VALUES (%s, %s, NOW())",
             (user_id, mid),
         )
 
@@ -74,22 +74,11 @@ def choose_movies(candidates: List[int], titles: dict[int, str]) -> List[int] |
             print("The input format is incorrect. Please re-enter")
 
 
-# ------------------------------------------------------------------ #
-#                         增量训练封装                                #
-# ------------------------------------------------------------------ #
-def incremental_retrain():
-    print("\n Incremental training begins (recall 1 epoch + rerank 1 epoch)...")
-    recall_inc_train(neg_ratio=1, epochs=1)
-    ranking_train_main(epochs=1, batch_size=4096, neg_ratio=1)
-    print("incremental training fini\n")
-
-
 # ------------------------------------------------------------------ #
 #                           主循环                                   #
 # ------------------------------------------------------------------ #
-def interactive_loop(user_id: int):
+def interactive_loop(user_id: int, retrainer: Retrainer | None = None):
     ensure_user(user_id)
-    loop_cnt = 0
 
     while True:
         viewed = get_user_view_count(user_id)
@@ -108,12 +97,11 @@ def interactive_loop(user_id: int):
 
         insert_views(user_id, chosen)
         print(f" 已记录观看 {len(chosen)} 部影片。")
-        loop_cnt += 1
-
-        # ---- 条件触发增量训练 ----
-        if LOOP_FOR_RETRAIN and loop_cnt % LOOP_FOR_RETRAIN == 0:
-            incremental_retrain()
 
+        # ---- 交给后台重训，不阻塞下一轮推荐 ----
+        if retrainer is not None:
+            for mid in chosen:
+                retrainer.submit(user_id, mid)
 
 
 # ------------------------------------------------------------------ #
@@ -126,4 +114,10 @@ if __name__ == "__main__":
         print(" x The user ID must be an integer")
         exit(1)
 
-    interactive_loop(uid)
+    retrainer = Retrainer(every_n=RETRAIN_EVERY_N, min_interval=0).start() if RETRAIN_EVERY_N else None
+    try:
+        interactive_loop(uid, retrainer)
+    finally:
+        if retrainer is not None:
+            print("waiting for background retraining to finish...")
+            retrainer.stop()
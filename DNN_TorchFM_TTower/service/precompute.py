@@ -0,0 +1,169 @@
+# service/precompute.py
+"""
+离线预计算推荐表 user_recommendations + 在线按需回退
+
+    python -m DNN_TorchFM_TTower.service.precompute [--days 90] [--batch 500] [--top 50]
+
+• 对活跃用户（有 view_history，可限定最近 N 天）批量跑完整 召回 + 精排
+  (recommend_movies_for_users)，每人存 Top-`top` 条，并记录
+    model_version   召回 / 精排 checkpoint 的 sha1 组合
+    last_view_date  计算时该用户的 MAX(view_date)
+• 在线 lookup(user_id, top) 一次主键查询；以下任一情况视为过期，返回 None 由调用方走实时链路：
+    - 用户此后又有新的 view_history（MAX(view_date) 变了）
+    - 模型版本变了（registry 热替换了新 checkpoint）
+    - 请求的 top 超过存下的条数
+"""
+
+from __future__ import annotations
+
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from DNN_TorchFM_TTower.models.db import fetchall_dict, get_pool
+
+STORE_TOP = 50
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS user_recommendations (
+        user_id         INTEGER PRIMARY KEY,
+        movie_ids       INTEGER[] NOT NULL,
+        scores          REAL[],
+        strategy        TEXT NOT NULL,
+        model_version   TEXT NOT NULL,
+        last_view_date  TIMESTAMP,
+        computed_at     TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+
+UPSERT_SQL = """
+    INSERT INTO user_recommendations
+        (user_id, movie_ids, scores, strategy, model_version, last_view_date)
+    VALUES %s
+    ON CONFLICT (user_id) DO UPDATE SET
+        movie_ids = EXCLUDED.movie_ids,
+        scores = EXCLUDED.scores,
+        strategy = EXCLUDED.strategy,
+        model_version = EXCLUDED.model_version,
+        last_view_date = EXCLUDED.last_view_date,
+        computed_at = NOW()
+"""
+
+# 主键查一行，同时比较该用户当前的 MAX(view_date)（view_history.user_id 上有索引时为 O(1)）
+LOOKUP_SQL = """
+    SELECT r.movie_ids, r.scores, r.strategy, r.model_version,
+           r.last_view_date IS NOT DISTINCT FROM
+               (SELECT MAX(v.view_date) FROM view_history v WHERE v.user_id = r.user_id) AS fresh
+    FROM user_recommendations r
+    WHERE r.user_id = %s
+"""
+
+
+def model_version() -> str | None:
+    """ 当前在线模型版本：召回 + 精排 checkpoint 的 sha1；任一未加载时为 None """
+    from DNN_TorchFM_TTower.models.recall.two_tower import TOWER
+    from DNN_TorchFM_TTower.models.ranking.infer_ranking import RANKER
+
+    tower, ranker = TOWER.sha1, RANKER.sha1
+    if tower is None:
+        return None
+    return f"{tower[:12]}-{(ranker or 'none')[:12]}"
+
+
+def ensure_table() -> None:
+    with get_pool().transaction() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_SQL)
+
+
+# --------------------------------------------------------------------------- #
+#                              离线批量任务                                    #
+# --------------------------------------------------------------------------- #
+def _active_users(days: int | None) -> list[dict]:
+    if days:
+        return fetchall_dict("""
+            SELECT user_id, MAX(view_date) AS last_view
+            FROM view_history
+            GROUP BY user_id
+            HAVING MAX(view_date) > NOW() - %s * INTERVAL '1 day'
+            ORDER BY user_id
+        """, (days,))
+    return fetchall_dict("""
+        SELECT user_id, MAX(view_date) AS last_view
+        FROM view_history
+        GROUP BY user_id
+        ORDER BY user_id
+    """)
+
+
+def precompute_all(days: int | None = None, batch_size: int = 500, top: int = STORE_TOP,
+                   n_recall: int = 300) -> int:
+    """ 返回写入的用户数 """
+    from DNN_TorchFM_TTower.service.recommender import recommend_movies_for_users
+
+    ensure_table()
+    version = model_version()
+    if version is None:
+        print("[precompute] 召回模型未加载，跳过")
+        return 0
+
+    users = _active_users(days)
+    print(f"[precompute] {len(users)} active users, model {version}")
+    tic = time.time()
+    written = 0
+    for start in range(0, len(users), batch_size):
+        chunk = users[start:start + batch_size]
+        # last_view 在计算之前取：计算期间的新观看会让这一行立刻过期，回退实时链路
+        results = recommend_movies_for_users([r["user_id"] for r in chunk],
+                                             n_recall=n_recall, n_final=top)
+        rows = []
+        for r in chunk:
+            mids, scores, strategy = results[r["user_id"]]
+            rows.append((r["user_id"], [int(m) for m in mids],
+                         [float(s) if s is not None else None for s in scores],
+                         strategy, version, r["last_view"]))
+        with get_pool().transaction() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, UPSERT_SQL, rows)
+        written += len(rows)
+        print(f"[precompute] {written}/{len(users)} users  {written / (time.time() - tic):.0f} users/s")
+    print(f"[precompute] Done in {time.time() - tic:.1f}s")
+    return written
+
+
+# --------------------------------------------------------------------------- #
+#                                 在线读取                                     #
+# --------------------------------------------------------------------------- #
+def lookup(user_id: int, top: int) -> tuple[list[int], list[float], str] | None:
+    """ 命中且未过期 → (movie_ids, scores, strategy)；否则 None """
+    version = model_version()
+    if version is None:
+        return None
+    try:
+        # 请求线程里复用 g.db：出错只回滚到 savepoint，不丢路由未提交的写入
+        with get_pool().transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LOOKUP_SQL, (user_id,))
+                row = cur.fetchone()
+    except psycopg2.Error:              # 表还没建（任务从未跑过）等：走实时链路
+        return None
+    if row is None:
+        return None
+    movie_ids, scores, strategy, row_version, fresh = row
+    if not fresh or row_version != version or len(movie_ids) < top:
+        return None
+    scores = list(scores[:top]) if scores else [None] * top
+    return list(movie_ids[:top]), scores, strategy
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=None, help="only users active in the last N days")
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--top", type=int, default=STORE_TOP)
+    ap.add_argument("--n_recall", type=int, default=300)
+    args = ap.parse_args()
+
+    precompute_all(days=args.days, batch_size=args.batch, top=args.top, n_recall=args.n_recall)
@@ -2,27 +2,25 @@
 
 """
 统一推荐入口：
-    • 新用户       → 冷启动 (PopRec + 随机多样化)
+    • 新用户       → 冷启动 (预计算候选池，按年龄段 / 偏好题材加权抽样)
     • 老用户       → Two-Tower 召回  → DeepFM 精排
-对上层调用者隐藏实现细节，只暴露一个函数 `recommend_movies_for_user`
+对上层调用者隐藏实现细节，只暴露 `recommend_movies_for_user`
+以及供批量任务使用的 `recommend_movies_for_users`
 """
 
 from __future__ import annotations
 
-import functools
 import time
 from typing import List, Tuple
 
-from DNN_TorchFM_TTower.models.db import get_user_view_count
+from DNN_TorchFM_TTower.models.db import get_users_view_stats
 from DNN_TorchFM_TTower.models.recall import cold_start
-from DNN_TorchFM_TTower.models.recall.two_tower import load_model as _load_tower, recommend_warm_start
-from DNN_TorchFM_TTower.models.ranking.infer_ranking import rank_candidates
-
-
-# --------------------------------------------------------------------------- #
-#                          全局缓存 —— 只加载一次                              #
-# --------------------------------------------------------------------------- #
-_TOWER_MODEL = functools.lru_cache(maxsize=1)(_load_tower)()   # type: ignore
+from DNN_TorchFM_TTower.models.recall.two_tower import (
+    load_model as _load_tower,
+    recommend_warm_start,
+    recommend_warm_start_batch,
+)
+from DNN_TorchFM_TTower.models.ranking.infer_ranking import rank_candidates, rank_candidates_batch
 
 
 # --------------------------------------------------------------------------- #
@@ -35,18 +33,20 @@ def recommend_movies_for_user(user_id: int,
     """
     返回 (movie_ids, scores, strategy)
     strategy: 'cold' | 'warm' | 'warm+rank'
+    观影数量与偏好语言和批量版取自同一条查询 (get_users_view_stats)，冷启动回退时同样按语言加权
     """
-    view_cnt = get_user_view_count(user_id)
+    view_cnt, languages = get_users_view_stats([user_id])[user_id]
 
     # -------- cold --------
     if view_cnt == 0:
-        mids = cold_start.recommend_cold_start(top_n=n_final)
+        mids = cold_start.recommend_cold_start(top_n=n_final, user_id=user_id, languages=languages)
         return mids, [None]*len(mids), "cold"
 
     # -------- warm --------
-    recall_ids, recall_scores = recommend_warm_start(_TOWER_MODEL, user_id, top_n=n_recall)
+    # 每次请求取 registry 的当前版本：重训后自动用上新模型，无需重启
+    recall_ids, recall_scores = recommend_warm_start(_load_tower(), user_id, top_n=n_recall)
     if not recall_ids:                       # fallback
-        mids = cold_start.recommend_cold_start(top_n=n_final)
+        mids = cold_start.recommend_cold_start(top_n=n_final, user_id=user_id, languages=languages)
         return mids, [None]*len(mids), "cold"
 
     # -------- rank --------
@@ -55,6 +55,69 @@ def recommend_movies_for_user(user_id: int,
     return mids, recall_scores[:n_final], "warm+rank"
 
 
+def recommend_movies_for_users(user_ids: List[int],
+                               n_recall: int = 300,
+                               n_final:  int = 20) -> dict[int, tuple[list[int], list[float], str]]:
+    """
+    批量版：返回 {user_id: (movie_ids, scores, strategy)}，语义与逐个调用
+    recommend_movies_for_user 相同，供离线预计算 / 邮件推送等批量任务使用。
+      • 观影数量 + 偏好语言：一条 SQL 查所有用户
+      • 召回：用户 × 候选一次批量打分
+      • 精排：所有用户的候选拼成一个 batch，一次 DeepFM 前向
+    """
+    user_ids = list(dict.fromkeys(int(u) for u in user_ids))    # 去重，保持顺序
+    if not user_ids:
+        return {}
+    stats = get_users_view_stats(user_ids)
+
+    out = {}
+    warm = [uid for uid in user_ids if stats[uid][0] > 0]
+    if warm:
+        recalled = recommend_warm_start_batch(_load_tower(), warm, top_n=n_recall,
+                                              languages={uid: stats[uid][1] for uid in warm})
+        warm = [uid for uid in warm if recalled[uid][0]]
+        ranked = rank_candidates_batch(warm, [recalled[uid][0] for uid in warm],
+                                       [recalled[uid][1] for uid in warm], top_n=n_final)
+        for uid, mids in zip(warm, ranked):
+            out[uid] = (mids, recalled[uid][1][:n_final], "warm+rank")
+
+    # -------- cold / fallback --------
+    cold = [uid for uid in user_ids if uid not in out]
+    profiles = cold_start.cold_profiles(cold) if cold else {}
+    for uid in cold:
+        mids = cold_start.recommend_cold_start(top_n=n_final, languages=stats[uid][1],
+                                               profile=profiles.get(uid, (None, [])))
+        out[uid] = (mids, [None]*len(mids), "cold")
+    return {uid: out[uid] for uid in user_ids}
+
+
+def serve_recommendations(user_id: int,
+                          n_final: int = 20) -> tuple[list[int], list[float], str, str]:
+    """
+    在线接口用：结果缓存 (service/result_cache.py) → 离线预计算表 (service/precompute.py)
+    → 实时链路，依次回退。返回 (movie_ids, scores, strategy, source)，
+    source: 'cache' | 'precomputed' | 'live'
+    """
+    from DNN_TorchFM_TTower.service.precompute import lookup, model_version
+    from DNN_TorchFM_TTower.service.result_cache import get_result_cache
+
+    def compute():
+        hit = lookup(user_id, n_final)
+        if hit is not None:
+            return (*hit, "precomputed")
+        return (*recommend_movies_for_user(user_id, n_final=n_final), "live")
+
+    value, cached = get_result_cache().get_or_compute(user_id, n_final, model_version(), compute)
+    return (*value[:3], "cache") if cached else value
+
+
+def invalidate_user(user_id: int) -> None:
+    """ 用户的观看 / 评分 / 片单发生写入后调用：该用户的缓存结果立即失效 """
+    from DNN_TorchFM_TTower.service.result_cache import get_result_cache
+
+    get_result_cache().invalidate(user_id)
+
+
 # CLI 测试保持，改为 JSON 打印
 if __name__ == "__main__":
     import json, datetime, argparse
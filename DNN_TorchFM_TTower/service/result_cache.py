@@ -0,0 +1,237 @@
+# service/result_cache.py
+"""
+按用户的推荐结果缓存：页面反复刷新时不再重跑 召回 + 精排
+
+    key   = (user_id, top, model_version, 用户代数)
+    value = (movie_ids, scores, strategy, source)
+
+• 有界 LRU + TTL：条目数超过 max_entries 时淘汰最久未访问的；超过 ttl 秒的条目视为过期
+• 失效靠“用户代数”：invalidate(user_id) 只把该用户的代数 +1，旧 key 自然不再命中，
+  不需要扫描 / 按前缀删除，任何 KV 后端都能支持；代数单独存放，不参与 LRU 淘汰
+• model_version 进 key：registry 热替换新模型后旧结果自动失效
+• 后端可插拔：
+    MemoryBackend   进程内 OrderedDict（默认）
+    SQLiteBackend   本机共享文件，多个 worker 进程共用同一份缓存与失效，
+                    作为以后换成外部 KV（Redis 等）之前的本地替身
+• 命中 / 未命中 / 淘汰 / 失效计数通过 stats() 暴露（/api/admin/cache）
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from DNN_TorchFM_TTower.models.config import (
+    RESULT_CACHE_BACKEND, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_PATH,
+)
+
+
+# --------------------------------------------------------------------------- #
+#                                  后 端                                      #
+# --------------------------------------------------------------------------- #
+class MemoryBackend:
+    """ 进程内 LRU；值原样保存，不做序列化 """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._gens: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, user_id: int) -> int:
+        return self._gens.get(user_id, 0)
+
+    def bump(self, user_id: int) -> None:
+        with self._lock:
+            self._gens[user_id] = self._gens.get(user_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    同一台机器上多进程共享的缓存（WAL 模式）；值以 JSON 存储。
+    LRU 按 touched 时间淘汰，超出 max_entries 时一次删掉最旧的 10%
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_entries: int = RESULT_CACHE_SIZE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.evictions = 0
+        self.expirations = 0
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                              key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                              expires_at REAL NOT NULL, touched REAL NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_touched ON entries (touched)")
+            db.execute("""CREATE TABLE IF NOT EXISTS generations (
+                              user_id INTEGER PRIMARY KEY, gen INTEGER NOT NULL)""")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key) -> str:
+        return json.dumps(key)
+
+    def get(self, key):
+        db = self._conn()
+        k = self._key(key)
+        row = db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (k,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            db.execute("DELETE FROM entries WHERE key = ?", (k,))
+            self.expirations += 1
+            return None
+        db.execute("UPDATE entries SET touched = ? WHERE key = ?", (now, k))
+        return tuple(json.loads(row[0]))
+
+    def set(self, key, value, ttl: float) -> None:
+        db = self._conn()
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                   (self._key(key), json.dumps(value), now + ttl, now))
+        n = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if n > self.max_entries:
+            drop = n - self.max_entries + self.max_entries // 10
+            db.execute("DELETE FROM entries WHERE key IN "
+                       "(SELECT key FROM entries ORDER BY touched LIMIT ?)", (drop,))
+            self.evictions += drop
+
+    def generation(self, user_id: int) -> int:
+        row = self._conn().execute("SELECT gen FROM generations WHERE user_id = ?",
+                                   (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id: int) -> None:
+        self._conn().execute("INSERT INTO generations VALUES (?, 1) "
+                             "ON CONFLICT (user_id) DO UPDATE SET gen = gen + 1", (user_id,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM entries")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+CACHE_BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend}
+
+
+def build_backend(name: str = RESULT_CACHE_BACKEND, **kwargs):
+    try:
+        cls = CACHE_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown cache backend {name!r}, expected one of {tuple(CACHE_BACKENDS)}") from None
+    return cls(**kwargs)
+
+
+# --------------------------------------------------------------------------- #
+#                                缓 存 本 体                                   #
+# --------------------------------------------------------------------------- #
+class ResultCache:
+    def __init__(self, backend=None, ttl: float = RESULT_CACHE_TTL):
+        self.backend = backend if backend is not None else build_backend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def get_or_compute(self, user_id: int, top: int, model_version, compute):
+        """ 命中返回缓存值；否则 compute() 并写入。返回 (value, hit) """
+        key = (int(user_id), int(top), model_version, self.backend.generation(int(user_id)))
+        value = self.backend.get(key)
+        if value is not None:
+            self._count("hits")
+            return value, True
+        self._count("misses")
+        value = compute()
+        self.backend.set(key, value, self.ttl)
+        return value, False
+
+    def invalidate(self, user_id: int) -> None:
+        """ 该用户的所有 top / 模型版本的结果立即失效 """
+        self.backend.bump(int(user_id))
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "max_entries": self.backend.max_entries,
+            "ttl_s": self.ttl,
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+            "evictions": self.backend.evictions,
+            "expirations": self.backend.expirations,
+        }
+
+
+_CACHE: ResultCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """ 进程级单例，首次调用时按 config 建后端 """
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ResultCache()
+    return _CACHE
+
+
+def set_result_cache(cache: ResultCache) -> None:
+    """ 由宿主进程 (如 FlaskAPI) 按自己的配置注入缓存 """
+    global _CACHE
+    with _CACHE_LOCK:
+        _CACHE = cache
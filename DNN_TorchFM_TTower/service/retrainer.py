@@ -0,0 +1,281 @@
+# service/retrainer.py
+"""
+后台增量重训调度器：训练不再阻塞交互 / 请求线程
+
+    retrainer = Retrainer(every_n=50).start()
+    retrainer.submit(user_id, movie_id)      # 写入 view_history 之后调用，O(1)，永不阻塞
+    retrainer.status()
+
+• submit() 只把观看事件放进有界队列；队列满时丢弃并计数（训练数据本身来自 view_history）
+• 调度线程累计事件，满 every_n 条触发一次重训；训练进行中到达的触发会合并，
+  结束后最多再补跑一次，而不是排队 N 次
+• 训练在独立的子进程里跑 (spawn)：不与服务进程争 GIL，torch 线程数与 nice 值按 CPU 预算设置
+• CPU 预算 cpu_budget ∈ (0, 1]：子进程最多用 cpu_count × budget 个线程；
+  一次训练耗时 T 后至少空闲 T × (1 − budget) / budget 秒，长期平均占用不超过预算
+• 多 worker 部署 (gunicorn / uwsgi) 时每个 worker 各有一个 Retrainer；训练子进程先对
+  SAVE_DIR/.retrain.lock 取非阻塞排他锁，拿不到说明别的 worker 正在训练，本次跳过，
+  事件计数退回 pending，min_interval 后重试（训练数据来自 view_history，不会漏）。
+  同一时刻只有一个进程写 checkpoint / 推进 high_water
+• checkpoint 由 save_checkpoint 原子写入 (tmp + os.replace)；训练结束后在调度线程里
+  调 registry.refresh()，新模型加载 + 预热完成后才替换，请求线程始终拿到完整的旧 / 新模型
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from DNN_TorchFM_TTower.models.config import (
+    RETRAIN_EVERY_N, RETRAIN_CPU_BUDGET, RETRAIN_MIN_INTERVAL, RETRAIN_NICE, SAVE_DIR,
+)
+
+LOCK_PATH = SAVE_DIR / ".retrain.lock"
+
+DEFAULT_RECALL_KWARGS = {"neg_ratio": 1, "epochs": 1}
+DEFAULT_RANKING_KWARGS = {"epochs": 1, "batch_size": 4096, "neg_ratio": 1, "resume": True}
+
+
+@contextmanager
+def _exclusive_lock(path=LOCK_PATH):
+    """ 跨进程非阻塞排他锁（进程退出时由内核释放）；yield 是否拿到锁 """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        try:
+            import fcntl
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        except ImportError:             # Windows
+            import msvcrt
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _retrain_job(threads: int, nice: int, recall_kwargs: dict | None,
+                 ranking_kwargs: dict | None) -> dict:
+    """ 子进程入口：召回侧增量训练 + 精排侧续训，返回各阶段耗时；别的进程正在训练时跳过 """
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    import torch
+    torch.set_num_threads(threads)
+
+    timings = {}
+    with _exclusive_lock() as acquired:
+        if not acquired:
+            return {"skipped": "another process holds the retrain lock"}
+        if recall_kwargs is not None:
+            from DNN_TorchFM_TTower.models.recall.train_incremental import incremental_train
+            tic = time.perf_counter()
+            incremental_train(**recall_kwargs)
+            timings["recall_s"] = round(time.perf_counter() - tic, 3)
+        if ranking_kwargs is not None:
+            from DNN_TorchFM_TTower.models.ranking.train_ranking import main as ranking_train_main
+            tic = time.perf_counter()
+            ranking_train_main(**ranking_kwargs)
+            timings["ranking_s"] = round(time.perf_counter() - tic, 3)
+    return timings
+
+
+def _refresh_registries() -> list[str]:
+    """ 通知服务进程内的模型注册表：文件已更新，立即重载（不等 watcher 轮询） """
+    from DNN_TorchFM_TTower.models.recall.two_tower import TOWER
+    from DNN_TorchFM_TTower.models.ranking.infer_ranking import RANKER
+
+    swapped = []
+    for reg in (TOWER, RANKER):
+        try:
+            if reg.refresh():
+                swapped.append(reg.name)
+        except Exception as e:          # 新文件加载失败时继续用旧模型
+            print(f"[retrainer] {reg.name} refresh failed: {type(e).__name__}: {e}")
+    return swapped
+
+
+class Retrainer:
+    def __init__(self,
+                 every_n: int = RETRAIN_EVERY_N,
+                 cpu_budget: float = RETRAIN_CPU_BUDGET,
+                 min_interval: float = RETRAIN_MIN_INTERVAL,
+                 nice: int = RETRAIN_NICE,
+                 recall_kwargs: dict | None = DEFAULT_RECALL_KWARGS,
+                 ranking_kwargs: dict | None = DEFAULT_RANKING_KWARGS,
+                 job=_retrain_job,
+                 on_published=_refresh_registries,
+                 max_queue: int = 10000,
+                 poll_interval: float = 0.5):
+        if every_n <= 0:
+            raise ValueError(f"every_n must be positive, got {every_n}")
+        if not 0 < cpu_budget <= 1:
+            raise ValueError(f"cpu_budget must be in (0, 1], got {cpu_budget}")
+        self.every_n = every_n
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.nice = nice
+        self.threads = max(1, math.floor((os.cpu_count() or 1) * cpu_budget))
+        self.recall_kwargs = recall_kwargs
+        self.ranking_kwargs = ranking_kwargs
+        self.job = job
+        self.on_published = on_published
+        self.poll_interval = poll_interval
+
+        self._events: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._future = None
+
+        self._lock = threading.Lock()
+        self._pending = 0               # 上次触发之后累计的事件数
+        self._events_total = 0
+        self._dropped = 0
+        self._runs = 0
+        self._coalesced = 0             # 被合并进同一次训练、没有单独跑的触发次数
+        self._not_before = 0.0          # CPU 预算 / 最小间隔限制下，下次可开训的时间
+        self._run_started = None
+        self._run_events = 0            # 当前这次训练消费的事件数（被锁跳过时退回 pending）
+        self._skipped = 0
+        self._last_run = None
+        self._last_error = None
+
+    # ------------------------------------------------------------------ #
+    #                          生产端（请求线程）                          #
+    # ------------------------------------------------------------------ #
+    def submit(self, user_id: int, movie_id: int) -> bool:
+        """ 记录一条观看事件；队列满时丢弃并返回 False """
+        try:
+            self._events.put_nowait((user_id, movie_id))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+    # ------------------------------------------------------------------ #
+    #                              调度线程                               #
+    # ------------------------------------------------------------------ #
+    def _drain(self, timeout: float) -> int:
+        n = 0
+        try:
+            self._events.get(timeout=timeout)
+            n = 1
+            while True:
+                self._events.get_nowait()
+                n += 1
+        except queue.Empty:
+            pass
+        return n
+
+    def _collect(self):
+        """ 训练子进程结束：记录结果、按 CPU 预算推迟下一次、通知 registry """
+        fut, self._future = self._future, None
+        duration = time.time() - self._run_started
+        record = {"started_at": self._run_started, "duration_s": round(duration, 3)}
+        try:
+            record.update(fut.result())
+            if "skipped" in record:
+                with self._lock:
+                    self._pending += self._run_events
+                    self._skipped += 1
+            else:
+                record["published"] = self.on_published() if self.on_published else []
+            record["ok"] = True
+            self._last_error = None
+        except Exception as e:
+            record["ok"] = False
+            self._last_error = f"{type(e).__name__}: {e}"
+            print(f"[retrainer] run failed: {self._last_error}")
+        idle = duration * (1 - self.cpu_budget) / self.cpu_budget
+        self._not_before = time.time() + max(idle, self.min_interval)
+        self._last_run = record
+        outcome = "skipped: retrain lock held" if "skipped" in record else f"published={record.get('published')}"
+        print(f"[retrainer] run {self._runs} finished in {duration:.1f}s "
+              f"({outcome}), next run not before +{max(idle, self.min_interval):.0f}s")
+
+    def _launch(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"))
+        with self._lock:
+            triggered, self._pending = self._pending, 0
+            self._run_events = triggered
+            self._runs += 1
+            self._coalesced += triggered // self.every_n - 1
+        self._run_started = time.time()
+        print(f"[retrainer] run {self._runs} started ({triggered} new events, {self.threads} threads)")
+        self._future = self._executor.submit(self.job, self.threads, self.nice,
+                                             self.recall_kwargs, self.ranking_kwargs)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            n = self._drain(self.poll_interval)
+            if n:
+                with self._lock:
+                    self._pending += n
+                    self._events_total += n
+            if self._future is not None and self._future.done():
+                self._collect()
+            if (self._future is None and self._pending >= self.every_n
+                    and time.time() >= self._not_before):
+                self._launch()
+
+    # ------------------------------------------------------------------ #
+    #                              生命周期                               #
+    # ------------------------------------------------------------------ #
+    def start(self) -> "Retrainer":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="retrainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """ wait=True 时等正在进行的训练结束并发布，否则直接放弃 """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._future is not None:
+            if wait:
+                self._future.exception()
+                self._collect()
+            else:
+                self._future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "every_n": self.every_n,
+                "cpu_budget": self.cpu_budget,
+                "threads": self.threads,
+                "events_total": self._events_total,
+                "pending_events": self._pending + self._events.qsize(),
+                "dropped_events": self._dropped,
+                "runs": self._runs,
+                "coalesced_triggers": self._coalesced,
+                "skipped_runs": self._skipped,
+                "running": self._future is not None,
+                "next_run_in_s": round(max(0.0, self._not_before - time.time()), 1),
+                "last_run": self._last_run,
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def _vectors(n=4000, d=16, clusters=40, seed=0):
+    """ 带簇结构的 item 向量（与训练后的 item 塔相近），id 不连续 """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, d)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, d)).astype(np.float32)
+    ids = np.arange(n, dtype=np.int64) * 3 + 7
+    return x, ids, rng.normal(size=(50, d)).astype(np.float32)
+
+
+def test_ivf_recall_against_exact():
+    from DNN_TorchFM_TTower.models.recall.ann_index import ExactIndex, build_index, evaluate
+    x, ids, queries = _vectors()
+    exact = ExactIndex.build(x, ids)
+    ivf = build_index("ivf", x, ids, nlist=64, nprobe=16)
+
+    assert evaluate(ivf, exact, queries, k=100)["recall@100"] >= 0.9
+    ivf.nprobe = 64                                  # 扫描全部簇 = 精确检索
+    assert evaluate(ivf, exact, queries, k=100)["recall@100"] == 1.0
+
+    allowed = np.zeros(len(ids), dtype=bool)
+    allowed[::7] = True
+    got, _ = ivf.search(queries[0], 50, allowed=allowed)
+    ref, _ = exact.search(queries[0], 50, allowed=allowed)
+    assert np.array_equal(np.sort(got), np.sort(ref))
+    assert np.isin(got, ids[allowed]).all()
+
+
+def test_save_and_mmap_load_round_trip(tmp_path):
+    from DNN_TorchFM_TTower.models.recall.ann_index import build_index, load_index, save_index
+    x, ids, queries = _vectors(n=1000)
+    for kind in ("exact", "ivf"):
+        index = build_index(kind, x, ids, **({"nlist": 32, "nprobe": 5} if kind == "ivf" else {}))
+        save_index(index, tmp_path / kind)
+        loaded = load_index(tmp_path / kind)
+
+        assert type(loaded) is type(index) and len(loaded) == len(index)
+        assert isinstance(loaded.vectors, np.memmap) and not loaded.vectors.flags.writeable
+        assert isinstance(load_index(tmp_path / kind, mmap=False).vectors, np.ndarray)
+        if kind == "ivf":
+            assert loaded.nprobe == 5
+        for q in queries[:10]:
+            a_ids, a_scores = index.search(q, 20)
+            b_ids, b_scores = loaded.search(q, 20)
+            assert np.array_equal(a_ids, b_ids)
+            assert np.allclose(a_scores, b_scores)
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+def _cols(lo, hi, seed=0):
+    """ id ∈ (lo, hi] 的一批电影列，与 _fetch_columns 的返回格式相同 """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(lo + 1, hi + 1, dtype=np.int64)
+    n = len(ids)
+    g_mid = np.repeat(ids, 2)
+    first = rng.integers(1, 10, n)
+    g_gid = np.stack((first, first + rng.integers(1, 10, n)), 1).ravel()   # 每部电影两个不同 genre
+    return dict(movie_id=ids,
+                language=np.array(rng.choice(["en", "fr", "ja", None], n), dtype=object),
+                vote_average=rng.uniform(0, 10, n).astype(np.float32),
+                vote_count=rng.integers(0, 1000, n).astype(np.int32),
+                popularity=rng.uniform(0, 100, n).astype(np.float32),
+                genre_id=rng.integers(0, 20, n).astype(np.int32),
+                release_year=rng.integers(0, 2024, n).astype(np.int32),
+                genre_pairs=(g_mid, g_gid))
+
+
+def _concat(a, b):
+    out = {k: np.concatenate((a[k], b[k])) for k in a if k != "genre_pairs"}
+    out["genre_pairs"] = tuple(np.concatenate(p) for p in zip(a["genre_pairs"], b["genre_pairs"]))
+    return out
+
+
+def test_extend_matches_a_full_build():
+    from DNN_TorchFM_TTower.models.catalog import CatalogSnapshot
+    head, tail = _cols(0, 500), _cols(500, 800, seed=1)
+    tail["language"][:3] = "ko"                     # 增量里出现的新语言
+    grown = CatalogSnapshot.from_columns(head, version=1).extend(tail, version=2)
+    full = CatalogSnapshot.from_columns(_concat(head, tail), version=2)
+
+    assert grown.row_count == full.row_count == 800 and grown.max_id == 800
+    for lang in ("en", "fr", "ja", "ko"):
+        assert np.array_equal(grown.ids_for_languages([lang]), full.ids_for_languages([lang]))
+    assert np.array_equal(grown.ids_for_languages(), full.ids_for_languages())
+    for a, b in zip(grown.genre_pairs(), full.genre_pairs()):
+        assert np.array_equal(np.sort(a), np.sort(b))
+    decoded = [grown.languages[c] if c >= 0 else None for c in grown.lang_codes]
+    assert decoded == list(_concat(head, tail)["language"])
+
+
+def test_rows_and_movie_features_fill_missing_movies_with_zero():
+    from DNN_TorchFM_TTower.models.catalog import CatalogSnapshot
+    cols = _cols(0, 100)
+    keep = cols["movie_id"] % 3 != 0                # 主键有空洞
+    cols = {k: (v[keep] if k != "genre_pairs" else v) for k, v in cols.items()}
+    cat = CatalogSnapshot.from_columns(cols)
+
+    ids = [2, 3, 100, 0, -5, 10_000]
+    assert cat.rows(ids).tolist() == [1, -1, len(cat) - 1, -1, -1, -1]
+    df = cat.movie_features(ids)
+    assert df["movie_id"].tolist() == ids
+    assert df.loc[0, "vote_average"] == cols["vote_average"][1]
+    assert (df.loc[[1, 3, 4, 5], ["genre_id", "vote_average", "popularity"]] == 0).all().all()
+
+
+def test_refresh_appends_inserts_and_reloads_on_other_changes(monkeypatch):
+    from DNN_TorchFM_TTower.models import catalog
+    state = {"cols": _cols(0, 300), "full": 0, "delta": 0}
+
+    def fetch(min_id=0):
+        c = state["cols"]
+        m = c["movie_id"] > min_id
+        state["delta" if min_id else "full"] += 1
+        g = c["genre_pairs"][0] > min_id
+        return {**{k: v[m] for k, v in c.items() if k != "genre_pairs"},
+                "genre_pairs": (c["genre_pairs"][0][g], c["genre_pairs"][1][g])}
+
+    monkeypatch.setattr(catalog, "_fetch_columns", fetch)
+    monkeypatch.setattr(catalog, "fetchone_dict", lambda _: {"m": int(state["cols"]["movie_id"].max()),
+                                                             "n": len(state["cols"]["movie_id"])})
+    store = catalog.CatalogStore(ttl=1e9, check_interval=1e9)
+    assert store.refresh() and store.get().version == 1
+    assert not store.refresh()                      # 无变化
+
+    state["cols"] = _concat(state["cols"], _cols(300, 350, seed=2))
+    assert store.refresh()
+    snap = store.get()
+    assert (snap.version, snap.row_count, state["full"], state["delta"]) == (2, 350, 1, 1)
+
+    # 删除 + 插入：COUNT 对不上增量结果 → 全量重载
+    c = _concat(state["cols"], _cols(350, 360, seed=3))
+    state["cols"] = {k: (v[1:] if k != "genre_pairs" else v) for k, v in c.items()}
+    assert store.refresh()
+    assert (store.get().row_count, state["full"]) == (359, 2)
+    assert store.get().rows([1])[0] == -1
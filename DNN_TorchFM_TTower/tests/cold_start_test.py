@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def _pool(lo, n=5):
+    ids = np.arange(lo, lo + n, dtype=np.int64)
+    return ids, np.linspace(1.0, 2.0, n)
+
+
+def _pools():
+    """ 各池 id 互不重叠，便于按来源核对份额 """
+    from DNN_TorchFM_TTower.models.recall.cold_start import ColdStartPools
+    return ColdStartPools(1, _pool(0),
+                          by_language={"en": _pool(100), "fr": _pool(200)},
+                          by_genre={1: _pool(300), 2: _pool(400)},
+                          by_age={2: _pool(500)})
+
+
+def _mass(ids, prob, lo):
+    return prob[(ids >= lo) & (ids < lo + 100)].sum()
+
+
+def test_mixture_is_a_distribution_for_every_profile():
+    from DNN_TorchFM_TTower.models.recall import cold_start as cs
+    pools = _pools()
+    profiles = [((), (), None), ((1,), (), None), ((1, 2), ("en",), 2), ((), ("fr", "xx"), 2),
+                ((99,), ("xx",), 7), ((1, 2), ("en", "fr"), 2)]
+    for genres, langs, bucket in profiles:
+        ids, prob = pools.mixture(genres, langs, bucket)
+        assert np.isclose(prob.sum(), 1.0) and (prob > 0).all()
+        assert len(np.unique(ids)) == len(ids)
+
+    ids, prob = pools.mixture((1, 2), ("en",), 2)
+    assert np.isclose(_mass(ids, prob, 300) + _mass(ids, prob, 400), cs.GENRE_SHARE)
+    assert np.isclose(_mass(ids, prob, 300), cs.GENRE_SHARE / 2)
+    assert np.isclose(_mass(ids, prob, 100), cs.LANGUAGE_SHARE)
+    assert np.isclose(_mass(ids, prob, 500), cs.AGE_SHARE)
+    assert np.isclose(_mass(ids, prob, 0), 1 - cs.GENRE_SHARE - cs.LANGUAGE_SHARE - cs.AGE_SHARE)
+
+    ids, prob = pools.mixture((99,), ("xx",), 7)   # 画像在池里都找不到 → 全部给 global
+    assert set(ids.tolist()) == set(range(5))
+
+
+def test_built_pools_from_a_catalog_sum_to_one(monkeypatch):
+    from DNN_TorchFM_TTower.models.recall import cold_start as cs
+    from DNN_TorchFM_TTower.tests.two_tower_test import _catalog
+    cat = _catalog(2000)
+    monkeypatch.setattr(cs, "fetchall_dict",
+                        lambda sql: [{"bucket": 2, "movie_id": m, "n": m % 7 + 1} for m in range(1, 200)])
+    pools = cs.ColdStartPools.build(cat)
+    assert len(pools.global_pool[0]) == cs.POOL_SIZE and set(pools.by_language) == {"en", "fr", "de"}
+
+    rng = np.random.default_rng(0)
+    for genres, langs, bucket in [((), (), None), ((3, 4), ("de",), 2), ((5,), (), 4)]:
+        ids, prob = pools.mixture(genres, langs, bucket)
+        assert np.isclose(prob.sum(), 1.0)
+        monkeypatch.setattr(cs, "get_pools", lambda: pools)
+        picked = cs.recommend_cold_start(20, languages=langs, profile=(bucket, list(genres)), rng=rng)
+        assert len(picked) == len(set(picked)) == 20 and set(picked) <= set(ids.tolist())
@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        from psycopg2 import extensions
+        self.conn.log.append(sql)
+        self.conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+
+
+class _FakeConn:
+    """ 只记录执行过的语句 / commit / rollback，不连数据库 """
+
+    def __init__(self):
+        from psycopg2 import extensions
+        self.log = []
+        self.closed = 0
+        self.autocommit = False
+        self.info = SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self, **_):
+        return _Cursor(self)
+
+    def commit(self):
+        from psycopg2 import extensions
+        self.log.append("COMMIT")
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        from psycopg2 import extensions
+        self.log.append("ROLLBACK")
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def _pool(monkeypatch, **kwargs):
+    from DNN_TorchFM_TTower.models import db_pool
+    monkeypatch.setattr(db_pool.psycopg2, "connect", lambda **_: _FakeConn())
+    return db_pool.ConnectionPool(**{"min_size": 0, "max_size": 2, **kwargs})
+
+
+def test_transaction_on_own_connection_commits_or_rolls_back(monkeypatch):
+    pool = _pool(monkeypatch)
+    with pool.transaction() as conn:
+        conn.cursor().execute("INSERT 1")
+    assert conn.log == ["INSERT 1", "COMMIT"]
+
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.cursor().execute("INSERT 2")
+            raise RuntimeError("boom")
+    assert conn.log[-2:] == ["INSERT 2", "ROLLBACK"]
+
+
+def test_transaction_on_attached_connection_never_ends_the_host_transaction(monkeypatch):
+    pool = _pool(monkeypatch)
+    host = pool.getconn()
+    pool.attach(host)
+    host.cursor().execute("UPDATE route")          # 路由自己尚未提交的写入
+
+    with pool.transaction() as conn:
+        assert conn is host
+        conn.cursor().execute("INSERT ok")
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.cursor().execute("INSERT bad")
+            raise RuntimeError("boom")
+
+    assert "COMMIT" not in host.log and "ROLLBACK" not in host.log
+    assert host.log == ["UPDATE route",
+                        "SAVEPOINT pool_txn", "INSERT ok", "RELEASE SAVEPOINT pool_txn",
+                        "SAVEPOINT pool_txn", "INSERT bad",
+                        "ROLLBACK TO SAVEPOINT pool_txn", "RELEASE SAVEPOINT pool_txn"]
+    pool.detach()
+    pool.putconn(host)
+
+
+def test_exhausted_pool_times_out_then_serves_the_returned_connection(monkeypatch):
+    import threading
+    from DNN_TorchFM_TTower.models.db_pool import PoolTimeout
+    pool = _pool(monkeypatch, timeout=0.05)
+    a, b = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1 and pool.stats()["in_use"] == 2
+
+    # 另一线程归还后，排队中的借出拿到的是同一条物理连接，而不是新建
+    threading.Timer(0.05, pool.putconn, args=(a,)).start()
+    c = pool.getconn(timeout=2.0)
+    assert c is a
+    s = pool.stats()
+    assert s["connections_opened"] == 2 and s["saturated_checkouts"] == 1
+    pool.putconn(b)
+    pool.putconn(c)
+    assert pool.stats()["idle"] == 2
+
+
+def test_putconn_rolls_back_open_transaction_and_recycles_old_connections(monkeypatch):
+    pool = _pool(monkeypatch, max_lifetime=0.0)
+    conn = pool.getconn()
+    conn.cursor().execute("UPDATE x")
+    pool.putconn(conn)
+    assert conn.log[-1] == "ROLLBACK" and conn.closed
+    assert pool.stats()["recycled"] == 1 and pool.stats()["idle"] == 0
+
+
+def test_connection_reuses_the_attached_connection(monkeypatch):
+    pool = _pool(monkeypatch, max_size=1, timeout=0.05)
+    host = pool.getconn()
+    pool.attach(host)
+    with pool.connection() as conn:          # max_size=1：若再借一条会超时
+        assert conn is host
+        with pool.connection() as inner:
+            assert inner is host
+    assert pool.stats()["checkouts"] == 1
+    pool.detach()
+    pool.putconn(host)
+
+    with pool.connection() as conn:
+        assert conn is host                  # 归还后回到池里被复用
+    assert pool.stats()["in_use"] == 0
+
+
+def test_putconn_rejects_foreign_connections(monkeypatch):
+    from psycopg2.pool import PoolError
+    pool = _pool(monkeypatch)
+    with pytest.raises(PoolError):
+        pool.putconn(_FakeConn())
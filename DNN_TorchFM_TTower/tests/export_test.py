@@ -0,0 +1,82 @@
+import pytest
+
+
+def _tower_checkpoint(path, arch, seed=0):
+    import torch
+    from DNN_TorchFM_TTower.models.checkpoint import save_checkpoint
+    from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+    meta = dict(arch=arch, num_users=60, num_movies=200, embedding_dim=16, hidden_dim=32)
+    torch.manual_seed(seed)
+    save_checkpoint(path, build_two_tower(**meta).state_dict(), **meta)
+
+
+def _ranker_checkpoint(path, seed=0):
+    import torch
+    from DNN_TorchFM_TTower.models.checkpoint import save_checkpoint
+    from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
+    from DNN_TorchFM_TTower.models.ranking.feature_store import DENSE_COLS
+    meta = dict(field_dims=[60, 200, 20], num_dense=len(DENSE_COLS))
+    torch.manual_seed(seed)
+    save_checkpoint(path, DeepFM(meta["field_dims"], num_dense=meta["num_dense"]).state_dict(), **meta)
+
+
+@pytest.mark.parametrize("arch", ["mlp", "dot"])
+def test_exported_two_tower_matches_eager(tmp_path, arch):
+    import torch
+    from DNN_TorchFM_TTower.models.export import artifact_path
+    from DNN_TorchFM_TTower.models.recall.two_tower import _build_model, _example_inputs, export_model
+    path = tmp_path / "tower.pt"
+    _tower_checkpoint(path, arch)
+    assert export_model(path) == artifact_path(path)
+
+    eager = _build_model(path, exported=False)
+    served = _build_model(path)
+    assert served.runtime == "torchscript" and type(served) is type(eager)
+    with torch.no_grad():
+        for batch in (3, 50):
+            for name, args in _example_inputs(eager, batch).items():
+                assert torch.allclose(getattr(served, name)(*args), getattr(eager, name)(*args),
+                                      rtol=1e-4, atol=1e-5), name
+
+
+def test_exported_ranker_matches_eager_and_goes_stale_with_the_checkpoint(tmp_path):
+    import torch
+    from DNN_TorchFM_TTower.models.ranking.infer_ranking import _example_inputs, _load_model, export_model
+    path = tmp_path / "ranker.pt"
+    _ranker_checkpoint(path)
+    export_model(path)
+
+    eager, served = _load_model(path, exported=False), _load_model(path)
+    assert served.runtime == "torchscript"
+    with torch.no_grad():
+        xs, xd = _example_inputs(eager, 40)["forward"]
+        assert torch.allclose(served(xs, xd), eager(xs, xd), rtol=1e-4, atol=1e-5)
+
+    _ranker_checkpoint(path, seed=1)                 # 重新训练：旧推断图的 sha1 不再匹配
+    assert _load_model(path).runtime == "eager"
+
+
+def test_compare_rejects_a_diverging_graph():
+    import torch
+    from DNN_TorchFM_TTower.models.export import ExportMismatch, compare
+    eager = torch.nn.Linear(4, 2).eval()
+    other = torch.nn.Linear(4, 2).eval()
+    assert compare(eager, eager, {"forward": (torch.randn(5, 4),)}) == {"forward": 0.0}
+    with pytest.raises(ExportMismatch):
+        compare(eager, other, {"forward": (torch.randn(5, 4),)})
+
+
+def test_registry_reloads_when_the_inference_graph_appears(tmp_path):
+    from DNN_TorchFM_TTower.models.export import artifact_path
+    from DNN_TorchFM_TTower.models.recall.two_tower import _build_model, export_model
+    from DNN_TorchFM_TTower.models.registry import CheckpointRegistry
+    path = tmp_path / "tower.pt"
+    _tower_checkpoint(path, "dot")
+    reg = CheckpointRegistry(path, _build_model, watch_interval=3600, name="test-export-tower",
+                             companions=(artifact_path(path),))
+    assert reg.refresh() and reg.get().runtime == "eager"
+    export_model(path)                               # checkpoint 没变，只多了 .ts
+    assert reg.refresh() and reg.get().runtime == "torchscript"
+    artifact_path(path).unlink()
+    assert reg.refresh() and reg.get().runtime == "eager"
+    reg.stop()
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def _column():
+    from DNN_TorchFM_TTower.models.ranking.feature_store import CSRColumn
+    # movie 1 → [3, 5], movie 2 → 无, movie 3 → [2, 7, 9], movie 4 → [4]
+    return CSRColumn.from_pairs([3, 1, 3, 4, 1, 3], [9, 5, 2, 4, 3, 7], max_id=4)
+
+
+def _bags(indices, offsets):
+    ends = np.r_[offsets[1:], len(indices)]
+    return [indices[s:e].tolist() for s, e in zip(offsets, ends)]
+
+
+def test_gather_empty_bags():
+    indices, offsets = _column().gather(np.array([2, 1, 0, 99, -1, 3]))
+    assert _bags(indices, offsets) == [[], [3, 5], [], [], [], [2, 7, 9]]
+    assert offsets.dtype == np.int64 and len(offsets) == 6
+
+
+def test_gather_trailing_empty_bag():
+    indices, offsets = _column().gather(np.array([3, 4, 2]))
+    assert indices.tolist() == [2, 7, 9, 4]
+    assert offsets.tolist() == [0, 3, 4]
+    assert _bags(indices, offsets) == [[2, 7, 9], [4], []]
+
+
+def test_gather_all_empty():
+    indices, offsets = _column().gather(np.array([2, 0]))
+    assert len(indices) == 0 and offsets.tolist() == [0, 0]
+
+
+def test_gather_vocab_truncation():
+    col = _column()
+    indices, offsets = col.gather(np.array([1, 3, 4, 2]), vocab_size=5)
+    assert _bags(indices, offsets) == [[3], [2], [4], []]
+    # 整个 bag 被截空，后面的 offsets 依然对齐
+    indices, offsets = col.gather(np.array([3, 1]), vocab_size=3)
+    assert _bags(indices, offsets) == [[2], []]
+    assert col.vocab_size == 11
+
+
+def test_unknown_user_ids_hit_the_database_at_most_once_per_interval(monkeypatch):
+    from types import SimpleNamespace
+    from DNN_TorchFM_TTower.models.ranking import feature_store
+    store = feature_store.FeatureStore()
+    store._snapshot = SimpleNamespace(max_user_id=100, catalog_version=1)
+    calls = []
+
+    def fetch_users(min_id=0):
+        calls.append(min_id)
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    monkeypatch.setattr(feature_store, "_STORE", store)
+    monkeypatch.setattr(feature_store, "_fetch_users", fetch_users)
+    monkeypatch.setattr(feature_store, "get_catalog", lambda: SimpleNamespace(version=1))
+    monkeypatch.setattr(feature_store, "FEATURE_STORE_USER_REFRESH_INTERVAL", 60.0)
+
+    for _ in range(20):
+        assert feature_store.features_for([5, 10 ** 9]) is store._snapshot
+    assert calls == [100]
+    feature_store.features_for([5, 50])              # 已知用户不查库
+    assert calls == [100]
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def _movies(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, n + 1, dtype=np.int64)
+    langs = np.array(rng.choice(["en", "fr", "", None], n), dtype=object)
+    years = rng.choice([0, 1999, 2000, 2001], n).astype(np.int32)
+    pairs = [(m, g) for m in ids for g in rng.choice(8, rng.integers(0, 3), replace=False)]
+    g_mid = np.array([p[0] for p in pairs], dtype=np.int64)
+    g_gid = np.array([p[1] for p in pairs], dtype=np.int64)
+    return ids, langs, (g_mid, g_gid), years
+
+
+def _brute(movies, languages=None, genres=None, years=None):
+    """ 逐部电影线性扫描，作为对照 """
+    ids, langs, (g_mid, g_gid), ys = movies
+    out = []
+    for i, m in enumerate(ids):
+        if languages is not None and langs[i] not in languages:
+            continue
+        if genres is not None and not set(g_gid[g_mid == m]) & set(genres):
+            continue
+        if years is not None and ys[i] not in years:
+            continue
+        out.append(m)
+    return out
+
+
+def test_candidates_match_a_linear_scan():
+    from DNN_TorchFM_TTower.models.movie_index import MovieIndex
+    movies = _movies()
+    index = MovieIndex.build(*movies)
+    cases = [dict(languages=["en"]),
+             dict(languages=["en", "fr"], genres=[1, 2]),
+             dict(genres=[0, 3, 7], years=[2000]),
+             dict(languages=["fr"], genres=[5], years=[1999, 2001]),
+             dict(languages=["xx"]),
+             dict(genres=[])]
+    for kw in cases:
+        got = index.candidates(**kw)
+        assert got.tolist() == _brute(movies, **kw), kw
+        assert np.all(np.diff(got) > 0)
+    assert len(index.candidates()) == 0
+    # 缺失语言 / 年份的电影不进任何分区
+    assert "" not in index.keys("language") and 0 not in index.keys("year")
+
+
+def test_extend_matches_a_full_build_and_leaves_the_old_index_untouched():
+    from DNN_TorchFM_TTower.models.movie_index import MovieIndex
+    ids, langs, (g_mid, g_gid), years = _movies()
+    cut, g_cut = 300, np.searchsorted(g_mid, 301)
+    old = MovieIndex.build(ids[:cut], langs[:cut], (g_mid[:g_cut], g_gid[:g_cut]), years[:cut])
+    before = old.sizes()
+
+    grown = old.extend(ids[cut:], langs[cut:], (g_mid[g_cut:], g_gid[g_cut:]), years[cut:])
+    full = MovieIndex.build(ids, langs, (g_mid, g_gid), years)
+    assert grown.sizes() == full.sizes()
+    for field in ("language", "genre", "year"):
+        for key in full.keys(field):
+            assert np.array_equal(grown.ids(field, [key]), full.ids(field, [key]))
+    assert old.sizes() == before
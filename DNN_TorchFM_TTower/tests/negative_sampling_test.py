@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def _synthetic(seed=0, n_movies=400, n_users=60, n_genres=70):
+    """ movie_id ≠ 行号、user_id ≠ 位置，且有重度用户，拒绝采样和枚举两条路径都会走到 """
+    rng = np.random.default_rng(seed)
+    movie_ids = np.arange(1, n_movies + 1) * 3 + 7
+    bits = rng.random((n_movies, n_genres)) < 0.05
+    masks = np.zeros((n_movies, 2), dtype=np.uint64)
+    for g in range(n_genres):
+        masks[bits[:, g], g // 64] |= np.uint64(1) << np.uint64(g % 64)
+    user_ids = rng.choice(np.arange(100, 100_000), n_users, replace=False)
+    sizes = rng.integers(1, 40, n_users)
+    sizes[:5] = 300
+    users = np.repeat(user_ids, sizes)
+    movies = np.concatenate([rng.choice(movie_ids, k, replace=False) for k in sizes])
+    return movie_ids, masks, users, movies
+
+
+def test_negatives_never_include_watched_movies():
+    from DNN_TorchFM_TTower.models.negative_sampling import NegativeSampler
+    movie_ids, masks, users, movies = _synthetic()
+    watched = set(zip(users.tolist(), movies.tolist()))
+    for genre_disjoint in (True, False):
+        for neg_ratio in (1, 50):
+            for min_accept in (0.02, 0.5):
+                results = []
+                for n_jobs in (1, 4):
+                    sampler = NegativeSampler(movie_ids, masks, seed=7, n_jobs=n_jobs,
+                                              min_accept=min_accept)
+                    nu, nm = sampler.sample(users, movies, neg_ratio, genre_disjoint=genre_disjoint)
+                    assert len(nu) > 0
+                    assert not watched & set(zip(nu.tolist(), nm.tolist()))
+                    assert len(set(zip(nu.tolist(), nm.tolist()))) == len(nu)
+                    results.append((nu, nm))
+                assert np.array_equal(results[0][0], results[1][0])
+                assert np.array_equal(results[0][1], results[1][1])
+
+
+def test_hard_negatives_fall_back_to_uniform_for_users_outside_the_model():
+    import torch
+    from DNN_TorchFM_TTower.models.negative_sampling import HardNegatives, UniformNegatives, UserHistory
+    from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+    movie_ids, _, users, movies = _synthetic()
+    history = UserHistory(users, np.searchsorted(movie_ids, movies), len(movie_ids))
+    num_users = int(np.median(history.users))         # 一半用户在模型之后才注册
+    torch.manual_seed(0)
+    model = build_two_tower(arch="dot", num_users=num_users, num_movies=int(movie_ids[200]),
+                            embedding_dim=8, hidden_dim=16, out_dim=8, score="dot")
+    strategy = HardNegatives(history, movie_ids, k=20, mix=1.0)
+    strategy.refresh(model)
+
+    pos = np.arange(len(history))
+    rows = strategy.draw(pos, np.zeros(len(pos), dtype=np.int64), 5, np.random.default_rng(3))
+    uniform = UniformNegatives(len(movie_ids)).draw(pos, None, 5, np.random.default_rng(3))
+    unknown = history.users >= model.user_embedding.num_embeddings
+    assert unknown.any() and (~unknown).any()
+    assert np.array_equal(rows[unknown], uniform[unknown])
+    assert (strategy._top[unknown] == -1).all()
+    known_items = movie_ids < model.movie_embedding.num_embeddings
+    assert known_items[rows[~unknown]].all()
+
+
+def test_genre_strategy_draws_through_the_sampler():
+    from DNN_TorchFM_TTower.models.negative_sampling import (
+        GenreDisjointNegatives, NegativeSampler, UserHistory, _disjoint,
+    )
+    movie_ids, masks, users, movies = _synthetic()
+    sampler = NegativeSampler(movie_ids, masks)
+    history = UserHistory(users, sampler._rows_of(movies), len(sampler))
+    strategy = GenreDisjointNegatives(history, sampler, rounds=50)
+    pos = np.r_[np.arange(len(history)), -1]
+    rows = strategy.draw(pos, None, 8, np.random.default_rng(0))
+    assert rows.shape == (len(pos), 8)
+    ok = _disjoint(masks[rows[:-1]], strategy.user_masks[:, None, :])
+    roomy = sampler._eligible_counts(strategy.user_masks) >= 0.2 * len(sampler)
+    assert roomy.any() and ok[roomy].all()
+
+
+def test_history_from_sorted_chunks_matches_in_memory_build():
+    from DNN_TorchFM_TTower.models.negative_sampling import NegativeSampler, UserHistory
+    movie_ids, masks, users, movies = _synthetic()
+    users = np.r_[users, users[:50], 7]             # 重复观看 + 不在 catalog 里的电影
+    movies = np.r_[movies, movies[:50], 5]
+    rows_of = NegativeSampler(movie_ids, masks)._rows_of
+    ref = UserHistory(users, rows_of(movies), len(movie_ids))
+
+    pairs = np.stack([users, movies], axis=1)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))].astype(np.int32)
+    for chunk_rows in (1, 37, len(pairs)):
+        chunks = (pairs[s:s + chunk_rows] for s in range(0, len(pairs), chunk_rows))
+        got = UserHistory.from_sorted_chunks(chunks, rows_of, len(movie_ids))
+        for name in ("users", "keys", "rows", "indptr"):
+            assert np.array_equal(getattr(got, name), getattr(ref, name)), name
+    empty = UserHistory.from_sorted_chunks(iter(()), rows_of, len(movie_ids))
+    assert len(empty) == 0 and len(empty.keys) == 0 and list(empty.indptr) == [0]
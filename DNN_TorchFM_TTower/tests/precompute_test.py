@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psycopg2
+
+
+class _Pool:
+    """ transaction() 给出一条游标只会返回 row（或抛 error）的连接 """
+
+    def __init__(self, row=None, error=None):
+        self.row, self.error, self.executed = row, error, []
+
+    @contextmanager
+    def transaction(self):
+        pool = self
+
+        class _Cur:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                if pool.error:
+                    raise pool.error
+                pool.executed.append(params)
+
+            def fetchone(self):
+                return pool.row
+
+        yield SimpleNamespace(cursor=lambda: _Cur())
+
+
+def _lookup(monkeypatch, row=None, error=None, version="tower-ranker", top=3):
+    from DNN_TorchFM_TTower.service import precompute
+    pool = _Pool(row, error)
+    monkeypatch.setattr(precompute, "get_pool", lambda: pool)
+    monkeypatch.setattr(precompute, "model_version", lambda: version)
+    return precompute.lookup(7, top), pool
+
+
+def test_lookup_serves_only_fresh_rows_of_the_current_model(monkeypatch):
+    row = ([5, 4, 3, 2], [0.9, 0.8, 0.7, 0.6], "two_tower+ranker", "tower-ranker", True)
+    hit, pool = _lookup(monkeypatch, row)
+    assert hit == ([5, 4, 3], [0.9, 0.8, 0.7], "two_tower+ranker") and pool.executed == [(7,)]
+
+    assert _lookup(monkeypatch, row[:4] + (False,))[0] is None          # 之后又有新观看
+    assert _lookup(monkeypatch, row[:3] + ("old-ranker", True))[0] is None
+    assert _lookup(monkeypatch, row, top=5)[0] is None                  # 存下的条数不够
+    assert _lookup(monkeypatch, None)[0] is None                        # 没有这一行
+    assert _lookup(monkeypatch, error=psycopg2.ProgrammingError("no table"))[0] is None
+
+    miss, pool = _lookup(monkeypatch, row, version=None)                # 模型未加载：不查库
+    assert miss is None and pool.executed == []
+
+    cold = ([1, 2, 3], None, "cold_start", "tower-ranker", True)
+    assert _lookup(monkeypatch, cold)[0] == ([1, 2, 3], [None] * 3, "cold_start")
+
+
+def test_model_version_combines_both_checkpoints(monkeypatch):
+    from DNN_TorchFM_TTower.models.ranking import infer_ranking
+    from DNN_TorchFM_TTower.models.recall import two_tower
+    from DNN_TorchFM_TTower.service.precompute import model_version
+
+    monkeypatch.setattr(two_tower, "TOWER", SimpleNamespace(sha1="a" * 40))
+    monkeypatch.setattr(infer_ranking, "RANKER", SimpleNamespace(sha1="b" * 40))
+    assert model_version() == "a" * 12 + "-" + "b" * 12
+    monkeypatch.setattr(infer_ranking, "RANKER", SimpleNamespace(sha1=None))
+    assert model_version() == "a" * 12 + "-none"
+    monkeypatch.setattr(two_tower, "TOWER", SimpleNamespace(sha1=None))
+    assert model_version() is None
+
+
+def test_precompute_all_writes_one_row_per_active_user(monkeypatch):
+    from DNN_TorchFM_TTower.service import precompute, recommender
+    users = [{"user_id": u, "last_view": f"2026-01-0{u}"} for u in (1, 2, 3)]
+    written = []
+    monkeypatch.setattr(precompute, "ensure_table", lambda: None)
+    monkeypatch.setattr(precompute, "model_version", lambda: "v1-v2")
+    monkeypatch.setattr(precompute, "_active_users", lambda days: users)
+    monkeypatch.setattr(precompute, "get_pool", lambda: _Pool())
+    monkeypatch.setattr(precompute, "execute_values", lambda cur, sql, rows: written.extend(rows))
+    monkeypatch.setattr(recommender, "recommend_movies_for_users",
+                        lambda ids, n_recall, n_final: {u: ([u * 10, u * 10 + 1], [1.0, None], "x")
+                                                        for u in ids})
+
+    assert precompute.precompute_all(batch_size=2, top=2) == 3
+    assert written == [(u, [u * 10, u * 10 + 1], [1.0, None], "x", "v1-v2", f"2026-01-0{u}")
+                       for u in (1, 2, 3)]
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def _dense(n=5000, seed=0):
+    """ recall_score · vote_average · popularity · age，age=0 表示缺失 """
+    rng = np.random.default_rng(seed)
+    age = rng.integers(12, 80, n).astype(np.float32)
+    age[rng.random(n) < 0.2] = 0
+    return np.stack([rng.normal(3.0, 2.0, n), rng.uniform(0, 10, n),
+                     rng.pareto(1.5, n) * 10, age], axis=1).astype(np.float32)
+
+
+def test_each_transform_normalises_its_column():
+    from DNN_TorchFM_TTower.models.ranking.feature_store import DENSE_COLS
+    from DNN_TorchFM_TTower.models.ranking.preprocess import DensePreprocessor
+    xd = _dense()
+    pre = DensePreprocessor.fit(xd, DENSE_COLS)
+    assert [p["kind"] for p in pre.params] == ["quantile", "standard", "log", "bucket"]
+
+    out = pre.transform(xd.copy())
+    score, vote, pop, age = out.T
+    assert score.min() >= 0 and score.max() <= 1 and abs(np.median(score) - 0.5) < 0.02
+    assert np.all(np.diff(score[np.argsort(xd[:, 0])]) >= 0)          # 分位数映射保序
+    assert abs(vote.mean()) < 1e-3 and abs(vote.std() - 1) < 1e-3
+    assert abs(pop.mean()) < 1e-3 and abs(pop.std() - 1) < 1e-3
+    assert (age[xd[:, 3] == 0] == 0).all()
+    assert (age[xd[:, 3] > 0] > 0).all() and age.max() == 1.0
+
+
+def test_preprocess_round_trips_through_the_ranker_checkpoint(tmp_path):
+    import torch
+    from DNN_TorchFM_TTower.models.checkpoint import save_checkpoint
+    from DNN_TorchFM_TTower.models.ranking.custom_deepfm import DeepFM
+    from DNN_TorchFM_TTower.models.ranking.feature_store import DENSE_COLS
+    from DNN_TorchFM_TTower.models.ranking.infer_ranking import _load_model
+    from DNN_TorchFM_TTower.models.ranking.preprocess import DensePreprocessor
+
+    train, serve = _dense(seed=0), _dense(n=300, seed=1)
+    pre = DensePreprocessor.fit(train, DENSE_COLS)
+    model = DeepFM([20, 30, 5], num_dense=len(DENSE_COLS))
+    meta = dict(field_dims=[20, 30, 5], num_dense=len(DENSE_COLS))
+    save_checkpoint(tmp_path / "ranker.pt", model.state_dict(), dense_preprocess=pre.state(), **meta)
+    save_checkpoint(tmp_path / "old.pt", model.state_dict(), **meta)
+
+    loaded = _load_model(tmp_path / "ranker.pt", exported=False)
+    assert loaded.preprocess.columns == list(DENSE_COLS)
+    assert np.array_equal(loaded.preprocess.transform(serve.copy()), pre.transform(serve.copy()))
+    assert _load_model(tmp_path / "old.pt", exported=False).preprocess is None   # 旧 checkpoint：原始值输入
+    assert isinstance(torch.load(tmp_path / "ranker.pt")["meta"]["dense_preprocess"]["params"][0]
+                      ["quantiles"], list)                                      # 纯 JSON 类型
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+
+def _write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _registry(path, **kw):
+    from DNN_TorchFM_TTower.models.registry import CheckpointRegistry
+    loads = []
+
+    def loader(p):
+        loads.append(p.read_text())
+        if loads[-1] == "corrupt":
+            raise ValueError("bad checkpoint")
+        return {"content": loads[-1]}
+
+    reg = CheckpointRegistry(path, loader, watch_interval=3600, name=f"test-{path.name}", **kw)
+    return reg, loads
+
+
+def test_reloads_only_when_the_content_changes(tmp_path):
+    path = tmp_path / "model.pt"
+    reg, loads = _registry(path)
+    assert reg.get() is None                        # 文件尚不存在
+    _write(path, "v1", 1_000_000_000)
+    assert reg.refresh() and reg.get()["content"] == "v1"
+
+    old = reg.get()
+    _write(path, "v1", 2_000_000_000)               # 仅 touch：签名变了，sha1 没变
+    assert not reg.refresh() and reg.get() is old
+    _write(path, "v2", 3_000_000_000)
+    assert reg.refresh() and reg.get()["content"] == "v2"
+    assert old["content"] == "v1"                   # 旧引用不受替换影响
+    assert loads == ["v1", "v2"]
+    reg.stop()
+
+
+def test_warmup_runs_before_swap_and_a_bad_file_keeps_the_old_model(tmp_path):
+    from DNN_TorchFM_TTower.models.registry import all_status
+    path = tmp_path / "tower.pt"
+    _write(path, "v1", 1_000_000_000)
+    seen = []
+    reg, _ = _registry(path, history=2, warmup=lambda m: seen.append((m["content"], reg._model)))
+
+    first = reg.get()                               # 首次 get() 同步加载并启动 watcher
+    assert seen == [("v1", None)]                   # 预热时新模型尚未对外可见
+    _write(path, "v2", 2_000_000_000)
+    reg.refresh()
+    assert seen[-1] == ("v2", first)
+
+    _write(path, "corrupt", 3_000_000_000)
+    with pytest.raises(ValueError):               # watcher 捕获该异常并继续用旧模型
+        reg.refresh()
+    assert reg.get()["content"] == "v2"
+
+    _write(path, "v3", 4_000_000_000)
+    reg.refresh()
+    status = all_status()[reg.name]
+    assert status["version"] == 3 and status["watching"]
+    assert [h["version"] for h in status["history"]] == [3, 2]   # 只保留最近 history 个版本
+    assert reg.sha1 == status["current"]["sha1"]
+    reg.stop()
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path, monkeypatch):
+    """ 两个后端跑同一组用例；time.time 换成可拨动的假时钟 """
+    from DNN_TorchFM_TTower.service import result_cache
+    clock = SimpleNamespace(now=1_000.0)
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=lambda: clock.now))
+
+    def make(max_entries=100, ttl=60.0):
+        kw = {"path": tmp_path / "cache.sqlite"} if request.param == "sqlite" else {}
+        backend = result_cache.build_backend(request.param, max_entries=max_entries, **kw)
+        return result_cache.ResultCache(backend, ttl=ttl), clock
+    return make
+
+
+def _value(user_id, tag="live"):
+    return ([user_id, user_id + 1], [0.5, 0.25], "two_tower", tag)
+
+
+def _get(cache, user_id, top=10, version="v1", tag="live"):
+    return cache.get_or_compute(user_id, top, version, lambda: _value(user_id, tag))
+
+
+def test_hit_after_miss_and_key_includes_top_and_model_version(make_cache):
+    cache, _ = make_cache()
+    assert _get(cache, 1) == (_value(1), False)
+    assert _get(cache, 1, tag="recomputed") == (_value(1), True)
+    assert _get(cache, 1, top=20)[1] is False
+    assert _get(cache, 1, version="v2")[1] is False
+    s = cache.stats()
+    assert (s["hits"], s["misses"], s["entries"]) == (1, 3, 3)
+
+
+def test_invalidate_drops_every_entry_of_that_user_only(make_cache):
+    cache, _ = make_cache()
+    for top in (10, 20):
+        _get(cache, 1, top=top)
+    _get(cache, 2)
+    cache.invalidate(1)
+    assert _get(cache, 1, tag="new") == (_value(1, "new"), False)
+    assert _get(cache, 1, top=20)[1] is False
+    assert _get(cache, 2)[1] is True
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_entries_expire_after_ttl(make_cache):
+    cache, clock = make_cache(ttl=60.0)
+    _get(cache, 1)
+    clock.now += 59
+    assert _get(cache, 1)[1] is True
+    clock.now += 2
+    assert _get(cache, 1, tag="fresh") == (_value(1, "fresh"), False)
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_evicts_the_least_recently_used(make_cache):
+    cache, clock = make_cache(max_entries=3)
+    for user_id in (1, 2, 3):
+        _get(cache, user_id)
+        clock.now += 1
+    assert _get(cache, 1)[1] is True           # 1 变成最近使用
+    clock.now += 1
+    _get(cache, 4)
+    assert cache.stats()["evictions"] >= 1
+    assert _get(cache, 2)[1] is False          # 最久未访问的被淘汰
+    assert _get(cache, 4)[1] is True
+    assert len(cache.backend) <= 3
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while not cond():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _retrainer(job, published, **kw):
+    """ 用线程池代替 spawn 子进程，job 可以是闭包 """
+    from DNN_TorchFM_TTower.service.retrainer import Retrainer
+    r = Retrainer(job=job, on_published=lambda: published.append(1) or ["tower"],
+                  cpu_budget=1.0, min_interval=0.0, poll_interval=0.01, **kw)
+    r._executor = ThreadPoolExecutor(max_workers=1)
+    return r
+
+
+def test_triggers_during_a_run_are_coalesced_into_one_follow_up():
+    gate, calls, published = threading.Event(), [], []
+
+    def job(threads, nice, recall_kwargs, ranking_kwargs):
+        calls.append(threads)
+        gate.wait()
+        return {"recall_s": 0.0}
+
+    r = _retrainer(job, published, every_n=2).start()
+    for i in range(2):
+        r.submit(1, i)
+    _wait(lambda: r.status()["running"])
+    for i in range(7):                       # 训练中到达 3 次触发 + 1 条零头
+        r.submit(1, i)
+    _wait(lambda: r.status()["pending_events"] == 7)
+    gate.set()
+    _wait(lambda: r.status()["runs"] == 2 and not r.status()["running"])
+    r.stop()
+
+    s = r.status()
+    assert len(calls) == 2 and len(published) == 2
+    assert s["events_total"] == 9 and s["pending_events"] == 0
+    assert s["coalesced_triggers"] == 2 and s["last_run"]["ok"]
+
+
+def test_a_run_skipped_on_the_lock_returns_its_events_and_does_not_publish():
+    results = [{"skipped": "another process holds the retrain lock"}, {}]
+    published = []
+    r = _retrainer(lambda *a: results.pop(0), published, every_n=3)
+    r.start()
+    for i in range(3):
+        r.submit(1, i)
+    _wait(lambda: r.status()["runs"] == 2 and not r.status()["running"])
+    r.stop()
+
+    s = r.status()
+    assert s["skipped_runs"] == 1 and published == [1]
+    assert s["pending_events"] == 0 and s["events_total"] == 3
+
+
+def test_submit_never_blocks_when_the_queue_is_full():
+    r = _retrainer(lambda *a: {}, [], max_queue=2)     # 不 start：没人消费队列
+    assert [r.submit(1, i) for i in range(4)] == [True, True, False, False]
+    assert r.status()["dropped_events"] == 2
+
+
+def test_retrain_lock_is_exclusive(tmp_path):
+    from DNN_TorchFM_TTower.service.retrainer import _exclusive_lock
+    path = tmp_path / ".retrain.lock"
+    with _exclusive_lock(path) as first:
+        with _exclusive_lock(path) as second:
+            assert first and not second
+    with _exclusive_lock(path) as again:
+        assert again
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def _scores(seed=0, users=40, n=300):
+    """ 取值很少 → 大量边界并列；再混入 NaN / ±inf """
+    import torch
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, 6, (users, n)).astype(np.float32)
+    x[rng.random(x.shape) < 0.05] = np.nan
+    x[rng.random(x.shape) < 0.01] = -np.inf
+    x[rng.random(x.shape) < 0.01] = np.inf
+    x[0] = np.nan                      # 整行 NaN
+    x[1] = 3.0                         # 整行并列
+    return torch.from_numpy(x)
+
+
+def test_topk_rows_matches_topk_tensor_per_row():
+    from DNN_TorchFM_TTower.models.topk import topk_rows, topk_tensor
+    scores = _scores()
+    for k in (1, 7, 50, 299, 300, 1000):
+        vals, idx = topk_rows(scores, k)
+        assert vals.shape == idx.shape == (scores.size(0), min(k, scores.size(1)))
+        for row in range(scores.size(0)):
+            ref_vals, ref_idx = topk_tensor(scores[row], k)
+            assert np.array_equal(idx[row].numpy(), ref_idx.numpy())
+            assert np.array_equal(vals[row].numpy(), ref_vals.numpy())
+
+
+def test_topk_rows_agrees_with_numpy_tie_rule():
+    from DNN_TorchFM_TTower.models.topk import topk_indices, topk_rows
+    scores = _scores(seed=1)
+    _, idx = topk_rows(scores, 25)
+    for row in range(scores.size(0)):
+        assert np.array_equal(idx[row].numpy(), topk_indices(scores[row].numpy(), 25))
+
+
+def test_topk_rows_empty_k():
+    import torch
+    from DNN_TorchFM_TTower.models.topk import topk_rows
+    vals, idx = topk_rows(torch.zeros(3, 5), 0)
+    assert vals.shape == idx.shape == (3, 0)
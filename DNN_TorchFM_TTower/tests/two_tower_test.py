@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def _catalog(n_movies=3000, seed=0):
+    from DNN_TorchFM_TTower.models.catalog import CatalogSnapshot
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, n_movies + 1, dtype=np.int64)
+    cols = dict(movie_id=ids,
+                language=np.array(rng.choice(["en", "fr", "de"], n_movies, p=[0.9, 0.08, 0.02]), dtype=object),
+                vote_average=rng.uniform(0, 10, n_movies).astype(np.float32),
+                vote_count=rng.integers(0, 1000, n_movies).astype(np.int32),
+                popularity=rng.uniform(0, 100, n_movies).astype(np.float32),
+                genre_id=rng.integers(0, 20, n_movies).astype(np.int32),
+                release_year=rng.integers(1950, 2024, n_movies).astype(np.int32),
+                genre_pairs=(ids, rng.integers(1, 20, n_movies)))
+    return CatalogSnapshot.from_columns(cols, version=1)
+
+
+def _dot_model(num_movies, seed=0):
+    import torch
+    from DNN_TorchFM_TTower.models.pytorch_model import build_two_tower
+    torch.manual_seed(seed)
+    return build_two_tower(arch="dot", num_users=50, num_movies=num_movies, embedding_dim=16,
+                           hidden_dim=32, out_dim=16, score="dot").eval()
+
+
+def test_ivf_search_fills_top_n_under_language_filter(monkeypatch, tmp_path):
+    from DNN_TorchFM_TTower.models.recall import two_tower
+    monkeypatch.setattr(two_tower, "RECALL_SEARCH", "ivf")
+    monkeypatch.setattr(two_tower, "ANN_INDEX_DIR", tmp_path)
+    catalog = _catalog()
+    model = _dot_model(len(catalog))
+    candidates = catalog.ids_for_languages(["de"])
+    langs = frozenset({"de"})
+    for user_id in range(1, 20):
+        hit = two_tower._ann_search(model, user_id, candidates, catalog, 50, langs)
+        assert hit is not None
+        ids, _ = hit
+        assert len(ids) == min(50, len(candidates))
+        assert set(ids.tolist()) <= set(candidates.tolist())
+    assert len(two_tower._MASK_CACHE[model][1]) == 1
+
+
+def test_persisted_index_is_used_only_when_it_matches(monkeypatch, tmp_path):
+    from DNN_TorchFM_TTower.models.recall import two_tower
+    from DNN_TorchFM_TTower.models.recall.ann_index import build_index, save_index
+    monkeypatch.setattr(two_tower, "RECALL_SEARCH", "ivf")
+    monkeypatch.setattr(two_tower, "ANN_INDEX_DIR", tmp_path)
+    catalog = _catalog()
+    model = _dot_model(len(catalog))
+    save_index(build_index("ivf", two_tower.item_matrix(model, catalog).numpy(), catalog.movie_ids),
+               tmp_path)
+
+    index = two_tower.ann_index(model, catalog)
+    assert isinstance(index.vectors, np.memmap)
+    assert two_tower._persisted_index(_dot_model(len(catalog), seed=1), catalog) is None
+    assert two_tower._persisted_index(model, _catalog(len(catalog) + 1)) is None
+
+
+def test_movies_outside_the_model_vocab_are_never_scored(monkeypatch, tmp_path):
+    from DNN_TorchFM_TTower.models.recall import two_tower
+    monkeypatch.setattr(two_tower, "ANN_INDEX_DIR", tmp_path)
+    catalog = _catalog()
+    model = _dot_model(len(catalog) - 500)          # 最后 500 部电影在模型训练之后才入库
+    oov = catalog.movie_ids >= model.movie_embedding.num_embeddings
+    assert oov.sum() == 500
+
+    logits = two_tower._score_candidates(model, 3, catalog.movie_ids, catalog)
+    assert np.isneginf(logits[oov]).all() and np.isfinite(logits[~oov]).all()
+
+    monkeypatch.setattr(two_tower, "RECALL_SEARCH", "ivf")
+    ids, _ = two_tower._ann_search(model, 3, catalog.movie_ids, catalog, 600, frozenset())
+    assert len(ids) == 600
+    assert (ids < model.movie_embedding.num_embeddings).all()
@@ -1,5 +1,6 @@
 # FlaskAPI\app\__init__.py
 import os
+import multiprocessing
 from flask import Flask
 from flask_cors import CORS
 from app.connectDB import db_connect
@@ -20,6 +21,26 @@ def create_app():
     # register blueprints
     register_routes(app)
 
+    # recommendation result cache, invalidated by the routes that write user activity
+    from DNN_TorchFM_TTower.service.result_cache import ResultCache, build_backend, set_result_cache
+    cache = ResultCache(build_backend(app.config['RESULT_CACHE_BACKEND'],
+                                      max_entries=app.config['RESULT_CACHE_SIZE']),
+                        ttl=app.config['RESULT_CACHE_TTL'])
+    set_result_cache(cache)
+    app.extensions['result_cache'] = cache
+
+    # background retraining; never started inside the training worker process,
+    # which re-imports the entry module when it is spawned. Under gunicorn/uwsgi every
+    # server worker gets its own Retrainer; the training job takes an exclusive file lock
+    # in SAVE_DIR, so only one run writes checkpoints at a time and the others are retried
+    if app.config['RETRAIN_EVERY_N'] > 0 and multiprocessing.parent_process() is None:
+        from DNN_TorchFM_TTower.service.retrainer import Retrainer
+        app.extensions['retrainer'] = Retrainer(
+            every_n=app.config['RETRAIN_EVERY_N'],
+            cpu_budget=app.config['RETRAIN_CPU_BUDGET'],
+            min_interval=app.config['RETRAIN_MIN_INTERVAL'],
+        ).start()
+
 
     return app
 
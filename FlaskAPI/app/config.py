@@ -9,4 +9,24 @@ DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 SECRET_KEY = os.getenv('SECRET_KEY')
+DB_PORT = int(os.getenv('DB_PORT', 5432))
 
+# Connection pool shared by the routes (g.db) and the recommendation engine
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_HEALTH_CHECK = float(os.getenv('DB_POOL_HEALTH_CHECK', 30))
+
+# Background incremental retraining fed by view-history events (0 disables it)
+RETRAIN_EVERY_N = int(os.getenv('RETRAIN_EVERY_N', 0))
+RETRAIN_CPU_BUDGET = float(os.getenv('RETRAIN_CPU_BUDGET', 0.5))
+RETRAIN_MIN_INTERVAL = float(os.getenv('RETRAIN_MIN_INTERVAL', 60))
+
+# Per-user recommendation result cache: "memory" (per process) or "sqlite" (shared by all workers on the host)
+RESULT_CACHE_BACKEND = os.getenv('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 10000))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 300))
+
+# Users allowed to call /api/admin/* (comma-separated user ids); empty means nobody
+ADMIN_USER_IDS = {int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()}
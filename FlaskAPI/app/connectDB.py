@@ -1,24 +1,75 @@
+import sys, pathlib
+import threading
+import time
+
 import psycopg2
-from flask import g, current_app
+from flask import g, current_app, request
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from DNN_TorchFM_TTower.models.db import set_pool
+from DNN_TorchFM_TTower.models.db_pool import ConnectionPool
+
+
+class RouteWaitStats:
+    """Per-endpoint pool wait time (how long a request waited for g.db)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, wait_s):
+        with self._lock:
+            r = self._routes.setdefault(endpoint, {"requests": 0, "wait_total_s": 0.0, "wait_max_s": 0.0})
+            r["requests"] += 1
+            r["wait_total_s"] += wait_s
+            r["wait_max_s"] = max(r["wait_max_s"], wait_s)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: dict(r, wait_avg_s=r["wait_total_s"] / r["requests"])
+                for endpoint, r in self._routes.items()
+            }
+
 
 def db_connect(app):
+    # One pool per process: lends g.db to each request and is installed as the
+    # pool of DNN_TorchFM_TTower.models.db, so the recommendation engine reuses
+    # the connection already attached to the request thread.
+    pool = ConnectionPool(
+        min_size=app.config['DB_POOL_MIN'],
+        max_size=app.config['DB_POOL_MAX'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        max_lifetime=app.config['DB_POOL_MAX_LIFETIME'],
+        health_check_interval=app.config['DB_POOL_HEALTH_CHECK'],
+        host=app.config['DB_HOST'],
+        database=app.config['DB_NAME'],
+        user=app.config['DB_USER'],
+        password=app.config['DB_PASSWORD'],
+        port=app.config['DB_PORT'],
+    )
+    set_pool(pool)
+    wait_stats = RouteWaitStats()
+    app.extensions['db_pool'] = pool
+    app.extensions['db_pool_wait'] = wait_stats
+
     @app.before_request
     def connect_db():
         if 'db' not in g:
+            tic = time.perf_counter()
             try:
-                g.db = psycopg2.connect(
-                    host=app.config['DB_HOST'],
-                    database=app.config['DB_NAME'],
-                    user=app.config['DB_USER'],
-                    password=app.config['DB_PASSWORD']
-                )
-                current_app.logger.info("Database connection successful.")
-            except psycopg2.OperationalError as e:
+                g.db = pool.getconn()
+            except psycopg2.Error as e:
                 current_app.logger.error(f"Database connection failed: {e}")
                 raise
+            pool.attach(g.db)
+            wait_stats.record(request.endpoint or request.path, time.perf_counter() - tic)
 
     @app.teardown_request
     def close_db(exception):
         db = g.pop('db', None)
         if db:
-            db.close()
\ No newline at end of file
+            pool.detach()
+            pool.putconn(db)
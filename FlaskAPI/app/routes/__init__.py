@@ -3,6 +3,7 @@ from app.routes.auth import auth_bp
 from app.routes.users import users_bp
 from app.routes.movies import movies_bp
 from app.routes.recommend import bp as rec_bp
+from app.routes.admin import admin_bp
 
 
 
@@ -11,3 +12,4 @@ def register_routes(app):
     app.register_blueprint(users_bp, url_prefix='/api/users')
     app.register_blueprint(movies_bp, url_prefix='/api/movies')
     app.register_blueprint(rec_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
@@ -0,0 +1,45 @@
+# FlaskAPI/app/routes/admin.py
+from flask import Blueprint, current_app, g, jsonify
+
+from DNN_TorchFM_TTower.models.registry import all_status
+from app.utils.helpers import token_required
+
+admin_bp = Blueprint('admin', __name__)
+
+
+@admin_bp.before_request
+@token_required
+def require_admin():
+    """Every admin route needs a valid token whose user id is listed in ADMIN_USER_IDS."""
+    if g.user.get('user_id') not in current_app.config['ADMIN_USER_IDS']:
+        return jsonify({'message': 'Admin access required!'}), 403
+    return None
+
+
+@admin_bp.get('/pool')
+def pool_status():
+    return jsonify({
+        "pool": current_app.extensions['db_pool'].stats(),
+        "routes": current_app.extensions['db_pool_wait'].snapshot(),
+    }), 200
+
+
+@admin_bp.get('/models')
+def model_status():
+    """Loaded version, checkpoint hash and reload history of every hot-swappable model."""
+    return jsonify(all_status()), 200
+
+
+@admin_bp.get('/retrainer')
+def retrainer_status():
+    """Event counters, coalesced triggers and the last run of the background retrainer."""
+    retrainer = current_app.extensions.get('retrainer')
+    if retrainer is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **retrainer.status()}), 200
+
+
+@admin_bp.get('/cache')
+def cache_status():
+    """Hit / miss / eviction / invalidation counters of the recommendation result cache."""
+    return jsonify(current_app.extensions['result_cache'].stats()), 200
@@ -1,13 +1,13 @@
 # FlaskAPI\app\routes\movies.py
 from app.utils.helpers import token_required
-from flask import Blueprint, g, jsonify, request
+from flask import Blueprint, current_app, g, jsonify, request
 
 import sys, pathlib
 ROOT = pathlib.Path(__file__).resolve().parents[3]
 sys.path.append(str(ROOT))
 
 
-from DNN_TorchFM_TTower.service.recommender import recommend_movies_for_user
+from DNN_TorchFM_TTower.service.recommender import invalidate_user, serve_recommendations
 from DNN_TorchFM_TTower.models.db import get_movie_titles
 
 movies_bp = Blueprint('movies', __name__)
@@ -16,8 +16,8 @@ movies_bp = Blueprint('movies', __name__)
 def recommend(user_id: int):
     top = int(request.args.get("top", 10))
 
-    # Step 1: Get recommended movie IDs and scores
-    mids, scores, strategy = recommend_movies_for_user(user_id, n_final=top)
+    # Step 1: Get recommended movie IDs and scores (precomputed table, live pipeline if stale)
+    mids, scores, strategy, source = serve_recommendations(user_id, n_final=top)
     mids_py = [int(x) for x in mids]
 
     # Step 2: Query database for additional movie details
@@ -36,6 +36,7 @@ def recommend(user_id: int):
     return jsonify({
         "user_id": user_id,
         "strategy": strategy,  # cold | warm+rank
+        "source": source,      # precomputed | live
         "items": [
             {
                 "rank": i + 1,
@@ -199,6 +200,12 @@ def add_to_view_history(user_id : int):
                 VALUES (%s, %s, NOW())
             """, (user_id, movie_id))
             g.db.commit()
+            invalidate_user(user_id)
+
+            # Non-blocking: the retrainer only counts the event, training runs in its own process
+            retrainer = current_app.extensions.get('retrainer')
+            if retrainer is not None:
+                retrainer.submit(user_id, movie_id)
 
     return jsonify({"message": "Movie added to view history"}), 201
 
@@ -285,6 +292,7 @@ def add_movie_to_list(movie_id : int):
             ON CONFLICT DO NOTHING
         """, (list_id, movie_id))
         g.db.commit()
+    invalidate_user(user_id)
 
     return jsonify({'message': f'Movie added to list "{list_name}" successfully'}), 200
 
@@ -308,6 +316,7 @@ def rate_movie(movie_id : int):
             DO UPDATE SET rating = EXCLUDED.rating
         """, (user_id, movie_id, rating))
         g.db.commit()
+    invalidate_user(user_id)
 
     return jsonify({'message': 'Movie rated successfully'}), 200
 
@@ -360,6 +369,7 @@ def add_movie_to_favorites(movie_id: int):
             ON CONFLICT DO NOTHING
         """, (favorites_list_id, movie_id))
         g.db.commit()
+    invalidate_user(user_id)
 
     return jsonify({"message": "Movie added to favorites successfully"}), 200
 
@@ -378,6 +388,7 @@ def remove_movie_from_favorites(movie_id : int):
             )
         """, (movie_id, user_id))
         g.db.commit()
+    invalidate_user(user_id)
 
     return jsonify({"message": "Movie removed from favorites successfully"}), 200
 
@@ -400,8 +411,11 @@ def delete_list(list_id: int):
         # Delete the list's movies
         cursor.execute("DELETE FROM list_movies WHERE list_id = %s", (list_id,))
         # Delete the list itself
-        cursor.execute("DELETE FROM lists WHERE id = %s", (list_id,))
+        cursor.execute("DELETE FROM lists WHERE id = %s RETURNING user_id", (list_id,))
+        owner = cursor.fetchone()
         g.db.commit()
+        if owner:
+            invalidate_user(owner[0])
         return jsonify({"message": "List deleted successfully"}), 200
 
 @movies_bp.route('/<int:list_id>/movies/<int:movie_id>', methods=['DELETE'])
@@ -419,7 +433,11 @@ def delete_movie_from_list(list_id: int, movie_id: int):
         cursor.execute("""
             DELETE FROM list_movies WHERE list_id = %s AND movie_id = %s
         """, (list_id, movie_id))
+        cursor.execute("SELECT user_id FROM lists WHERE id = %s", (list_id,))
+        owner = cursor.fetchone()
         g.db.commit()
+        if owner:
+            invalidate_user(owner[0])
         return jsonify({"message": "Movie deleted successfully from the list"}), 200
     
 
@@ -9,22 +9,40 @@ ROOT = pathlib.Path(__file__).resolve().parents[3]
 sys.path.append(str(ROOT))
 
 
-from DNN_TorchFM_TTower.service.recommender import recommend_movies_for_user
+from DNN_TorchFM_TTower.service.recommender import recommend_movies_for_users, serve_recommendations
 from DNN_TorchFM_TTower.models.db import get_movie_titles
 
 bp = Blueprint("recommend", __name__)
 
+MAX_BATCH_USERS = 1000
+MAX_TOP = 100
+
+
+def _parse_top(value):
+    """Returns (top, None) or (None, error response) for a 'top' parameter."""
+    try:
+        top = int(value)
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "top must be an integer"}), 400)
+    if not 1 <= top <= MAX_TOP:
+        return None, (jsonify({"error": f"top must be between 1 and {MAX_TOP}"}), 400)
+    return top, None
+
+
 @bp.get("/recommend/<int:user_id>")
 def recommend(user_id: int):
-    top = int(request.args.get("top", 10))
+    top, error = _parse_top(request.args.get("top", 10))
+    if error:
+        return error
 
-    mids, scores, strategy = recommend_movies_for_user(user_id, n_final=top)
+    mids, scores, strategy, source = serve_recommendations(user_id, n_final=top)
     mids_py = [int(x) for x in mids]
     titles  = get_movie_titles(mids_py)
 
     return jsonify({
         "user_id": user_id,
         "strategy": strategy,          # cold | warm+rank
+        "source": source,              # precomputed | live
         "items": [
             {
                 "rank": i + 1,
@@ -35,3 +53,46 @@ def recommend(user_id: int):
             for i, mid in enumerate(mids_py)
         ]
     })
+
+
+@bp.post("/recommend/batch")
+def recommend_batch():
+    """
+    body: {"user_ids": [1, 2, ...], "top": 10}
+    One engine call for all users; titles for every returned movie in one query.
+    """
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get("user_ids")
+    top, error = _parse_top(data.get("top", 10))
+    if error:
+        return error
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({"error": "user_ids must be a non-empty list"}), 400
+    if len(user_ids) > MAX_BATCH_USERS:
+        return jsonify({"error": f"at most {MAX_BATCH_USERS} user_ids per request"}), 400
+    try:
+        user_ids = [int(u) for u in user_ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "user_ids must be integers"}), 400
+
+    results = recommend_movies_for_users(user_ids, n_final=top)
+    titles = get_movie_titles(sorted({int(m) for mids, _, _ in results.values() for m in mids}))
+
+    return jsonify({
+        "results": [
+            {
+                "user_id": uid,
+                "strategy": strategy,
+                "items": [
+                    {
+                        "rank": i + 1,
+                        "movie_id": int(mid),
+                        "title": titles.get(int(mid), "Unknown"),
+                        "score": float(scores[i]) if scores[i] is not None else None
+                    }
+                    for i, mid in enumerate(mids)
+                ]
+            }
+            for uid, (mids, scores, strategy) in results.items()
+        ]
+    })
@@ -2,6 +2,8 @@
 from flask import Blueprint, g, jsonify, request
 from app.utils.helpers import token_required
 
+from DNN_TorchFM_TTower.service.recommender import invalidate_user
+
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/<int:user_id>', methods=['GET'])
@@ -116,7 +118,7 @@ def update_preferred_genres(user_id):
                 )
 
         g.db.commit()
-
+        invalidate_user(user_id)
 
         return jsonify({"message": "Preferred genres updated successfully"}), 200
 
@@ -180,6 +182,7 @@ def add_to_existing_list(user_id: int, list_id: int):
             # Add the movie to the list
             cursor.execute("INSERT INTO list_movies (list_id, movie_id) VALUES (%s, %s)", (list_id, movie_id))
             g.db.commit()
+        invalidate_user(user_id)
 
         return jsonify({"message": "Movie added to the list successfully"}), 200
 
@@ -12,4 +12,19 @@ def test_check_password_different_hash_same_password():
     hashed_pwd2 = hash_password(password) # bcrypt génère des hachages différents à chaque fois
     assert verify_password(password, hashed_pwd1)
     assert verify_password(password, hashed_pwd2)
-    assert hashed_pwd1 != hashed_pwd2
\ No newline at end of file
+    assert hashed_pwd1 != hashed_pwd2
+def test_recommend_batch_rejects_bad_top(monkeypatch):
+    from flask import Flask
+    from app.routes import recommend
+    calls = []
+    monkeypatch.setattr(recommend, "recommend_movies_for_users",
+                        lambda user_ids, n_final: calls.append(n_final) or {})
+    monkeypatch.setattr(recommend, "get_movie_titles", lambda ids: {})
+    app = Flask(__name__)
+    app.register_blueprint(recommend.bp, url_prefix="/api")
+    client = app.test_client()
+    for top in ("ten", None, [3], 0, -5, recommend.MAX_TOP + 1, 10 ** 9):
+        resp = client.post("/api/recommend/batch", json={"user_ids": [1], "top": top})
+        assert resp.status_code == 400, top
+    assert client.post("/api/recommend/batch", json={"user_ids": [1], "top": 5}).status_code == 200
+    assert calls == [5]